@@ -18,9 +18,11 @@ def check_requirements():
 
     # 检查 Cookie 文件
     cookie_file = project_root / "config" / "douban.cookies"
-    if not cookie_file.exists():
+    cookie_dir = project_root / "config" / "cookies"
+    if not cookie_file.exists() and not any(cookie_dir.glob("*.cookies")):
         print("❌ 错误：Cookie 文件不存在")
         print("   请复制 config/douban.cookies.example 到 config/douban.cookies")
+        print("   或在 config/cookies/ 目录下为每个账号放置一个 *.cookies 文件")
         print("   并填入你的豆瓣 Cookie")
         return False
 
@@ -0,0 +1,280 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 10:12:40 UTC+08:00
+
+豆瓣爬虫离线解析基准测试
+
+对本地保存的电影详情页和短评页重复执行解析回调, 统计吞吐量、延迟分位数以及各提取方法耗时,
+全程不访问网络, 也不连接 Redis / PostgreSQL.
+
+语料目录结构::
+
+    corpus/
+        subject/{movie_id}.html
+        comments/{movie_id}-{sort}-{start}.html
+
+用法::
+
+    python script/benchmark.py --corpus tmp/corpus --repeat 5
+    python script/benchmark.py --corpus tmp/corpus --only subject --output tmp/bench.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import typing as t
+from collections import defaultdict
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class OfflineCacheManager:
+    """离线缓存替身, 吞掉所有缓存读写, 保证解析过程不访问 Redis"""
+
+    local = None
+
+    def __getattr__(self, name: str) -> t.Callable[..., None]:
+        return lambda *args, **kwargs: None
+
+    def session(self, *args, **kwargs) -> "OfflineCacheManager":
+        return self
+
+
+def configure_logger(level: str) -> None:
+    """只输出到控制台, 避免日志文件 IO 干扰计时"""
+    from fairylandlogger import LogManager, LoggerConfigStructure, LogLevelEnum
+
+    LogManager.configure(LoggerConfigStructure(level=LogLevelEnum(level), console=True, file=False))
+
+
+def install_offline_services(cache: bool = True, database: bool = True) -> None:
+    """
+    将缓存/数据库管理器替换为离线替身
+
+    管理器在首次访问时才连接 Redis 和 PostgreSQL, 基准测试只关心解析耗时, 因此在访问前绑定离线替身.
+
+    :param cache: 是否替换缓存管理器
+    :type cache: bool
+    :param database: 是否替换数据库管理器
+    :type database: bool
+    """
+    if cache:
+        from spider.spiders.douban.cache import RedisManager
+
+        RedisManager.bind(OfflineCacheManager())
+
+    if database:
+        from spider.spiders.douban.database import PostgreSQLManager
+
+        PostgreSQLManager.bind(OfflineCacheManager())
+
+
+class ParseBenchmark:
+    """
+    解析基准测试
+
+    :param corpus: 语料目录
+    :type corpus: Path
+    :param repeat: 每个页面重复解析次数
+    :type repeat: int
+    """
+
+    def __init__(self, corpus: Path, repeat: int = 1):
+        self.corpus = corpus
+        self.repeat = max(1, repeat)
+
+        # 提取方法名 -> 每次调用耗时(秒)
+        self.extractor_timings: t.Dict[str, t.List[float]] = defaultdict(list)
+
+    @staticmethod
+    def load_pages(directory: Path) -> t.List[t.Tuple[Path, bytes]]:
+        if not directory.is_dir():
+            return []
+        return [(path, path.read_bytes()) for path in sorted(directory.glob("*.html"))]
+
+    @staticmethod
+    def build_response(url: str, body: bytes):
+        from scrapy.http import HtmlResponse, Request
+
+        return HtmlResponse(url=url, body=body, encoding="UTF-8", request=Request(url=url))
+
+    @staticmethod
+    def create_spider(clazz):
+        """创建爬虫实例, 跳过会加载 Cookie 和数据库的 __init__"""
+        import scrapy
+        from scrapy.settings import Settings
+
+        spider = clazz.__new__(clazz)
+        scrapy.Spider.__init__(spider)
+        spider.settings = Settings()
+        spider.headers, spider.cookies = {}, {}
+        spider.page, spider.size, spider.start_index, spider.max_comments = 1, 20, 0, 600
+        spider.max_pages, spider.count_per_page = 26, 20
+
+        return spider
+
+    def instrument(self, target, prefix: str) -> None:
+        """将实例 (或类) 上所有以 prefix 开头的提取方法替换为计时包装"""
+        clazz = target if isinstance(target, type) else type(target)
+        for attr in dir(clazz):
+            if not attr.startswith(prefix):
+                continue
+
+            method = getattr(target, attr)
+            label = attr.split("__", 1)[-1] if "__" in attr else f"{clazz.__name__}.{attr}"
+
+            def wrapper(*args, _method=method, _label=label, **kwargs):
+                begin = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    self.extractor_timings[_label].append(time.perf_counter() - begin)
+
+            setattr(target, attr, wrapper)
+
+    def run_subject(self) -> t.Optional[t.Dict[str, t.Any]]:
+        from spider.spiders.douban.extractor import MovieInfoExtractor
+        from spider.spiders.douban.src.info import DoubanMovieSpider
+
+        pages = self.load_pages(self.corpus / "subject")
+        if not pages:
+            return None
+
+        spider = self.create_spider(DoubanMovieSpider)
+        self.instrument(spider, "_DoubanMovieSpider__extract_")
+        self.instrument(MovieInfoExtractor, "extract")
+        callback = getattr(spider, "_DoubanMovieSpider__parse_movie_info")
+
+        latencies, items = [], 0
+        for _ in range(self.repeat):
+            for path, body in pages:
+                movie_id = path.stem
+                response = self.build_response(f"https://movie.douban.com/subject/{movie_id}/", body)
+                begin = time.perf_counter()
+                results = list(callback(response, movie_id=movie_id))
+                latencies.append(time.perf_counter() - begin)
+                items += len(results)
+
+        return self.summary("subject", latencies, items)
+
+    def run_comments(self) -> t.Optional[t.Dict[str, t.Any]]:
+        from spider.spiders.douban.src.comment import DoubanMovieShortCommentSpider
+
+        pages = self.load_pages(self.corpus / "comments")
+        if not pages:
+            return None
+
+        spider = self.create_spider(DoubanMovieShortCommentSpider)
+
+        latencies, items = [], 0
+        for _ in range(self.repeat):
+            for path, body in pages:
+                movie_id, sort, start = self.parse_comment_name(path)
+                url = f"https://movie.douban.com/subject/{movie_id}/comments?start={start}&limit=20&status=P&sort={sort}"
+                response = self.build_response(url, body)
+                begin = time.perf_counter()
+                results = list(spider.parse(response, movie_id=movie_id, start=start, limit=20, sort=sort))
+                latencies.append(time.perf_counter() - begin)
+                items += len(results)
+
+        return self.summary("comments", latencies, items)
+
+    @staticmethod
+    def parse_comment_name(path: Path) -> t.Tuple[str, str, int]:
+        parts = path.stem.split("-")
+        movie_id = parts[0]
+        sort = parts[1] if len(parts) > 1 else "new_score"
+        start = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+        return movie_id, sort, start
+
+    @staticmethod
+    def percentile(values: t.List[float], percent: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+        return ordered[index]
+
+    def summary(self, name: str, latencies: t.List[float], items: int) -> t.Dict[str, t.Any]:
+        total = sum(latencies)
+        return {
+            "name": name,
+            "pages": len(latencies),
+            "items": items,
+            "total_seconds": total,
+            "pages_per_second": len(latencies) / total if total else 0.0,
+            "p50_ms": self.percentile(latencies, 50) * 1000,
+            "p99_ms": self.percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+        }
+
+    def extractor_summary(self) -> t.List[t.Dict[str, t.Any]]:
+        rows = []
+        for label, timings in self.extractor_timings.items():
+            rows.append(
+                {
+                    "extractor": label,
+                    "calls": len(timings),
+                    "total_ms": sum(timings) * 1000,
+                    "mean_us": statistics.fmean(timings) * 1_000_000,
+                    "p99_us": self.percentile(timings, 99) * 1_000_000,
+                }
+            )
+        return sorted(rows, key=lambda row: row.get("total_ms"), reverse=True)
+
+
+def report(results: t.List[t.Dict[str, t.Any]], extractors: t.List[t.Dict[str, t.Any]]) -> None:
+    print(f"{'callback':<12}{'pages':>8}{'items':>8}{'pages/s':>12}{'p50(ms)':>10}{'p99(ms)':>10}{'mean(ms)':>10}")
+    for row in results:
+        print(
+            f"{row['name']:<12}{row['pages']:>8}{row['items']:>8}{row['pages_per_second']:>12.1f}"
+            f"{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['mean_ms']:>10.3f}"
+        )
+
+    if extractors:
+        print()
+        print(f"{'extractor':<32}{'calls':>8}{'total(ms)':>12}{'mean(us)':>12}{'p99(us)':>12}")
+        for row in extractors:
+            print(f"{row['extractor']:<32}{row['calls']:>8}{row['total_ms']:>12.2f}{row['mean_us']:>12.1f}{row['p99_us']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="豆瓣爬虫离线解析基准测试")
+    parser.add_argument("--corpus", type=Path, required=True, help="语料目录, 包含 subject/ 和 comments/ 子目录")
+    parser.add_argument("--repeat", type=int, default=1, help="每个页面重复解析次数")
+    parser.add_argument("--only", choices=("subject", "comments"), default=None, help="只运行指定的解析回调")
+    parser.add_argument("--output", type=Path, default=None, help="以 JSON 格式保存结果, 便于前后对比")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别, 设为 INFO/DEBUG 时计时包含日志开销")
+    args = parser.parse_args()
+
+    configure_logger(args.log_level.upper())
+    install_offline_services()
+
+    benchmark = ParseBenchmark(corpus=args.corpus, repeat=args.repeat)
+    results = []
+    if args.only in (None, "subject"):
+        results.append(benchmark.run_subject())
+    if args.only in (None, "comments"):
+        results.append(benchmark.run_comments())
+    results = [row for row in results if row]
+
+    if not results:
+        print(f"语料目录中没有可用页面: {args.corpus}")
+        sys.exit(1)
+
+    extractors = benchmark.extractor_summary()
+    report(results, extractors)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"callbacks": results, "extractors": extractors}, ensure_ascii=False, indent=2), encoding="UTF-8")
+
+
+if __name__ == "__main__":
+    main()
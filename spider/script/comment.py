@@ -18,10 +18,11 @@ from bs4 import BeautifulSoup
 from fairylandlogger import Logger, LogManager
 from fake_useragent import FakeUserAgent
 
-from fairylandfuture.database.postgresql import PostgreSQLOperator
 from spider.spiders.douban.cache import RedisManager
-from spider.spiders.douban.dao import MovieCommentDAO
 from spider.spiders.douban.database import PostgreSQLManager
+from spider.spiders.douban.identity import DoubanIdentityPool
+from spider.spiders.douban.middlewares import AdaptiveRateLimiter
+from spider.spiders.douban.sink import MovieCommentSink
 
 
 class DoubanMovieCommentFetcher:
@@ -29,11 +30,15 @@ class DoubanMovieCommentFetcher:
 
     def __init__(self):
         self.cookies = self._load_cookies("config/douban.cookies")
+        # 多身份 Cookie 目录, 存在时按身份轮换请求
+        self.identities = DoubanIdentityPool.load_from_dir(
+            "config/cookies",
+            limiter_factory=lambda: AdaptiveRateLimiter(rate=1 / 30, min_rate=1 / 300, max_rate=1.0),
+        )
         # self.session = requests.Session()
 
-        # 数据库配置
-        db_operator = PostgreSQLOperator(PostgreSQLManager.connector)
-        self.comment_dao = MovieCommentDAO(db_operator)
+        # 短评以 COPY 批量写入, 连接池借出连接时检查存活, 不再逐条探测
+        self.comment_batch_size = 500
 
         self.cache = RedisManager
 
@@ -81,7 +86,25 @@ class DoubanMovieCommentFetcher:
             "upgrade-insecure-requests": "1",
             "user-agent": FakeUserAgent(os="Windows").random,
         }
-        return requests.get(url=url, headers=headers, cookies=self.cookies, timeout=30, verify=False)
+        if not self.identities:
+            return requests.get(url=url, headers=headers, cookies=self.cookies, timeout=30, verify=False)
+
+        identity, wait = self.identities.acquire()
+        if wait > 0:
+            self.logger.info(f"身份 {identity.name} 限速等待 {wait:.0f} 秒")
+            time.sleep(wait)
+
+        headers.update({"user-agent": identity.user_agent})
+        try:
+            response = requests.get(url=url, headers=headers, cookies=identity.cookies, timeout=30, verify=False)
+        finally:
+            self.identities.release(identity)
+
+        if response.status_code == 403:
+            self.identities.quarantine(identity)
+        elif response.status_code == 200:
+            self.identities.recover(identity)
+        return response
 
     def fetch_comments(self, movie_id: str, sort: str = "new_score") -> List[Dict]:
         """获取单个电影的短评"""
@@ -161,20 +184,24 @@ class DoubanMovieCommentFetcher:
         self.logger.info(f"电影 {movie_id} 排序 {sort} 共获取 {len(all_comments)} 条评论")
         return all_comments
 
-    def save_comments(self, comments: List[Dict]) -> None:
-        """保存评论到数据库"""
+    def save_comments(self, comments: List[Dict]) -> bool:
+        """保存评论到数据库, 返回是否全部保存成功"""
         self.logger.info(f"开始保存 {len(comments)} 条评论到数据库")
 
         success_count = 0
-        for comment in comments:
-            try:
-                PostgreSQLManager.ping()
-                self.comment_dao.insert_comment(comment)
-                success_count += 1
-            except Exception as error:
-                self.logger.error(f"保存评论失败: {error}")
+        # 只按数量分批, 评论已全部获取, 不需要时间阈值
+        with MovieCommentSink(PostgreSQLManager, batch_size=self.comment_batch_size, flush_interval=float("inf")) as sink:
+            results = [sink.add(comment) for comment in comments]
+            results.append(sink.flush())
+
+        for result in filter(None, results):
+            if result.success:
+                success_count += len(result.rows)
+            else:
+                self.logger.error(f"保存 {len(result.rows)} 条评论失败: {result.error}")
 
         self.logger.info(f"成功保存 {success_count}/{len(comments)} 条评论")
+        return success_count == len(comments)
 
     def run(self):
         """运行爬虫"""
@@ -200,16 +227,22 @@ class DoubanMovieCommentFetcher:
                 continue
 
             # 获取两种排序方式的评论
+            saved = True
             for sort in ["new_score", "time"]:
                 comments = self.fetch_comments(movie_id, sort)
 
                 if comments:
-                    self.save_comments(comments)
+                    saved = self.save_comments(comments) and saved
 
                 # 排序之间的延迟
                 if sort == "new_score":
                     time.sleep(self.delay)
 
+            if not saved:
+                # 有评论未能入库, 不标记完成, 下次运行重新获取
+                self.logger.error(f"电影 {movie_id} 有评论保存失败，不标记完成")
+                continue
+
             self.logger.info(f"电影 {movie_id} 的所有评论获取完成")
             self.cache.save_druable_comment_completed(movie_id)
 
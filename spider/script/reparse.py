@@ -0,0 +1,250 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 20:31:05 UTC+08:00
+
+离线重新解析原始响应归档
+
+读取 ResponseArchiveMiddleware 写入的归档, 在多进程池中重新执行爬虫的解析回调, 解析出的数据项按归档顺序交给
+ITEM_PIPELINES 入库. 修复提取逻辑后用它代替重新抓取.
+
+重新解析只写数据库, 不修改 Redis 中的抓取状态 (任务状态、断点、电影ID集合), 回调中产生的新请求会被丢弃.
+
+用法::
+
+    python script/reparse.py --archive tmp/archive
+    python script/reparse.py --archive tmp/archive --spider douban-movie-info --processes 8
+    python script/reparse.py --archive tmp/archive --dry-run
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "script"))
+
+from benchmark import ParseBenchmark, configure_logger, install_offline_services
+
+# 工作进程内的状态
+_reader = None
+_spiders: t.Dict[str, t.Any] = {}
+
+
+def load_spider_class(name: str):
+    from scrapy.spiderloader import SpiderLoader
+    from scrapy.utils.project import get_project_settings
+
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "spider.settings")
+    return SpiderLoader.from_settings(get_project_settings()).load(name)
+
+
+def resolve_callback(spider, name: t.Optional[str]) -> t.Callable:
+    """
+    根据归档中的回调名找到爬虫方法, 双下划线开头的私有方法按类名改写后查找
+
+    :param spider: 爬虫实例
+    :type spider: scrapy.Spider
+    :param name: 回调名
+    :type name: str
+    :return: 回调方法
+    :rtype: callable
+    """
+    if not name:
+        return spider.parse
+    if name.startswith("__") and not name.endswith("__"):
+        for clazz in type(spider).__mro__:
+            mangled = f"_{clazz.__name__.lstrip('_')}{name}"
+            if hasattr(spider, mangled):
+                return getattr(spider, mangled)
+    return getattr(spider, name)
+
+
+def get_spider(name: str):
+    if name not in _spiders:
+        _spiders[name] = ParseBenchmark.create_spider(load_spider_class(name))
+    return _spiders.get(name)
+
+
+def init_worker(archive: str, log_level: str) -> None:
+    global _reader
+    from spider.archive import ResponseArchiveReader
+
+    configure_logger(log_level)
+    install_offline_services()
+    _reader = ResponseArchiveReader(archive)
+
+
+def parse_records(entries: t.List[t.Dict[str, t.Any]]) -> t.Tuple[t.List[t.Tuple[str, t.Any]], int, int]:
+    """
+    在工作进程中重新解析一批归档记录
+
+    :param entries: 索引行列表
+    :type entries: list
+    :return: ([(爬虫名, 数据项)], 丢弃的请求数, 失败的记录数)
+    :rtype: tuple
+    """
+    import scrapy
+    from scrapy.http import Headers
+    from scrapy.responsetypes import responsetypes
+
+    items, requests, errors = [], 0, 0
+    for entry in entries:
+        try:
+            record = _reader.read(entry)
+            spider = get_spider(record.spider)
+            request = scrapy.Request(url=record.url, meta=record.meta, cb_kwargs=record.cb_kwargs, dont_filter=True)
+            headers = Headers(record.headers)
+            clazz = responsetypes.from_args(headers=headers, url=record.url, body=record.body)
+            response = clazz(url=record.url, status=record.status, headers=headers, body=record.body, request=request)
+
+            for result in resolve_callback(spider, record.callback)(response, **record.cb_kwargs) or ():
+                if isinstance(result, scrapy.Request):
+                    requests += 1
+                else:
+                    items.append((record.spider, result))
+        except Exception as error:
+            errors += 1
+            print(f"重新解析失败: {entry.get('url')}, {error!r}", file=sys.stderr)
+
+    return items, requests, errors
+
+
+class ItemPipelineFeeder:
+    """按 ITEM_PIPELINES 的优先级依次调用数据项 Pipeline"""
+
+    def __init__(self):
+        from scrapy.utils.misc import load_object
+        from scrapy.utils.project import get_project_settings
+
+        os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "spider.settings")
+        pipelines = get_project_settings().getdict("ITEM_PIPELINES")
+        self.pipelines = [load_object(path)() for path, _ in sorted(pipelines.items(), key=lambda pair: pair[1])]
+        self.opened: t.Dict[str, t.Any] = {}
+
+    def process(self, spider_name: str, item: t.Any) -> bool:
+        """
+        依次交给各 Pipeline 处理
+
+        :return: 数据项是否入库, 被 Pipeline 丢弃时为 False
+        :rtype: bool
+        """
+        from scrapy.exceptions import DropItem
+
+        if spider_name not in self.opened:
+            spider = get_spider(spider_name)
+            for pipeline in self.pipelines:
+                if hasattr(pipeline, "open_spider"):
+                    pipeline.open_spider(spider)
+            self.opened[spider_name] = spider
+
+        spider = self.opened.get(spider_name)
+        try:
+            for pipeline in self.pipelines:
+                item = self.resolve(pipeline.process_item(item, spider))
+        except DropItem:
+            return False
+        return True
+
+    @staticmethod
+    def resolve(result: t.Any) -> t.Any:
+        """
+        取出 Pipeline 返回的 Deferred 的结果; reactor 未运行时 Pipeline 同步写入, 返回的 Deferred 已经完成
+
+        :param result: Pipeline 的返回值
+        :type result: Any
+        :return: 数据项
+        :rtype: Any
+        """
+        from twisted.internet.defer import Deferred
+        from twisted.python.failure import Failure
+
+        if not isinstance(result, Deferred):
+            return result
+
+        outcome: t.List[t.Any] = []
+        result.addBoth(outcome.append)
+        if not outcome:
+            raise RuntimeError("Pipeline 返回了未完成的 Deferred")
+        if isinstance(outcome[0], Failure):
+            outcome[0].raiseException()
+        return outcome[0]
+
+    def close(self) -> None:
+        for spider in self.opened.values():
+            for pipeline in self.pipelines:
+                if hasattr(pipeline, "close_spider"):
+                    self.resolve(pipeline.close_spider(spider))
+
+
+def select_entries(archive: Path, spider: t.Optional[str], callback: t.Optional[str], all_versions: bool) -> t.List[t.Dict[str, t.Any]]:
+    """读取索引并筛选记录, 默认同一 URL 只保留最新一次抓取"""
+    from spider.archive import ResponseArchiveReader
+
+    entries = [
+        entry
+        for entry in ResponseArchiveReader(archive).entries()
+        if (spider is None or entry.get("spider") == spider) and (callback is None or entry.get("callback") == callback)
+    ]
+    if all_versions:
+        return entries
+
+    latest: t.Dict[str, t.Dict[str, t.Any]] = {}
+    for entry in entries:
+        latest.pop(entry.get("url"), None)
+        latest[entry.get("url")] = entry
+    return list(latest.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线重新解析原始响应归档")
+    parser.add_argument("--archive", type=Path, required=True, help="归档目录")
+    parser.add_argument("--spider", default=None, help="只重新解析指定爬虫的记录")
+    parser.add_argument("--callback", default=None, help="只重新解析指定回调的记录, 例如 __parse_movie_info")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="解析进程数")
+    parser.add_argument("--chunk-size", type=int, default=32, help="每个任务包含的记录数")
+    parser.add_argument("--all-versions", action="store_true", help="同一 URL 的每次抓取都重新解析, 默认只解析最新一次")
+    parser.add_argument("--dry-run", action="store_true", help="只解析并统计数据项, 不写入数据库")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别")
+    args = parser.parse_args()
+
+    configure_logger(args.log_level.upper())
+    # 抓取状态保存在 Redis, 重新解析时不修改; 试运行时同样不连接数据库
+    install_offline_services(cache=True, database=args.dry_run)
+
+    entries = select_entries(args.archive, args.spider, args.callback, args.all_versions)
+    if not entries:
+        print(f"归档中没有可用记录: {args.archive}")
+        sys.exit(1)
+
+    feeder = None if args.dry_run else ItemPipelineFeeder()
+    chunks = [entries[index : index + args.chunk_size] for index in range(0, len(entries), args.chunk_size)]
+
+    items, requests, errors, dropped_items = 0, 0, 0, 0
+    begin = time.perf_counter()
+    with multiprocessing.Pool(processes=args.processes, initializer=init_worker, initargs=(str(args.archive), args.log_level.upper())) as pool:
+        for results, dropped, failed in pool.imap(parse_records, chunks):
+            requests += dropped
+            errors += failed
+            for spider_name, item in results:
+                items += 1
+                if feeder is not None and not feeder.process(spider_name, item):
+                    dropped_items += 1
+    if feeder is not None:
+        feeder.close()
+    elapsed = time.perf_counter() - begin
+
+    print(f"记录: {len(entries)}, 数据项: {items}, 入库失败: {dropped_items}, 丢弃请求: {requests}, 解析失败: {errors}")
+    print(f"耗时: {elapsed:.2f} 秒, {len(entries) / elapsed if elapsed else 0.0:.1f} 页/秒, 进程数: {args.processes}")
+
+
+if __name__ == "__main__":
+    main()
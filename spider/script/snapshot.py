@@ -0,0 +1,284 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-17 00:12:36 UTC+08:00
+
+抓取状态快照与恢复
+
+快照包含 Redis 中所有豆瓣抓取状态: 任务哈希、状态集合、重试队列、死信集合、已入库电影ID集合、推荐列表分页偏移、
+已完成排序、短评断点、持久化已完成集合以及条件请求校验信息.
+
+- save: SCAN 出相关键, 每 batch_size 个键一个非事务管道执行 DUMP 和 PTTL, 每批结果立即写入 gzip 压缩的二进制文件,
+  客户端只保留一批数据; 先写临时文件再原子替换, 中途崩溃不会留下不完整的快照.
+  每批只占用 Redis 执行一批 DUMP 的时间, 不会像整库 MULTI/EXEC 那样在快照期间阻塞其他客户端, 代价是各批不是同一时刻的:
+  保存前应暂停爬虫 (停止所有爬虫进程, 或等待队列空闲), 否则任务哈希与状态集合等键可能来自不同时刻.
+  需要不停机的一致快照时, 使用 Redis 自身的 BGSAVE 生成 RDB 文件.
+- restore: 以管道批量 RESTORE ... REPLACE, 保留原有过期时间. DUMP 格式与 Redis 版本相关, 只能恢复到相同或更新版本的 Redis.
+- rebuild: 没有快照时, 用 COPY 从 PostgreSQL 流式读取电影ID, 重新生成已入库电影ID集合.
+
+用法::
+
+    python script/snapshot.py save tmp/crawl-state.snap
+    python script/snapshot.py restore tmp/crawl-state.snap --clean
+    python script/snapshot.py rebuild
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import struct
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+if t.TYPE_CHECKING:
+    from spider.spiders.douban.cache import DoubanCacheManager
+
+MAGIC = b"DOUBANSNAP1\n"
+# 记录头: 键长度, 剩余过期毫秒数 (0 表示不过期), DUMP 数据长度
+RECORD_HEADER = struct.Struct(">IqI")
+
+
+class CrawlStateSnapshot:
+    """
+    抓取状态快照
+
+    :param manager: 缓存管理器
+    :type manager: DoubanCacheManager
+    :param batch_size: 每个管道包含的命令数量
+    :type batch_size: int
+    """
+
+    # 抓取状态键的模式 (不含前缀)
+    PATTERNS: t.ClassVar[t.Tuple[str, ...]] = ("douban:*", "http:validator:*")
+
+    def __init__(self, manager: "DoubanCacheManager", batch_size: int = 1000):
+        self.manager = manager
+        self.redis = manager.redis
+        self.batch_size = batch_size
+
+    def keys(self) -> t.List[bytes]:
+        keys: t.List[bytes] = []
+        for batch in self.scan():
+            keys.extend(batch)
+        return keys
+
+    def scan(self) -> t.Iterator[t.List[bytes]]:
+        """按 batch_size 分批 SCAN 出抓取状态键"""
+        batch: t.List[bytes] = []
+        for pattern in self.PATTERNS:
+            for key in self.redis.scan_iter(match=self.manager._get_key(pattern), count=self.batch_size):
+                batch.append(key)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def dump(self) -> t.Iterator[t.Tuple[bytes, bytes, int]]:
+        """
+        逐批 DUMP 抓取状态键, 每批一个非事务管道, 不阻塞 Redis
+
+        :return: (键, DUMP 数据, 剩余过期毫秒数) 生成器, 跳过 SCAN 之后已被删除的键
+        :rtype: Iterator
+        """
+        for keys in self.scan():
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.dump(key)
+                pipeline.pttl(key)
+            results = pipeline.execute()
+            for key, payload, ttl in zip(keys, results[::2], results[1::2]):
+                if payload is not None:
+                    yield key, payload, ttl
+
+    def save(self, path: Path) -> int:
+        """
+        保存快照
+
+        :param path: 快照文件
+        :type path: Path
+        :return: 保存的键数量
+        :rtype: int
+        """
+        # 键数量在写完之前未知, 不写入文件头
+        header = {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "prefix": self.manager.prefix,
+        }
+        count = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f"{path.name}.tmp")
+        with open(temp, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as stream:
+                stream.write(MAGIC)
+                stream.write(json.dumps(header).encode("UTF-8") + b"\n")
+                for key, payload, ttl in self.dump():
+                    stream.write(RECORD_HEADER.pack(len(key), max(ttl, 0), len(payload)))
+                    stream.write(key)
+                    stream.write(payload)
+                    count += 1
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp, path)
+
+        return count
+
+    @staticmethod
+    def read(path: Path) -> t.Tuple[t.Dict[str, t.Any], t.Iterator[t.Tuple[bytes, int, bytes]]]:
+        """
+        读取快照
+
+        :param path: 快照文件
+        :type path: Path
+        :return: (文件头, (键, 过期毫秒数, DUMP 数据) 生成器)
+        :rtype: tuple
+        """
+        stream = gzip.open(path, "rb")
+        if stream.read(len(MAGIC)) != MAGIC:
+            stream.close()
+            raise ValueError(f"不是抓取状态快照文件: {path}")
+        header = json.loads(stream.readline())
+
+        def records() -> t.Iterator[t.Tuple[bytes, int, bytes]]:
+            with stream:
+                while head := stream.read(RECORD_HEADER.size):
+                    key_length, ttl, payload_length = RECORD_HEADER.unpack(head)
+                    yield stream.read(key_length), ttl, stream.read(payload_length)
+
+        return header, records()
+
+    def clean(self) -> int:
+        """删除现有的抓取状态键"""
+        removed = 0
+        keys = self.keys()
+        for index in range(0, len(keys), self.batch_size):
+            removed += self.redis.unlink(*keys[index : index + self.batch_size])
+        return removed
+
+    def restore(self, path: Path, clean: bool = False) -> int:
+        """
+        以管道批量恢复快照
+
+        :param path: 快照文件
+        :type path: Path
+        :param clean: 恢复前是否删除现有的抓取状态键, 否则只覆盖快照中存在的键
+        :type clean: bool
+        :return: 恢复的键数量
+        :rtype: int
+        """
+        header, records = self.read(path)
+        if header.get("prefix") != self.manager.prefix:
+            raise ValueError(f"快照前缀 {header.get('prefix')} 与当前前缀 {self.manager.prefix} 不一致")
+        if clean:
+            print(f"删除现有抓取状态键 {self.clean()} 个")
+
+        restored = 0
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, ttl, payload in records:
+            pipeline.restore(key, ttl, payload, replace=True)
+            if len(pipeline) >= self.batch_size:
+                restored += len(pipeline.execute())
+        if len(pipeline):
+            restored += len(pipeline.execute())
+
+        return restored
+
+    def rebuild(self) -> int:
+        """
+        用 COPY 从 PostgreSQL 流式读取电影ID, 重新生成已入库电影ID集合
+
+        :return: 电影ID数量
+        :rtype: int
+        """
+        from spider.spiders.douban.database import PostgreSQLManager
+
+        loader = SetLoader(self.redis, self.manager._get_key("douban:movie:db:movie_ids"), self.batch_size)
+        with PostgreSQLManager.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.copy_expert("COPY (SELECT movie_id FROM movie.tb_movie WHERE deleted IS FALSE) TO STDOUT", loader)
+        return loader.close()
+
+
+class SetLoader:
+    """
+    COPY TO STDOUT 的写入目标, 按行切分后以管道批量 SADD
+
+    :param client: Redis 客户端
+    :type client: Redis
+    :param key: 集合键
+    :type key: str
+    :param batch_size: 每批的成员数量
+    :type batch_size: int
+    """
+
+    def __init__(self, client, key: str, batch_size: int = 1000):
+        self.client = client
+        self.key = key
+        self.batch_size = batch_size
+        self.pending = b""
+        self.members: t.List[bytes] = []
+        self.count = 0
+
+    def write(self, data: t.Union[bytes, str]) -> None:
+        data = data.encode("UTF-8") if isinstance(data, str) else data
+        lines = (self.pending + data).split(b"\n")
+        self.pending = lines.pop()
+        self.members.extend(line for line in lines if line)
+        if len(self.members) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.members:
+            self.client.sadd(self.key, *self.members)
+            self.count += len(self.members)
+            self.members = []
+
+    def close(self) -> int:
+        if self.pending:
+            self.members.append(self.pending)
+            self.pending = b""
+        self.flush()
+        return self.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="抓取状态快照与恢复")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    save = subparsers.add_parser("save", help="保存快照")
+    save.add_argument("path", type=Path, help="快照文件")
+    restore = subparsers.add_parser("restore", help="恢复快照")
+    restore.add_argument("path", type=Path, help="快照文件")
+    restore.add_argument("--clean", action="store_true", help="恢复前删除现有的抓取状态键")
+    subparsers.add_parser("rebuild", help="从 PostgreSQL 重新生成已入库电影ID集合")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每个管道包含的命令数量")
+    args = parser.parse_args()
+
+    from spider.spiders.douban.cache import RedisManager
+
+    snapshot = CrawlStateSnapshot(RedisManager, batch_size=args.batch_size)
+    begin = time.perf_counter()
+    if args.command == "save":
+        count = snapshot.save(args.path)
+        print(f"保存快照: {args.path}, 键 {count} 个, {args.path.stat().st_size:,} 字节")
+    elif args.command == "restore":
+        count = snapshot.restore(args.path, clean=args.clean)
+        print(f"恢复快照: {args.path}, 键 {count} 个")
+    else:
+        count = snapshot.rebuild()
+        print(f"重新生成已入库电影ID集合: {count} 个")
+    print(f"耗时: {time.perf_counter() - begin:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
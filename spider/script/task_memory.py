@@ -0,0 +1,53 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 23:02:47 UTC+08:00
+
+统计 Redis 中任务存储的内存占用
+
+逐个输出任务哈希、状态集合、重试队列和死信集合的元素数量与 MEMORY USAGE, 并给出每个任务的平均字节数.
+加上 --migrate 时先把任务哈希中的 JSON 编码改写为紧凑编码, 前后各统计一次以便对比.
+
+用法::
+
+    python script/task_memory.py
+    python script/task_memory.py --migrate
+"""
+
+import argparse
+import sys
+import typing as t
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def report(usage: t.Dict[str, t.Dict[str, int]], title: str) -> None:
+    print(f"== {title} ==")
+    for key, stats in usage.items():
+        print(f"{key:<60} {stats.get('length'):>10} {stats.get('bytes'):>14,} B")
+
+    tasks = sum(stats.get("length") for key, stats in usage.items() if key.endswith(":tasks"))
+    total = sum(stats.get("bytes") for stats in usage.values())
+    print(f"任务数: {tasks}, 总占用: {total:,} B, 平均每个任务: {total / tasks if tasks else 0.0:.1f} B")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计任务存储的内存占用")
+    parser.add_argument("--migrate", action="store_true", help="先将 JSON 编码的任务改写为紧凑编码")
+    args = parser.parse_args()
+
+    from spider.spiders.douban.cache import RedisManager
+
+    report(RedisManager.task_memory_usage(), "当前")
+    if args.migrate:
+        migrated = RedisManager.migrate_task_encoding()
+        report(RedisManager.task_memory_usage(), f"改写 {migrated} 个任务后")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 20:02:18 UTC+08:00
+
+原始响应归档
+
+每条响应压缩为一个独立的 gzip 成员追加到分段文件 ``{segment}.warc.gz``, 记录内容为 WARC 风格的头部 + HTTP 响应.
+每个分段旁有一个 ``{segment}.index.jsonl`` 索引, 一行对应一条记录, 保存 URL、抓取时间、回调以及记录在分段中的偏移和长度,
+读取时按偏移直接解压单条记录, 无需扫描整个分段.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from fairylandlogger import LogManager, Logger
+
+
+@dataclass
+class ArchiveRecordStructure:
+    """归档记录: 响应内容以及重新执行解析回调所需的请求信息"""
+
+    url: str
+    status: int
+    headers: t.Dict[str, t.List[str]]
+    body: bytes
+    spider: str
+    callback: t.Optional[str]
+    cb_kwargs: t.Dict[str, t.Any] = field(default_factory=dict)
+    meta: t.Dict[str, t.Any] = field(default_factory=dict)
+    fetched_at: str = field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+    def to_index(self) -> t.Dict[str, t.Any]:
+        return {
+            "url": self.url,
+            "status": self.status,
+            "spider": self.spider,
+            "callback": self.callback,
+            "cb_kwargs": self.cb_kwargs,
+            "meta": self.meta,
+            "fetched_at": self.fetched_at,
+        }
+
+
+class ResponseArchiveWriter:
+    """
+    追加写入的响应归档, 分段文件超过大小上限后切换到新分段
+
+    :param directory: 归档目录
+    :type directory: str | Path
+    :param segment_size: 分段大小上限 (字节)
+    :type segment_size: int
+    :param compresslevel: gzip 压缩级别
+    :type compresslevel: int
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("response-archive", "scrapy")
+
+    def __init__(self, directory: t.Union[str, Path], segment_size: int = 256 * 1024 * 1024, compresslevel: int = 6):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.compresslevel = compresslevel
+
+        self.segment: t.Optional[t.BinaryIO] = None
+        self.index: t.Optional[t.TextIO] = None
+        self.segment_name: t.Optional[str] = None
+        self.records = 0
+
+    def open_segment(self) -> None:
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_name = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.segment = open(self.directory / f"{self.segment_name}.warc.gz", "ab")
+        self.index = open(self.directory / f"{self.segment_name}.index.jsonl", "a", encoding="UTF-8")
+        self.Log.info(f"打开归档分段: {self.directory / self.segment_name}")
+
+    @staticmethod
+    def encode(record: "ArchiveRecordStructure") -> bytes:
+        status_line = f"HTTP/1.1 {record.status}\r\n"
+        header_lines = "".join(f"{name}: {value}\r\n" for name, values in record.headers.items() for value in values)
+        http = (status_line + header_lines + "\r\n").encode("UTF-8") + record.body
+
+        warc = (
+            "WARC/1.1\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Target-URI: {record.url}\r\n"
+            f"WARC-Date: {record.fetched_at}\r\n"
+            "Content-Type: application/http; msgtype=response\r\n"
+            f"Content-Length: {len(http)}\r\n"
+            "\r\n"
+        ).encode("UTF-8")
+
+        return warc + http + b"\r\n\r\n"
+
+    def write(self, record: "ArchiveRecordStructure") -> None:
+        """
+        写入一条记录, 先写分段再写索引, 中断时索引不会指向不完整的记录
+
+        :param record: 归档记录
+        :type record: ArchiveRecordStructure
+        """
+        if self.segment is None or self.segment.tell() >= self.segment_size:
+            self.open_segment()
+
+        data = gzip.compress(self.encode(record), compresslevel=self.compresslevel)
+        offset = self.segment.tell()
+        self.segment.write(data)
+        self.segment.flush()
+
+        entry = record.to_index()
+        entry.update(segment=f"{self.segment_name}.warc.gz", offset=offset, length=len(data))
+        self.index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.index.flush()
+        self.records += 1
+
+    def close(self) -> None:
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.Log.info(f"关闭归档分段 {self.segment_name}, 累计写入 {self.records} 条记录")
+        self.segment, self.index = None, None
+
+
+class ResponseArchiveReader:
+    """
+    读取响应归档
+
+    :param directory: 归档目录
+    :type directory: str | Path
+    """
+
+    def __init__(self, directory: t.Union[str, Path]):
+        self.directory = Path(directory)
+
+    def entries(self) -> t.Iterator[t.Dict[str, t.Any]]:
+        """按分段顺序遍历索引"""
+        for index_path in sorted(self.directory.glob("*.index.jsonl")):
+            with open(index_path, "r", encoding="UTF-8") as stream:
+                for line in stream:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def read(self, entry: t.Dict[str, t.Any]) -> "ArchiveRecordStructure":
+        """
+        按索引读取并解压一条记录
+
+        :param entry: 索引行
+        :type entry: dict
+        :return: 归档记录
+        :rtype: ArchiveRecordStructure
+        """
+        with open(self.directory / entry.get("segment"), "rb") as stream:
+            stream.seek(entry.get("offset"))
+            data = gzip.decompress(stream.read(entry.get("length")))
+
+        _, http = data.split(b"\r\n\r\n", 1)
+        head, body = http.split(b"\r\n\r\n", 1)
+        headers: t.Dict[str, t.List[str]] = {}
+        for line in head.decode("UTF-8").split("\r\n")[1:]:
+            name, value = line.split(": ", 1)
+            headers.setdefault(name, []).append(value)
+
+        return ArchiveRecordStructure(
+            url=entry.get("url"),
+            status=entry.get("status"),
+            headers=headers,
+            body=body[: -len(b"\r\n\r\n")],
+            spider=entry.get("spider"),
+            callback=entry.get("callback"),
+            cb_kwargs=entry.get("cb_kwargs", {}),
+            meta=entry.get("meta", {}),
+            fetched_at=entry.get("fetched_at"),
+        )
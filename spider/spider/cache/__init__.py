@@ -7,9 +7,18 @@
 @datetime: 2025-12-22 21:47:13 UTC+08:00
 """
 
+import os
 import typing as t
+import uuid
 
-from redis import Redis
+from redis import ConnectionPool, Redis, RedisCluster
+from redis.backoff import ExponentialBackoff
+from redis.client import PubSub, PubSubWorkerThread
+from redis.cluster import ClusterNode
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from redis.retry import Retry
+
+from spider.cache.local import LocalCache
 
 
 class RedisCacheManager:
@@ -20,22 +29,150 @@ class RedisCacheManager:
             cls._instance = super(RedisCacheManager, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, client: Redis, prefix: str = "spider:cache"):
+    def __init__(self, client: t.Union[Redis, RedisCluster], prefix: str = "spider:cache", hash_tags: bool = False):
         self.redis = client
         self.prefix = prefix
+        # 集群模式下需要位于同一个槽的键用 {...} 包裹哈希标签
+        self.hash_tags = hash_tags or isinstance(client, RedisCluster)
+
+        # 进程内缓存, 调用 enable_local_cache 后启用
+        self.local: t.Optional["LocalCache"] = None
+        self.invalidation_channel = f"{prefix}:invalidate"
+        self.node_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.pubsub: t.Optional["PubSub"] = None
+        self.pubsub_thread: t.Optional["PubSubWorkerThread"] = None
 
     def _get_key(self, key: str) -> str:
         return f"{self.prefix}:{key}"
 
+    def _tag(self, value: str) -> str:
+        """
+        哈希标签: 启用时返回 {value}, 含相同标签的键位于 Redis Cluster 的同一个槽, 可以在同一个事务或脚本中操作
+
+        :param value: 标签内容
+        :type value: str
+        :return: 键的一部分
+        :rtype: str
+        """
+        return f"{{{value}}}" if self.hash_tags else value
+
+    @property
+    def cluster(self) -> bool:
+        return isinstance(self.redis, RedisCluster)
+
+    @staticmethod
+    def create_client(config: t.Dict[str, t.Any]) -> t.Union[Redis, RedisCluster]:
+        """
+        按配置创建 Redis 客户端: 连接由连接池管理, 空闲连接定期健康检查, 连接断开或超时时按指数退避重连重试;
+        配置 cluster: true 时以 nodes (host:port 列表) 为启动节点连接 Redis Cluster
+
+        :param config: Redis 配置
+        :type config: dict
+        :return: Redis 客户端
+        :rtype: Redis | RedisCluster
+        """
+        retry = Retry(ExponentialBackoff(cap=10, base=0.1), int(config.get("retries", 3)))
+        options = {
+            "password": config.get("password"),
+            "max_connections": int(config.get("max_connections", 32)),
+            "health_check_interval": int(config.get("health_check_interval", 30)),
+            "socket_connect_timeout": float(config.get("socket_connect_timeout", 5)),
+            "socket_keepalive": True,
+        }
+
+        if config.get("cluster"):
+            nodes = config.get("nodes") or [f"{config.get('host')}:{config.get('port', 6379)}"]
+            startup_nodes = [ClusterNode(host, int(port)) for host, _, port in (str(node).rpartition(":") for node in nodes)]
+            return RedisCluster(startup_nodes=startup_nodes, retry=retry, **options)
+
+        pool = ConnectionPool(host=config.get("host"), port=int(config.get("port", 6379)), db=int(config.get("db", 0)), **options)
+        return Redis(connection_pool=pool, retry=retry, retry_on_error=[RedisConnectionError, RedisTimeoutError])
+
+    def enable_local_cache(self, max_size: int = 1024, ttl: float = 60.0, subscribe: bool = True) -> "LocalCache":
+        """
+        在 Redis 前启用进程内 LRU 缓存
+
+        本进程的写入直接更新进程内缓存, 并通过 Redis 发布/订阅通知其他进程删除对应的键; 订阅断开期间其他进程的写入
+        最迟在 ttl 秒后可见.
+
+        :param max_size: 最多缓存的键数量
+        :type max_size: int
+        :param ttl: 默认过期秒数
+        :type ttl: float
+        :param subscribe: 是否订阅其他进程的失效通知
+        :type subscribe: bool
+        :return: 进程内缓存
+        :rtype: LocalCache
+        """
+        if self.local is None:
+            self.local = LocalCache(max_size=max_size, ttl=ttl)
+        if subscribe and self.pubsub_thread is None:
+            self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(**{self.invalidation_channel: self.__on_invalidate})
+            self.pubsub_thread = self.pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        return self.local
+
+    def disable_local_cache(self) -> None:
+        if self.pubsub_thread is not None:
+            self.pubsub_thread.stop()
+            self.pubsub.close()
+        self.local, self.pubsub, self.pubsub_thread = None, None, None
+
+    def __on_invalidate(self, message: t.Dict[str, t.Any]) -> None:
+        node_id, _, key = message.get("data").decode("UTF-8").partition(" ")
+        if node_id != self.node_id and self.local is not None:
+            self.local.invalidate(key)
+
+    def invalidate(self, key: str) -> None:
+        """
+        删除本进程缓存的键, 并通知其他进程删除
+
+        :param key: 键 (不含前缀)
+        :type key: str
+        """
+        if self.local is None:
+            return
+        self.local.invalidate(key)
+        self.redis.publish(self.invalidation_channel, f"{self.node_id} {key}")
+
+    def get_or_load(self, key: str, loader: t.Callable[[], t.Any], ttl: t.Optional[float] = None) -> t.Any:
+        """
+        优先从进程内缓存读取, 未命中时调用 loader 从 Redis 读取并缓存, 未启用进程内缓存时直接调用 loader
+
+        :param key: 键 (不含前缀)
+        :type key: str
+        :param loader: 读取函数
+        :type loader: callable
+        :param ttl: 过期秒数, 为 None 时使用默认值
+        :type ttl: float
+        :return: 值
+        :rtype: Any
+        """
+        if self.local is None:
+            return loader()
+
+        value = self.local.get(key)
+        if value is LocalCache.MISSING:
+            value = loader()
+            self.local.set(key, value, ttl)
+        return value
+
     def get(self, key: str) -> t.Any:
-        redis_key = self._get_key(key)
-        redis_value: bytes = self.redis.get(name=redis_key)
-        return redis_value.decode("UTF-8") if redis_value else None
+        def load() -> t.Any:
+            redis_value: bytes = self.redis.get(name=self._get_key(key))
+            return redis_value.decode("UTF-8") if redis_value else None
+
+        return self.get_or_load(key, load)
 
     def set(self, key: str, value: t.Any, expire: int | None = None) -> None:
         redis_key = self._get_key(key)
         self.redis.set(name=redis_key, value=value, ex=expire)
+        if self.local is not None:
+            self.invalidate(key)
+            cached = value.decode("UTF-8") if isinstance(value, bytes) else str(value)
+            self.local.set(key, cached, min(expire, self.local.ttl) if expire else None)
 
     def delete(self, key: str) -> None:
         redis_key = self._get_key(key)
         self.redis.delete(redis_key)
+        self.invalidate(key)
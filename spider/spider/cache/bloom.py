@@ -0,0 +1,53 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 18:32:10 UTC+08:00
+"""
+
+import hashlib
+import math
+import typing as t
+
+
+class BloomFilter:
+    """
+    进程内布隆过滤器
+
+    不存在即一定不存在, 存在则可能误判, 误判率由 capacity 和 error_rate 决定.
+
+    :param capacity: 预计元素数量
+    :type capacity: int
+    :param error_rate: 期望误判率
+    :type error_rate: float
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __positions(self, value: str) -> t.Iterator[int]:
+        digest = hashlib.blake2b(value.encode("UTF-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self.__positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, values: t.Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(value))
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,110 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 21:14:36 UTC+08:00
+"""
+
+import abc
+import hashlib
+import json
+import time
+import typing as t
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
+
+if t.TYPE_CHECKING:
+    from spider.cache import RedisCacheManager
+
+
+@dataclass
+class HttpValidatorStructure:
+    """URL 的条件请求校验信息"""
+
+    etag: t.Optional[str] = None
+    last_modified: t.Optional[str] = None
+    body_hash: t.Optional[str] = None
+    fetched_at: float = field(default_factory=time.time)
+
+
+class HttpValidatorStorage(abc.ABC):
+    """条件请求校验信息存储"""
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "HttpValidatorStorage":
+        return cls()
+
+    @staticmethod
+    def fingerprint(url: str) -> str:
+        return hashlib.sha1(url.encode("UTF-8")).hexdigest()
+
+    @abc.abstractmethod
+    def get(self, url: str) -> t.Optional["HttpValidatorStructure"]: ...
+
+    @abc.abstractmethod
+    def save(self, url: str, validator: "HttpValidatorStructure") -> None: ...
+
+
+class DiskHttpValidatorStorage(HttpValidatorStorage):
+    """
+    本地磁盘存储, 每个 URL 一个 JSON 文件, 按指纹前两位分目录
+
+    :param directory: 存储目录
+    :type directory: str | Path
+    """
+
+    def __init__(self, directory: t.Union[str, Path] = "tmp/validators"):
+        self.directory = Path(directory)
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "DiskHttpValidatorStorage":
+        return cls(settings.get("CONDITIONAL_FETCH_DIR", "tmp/validators"))
+
+    def path(self, url: str) -> Path:
+        fingerprint = self.fingerprint(url)
+        return self.directory / fingerprint[:2] / f"{fingerprint}.json"
+
+    def get(self, url: str) -> t.Optional["HttpValidatorStructure"]:
+        path = self.path(url)
+        if not path.is_file():
+            return None
+        return HttpValidatorStructure(**json.loads(path.read_text(encoding="UTF-8")))
+
+    def save(self, url: str, validator: "HttpValidatorStructure") -> None:
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(asdict(validator)), encoding="UTF-8")
+
+
+class RedisHttpValidatorStorage(HttpValidatorStorage):
+    """
+    Redis 存储, 复用爬虫的缓存管理器连接
+
+    :param manager: 缓存管理器
+    :type manager: RedisCacheManager
+    :param expire: 过期秒数, 为 None 时不过期
+    :type expire: int
+    """
+
+    def __init__(self, manager: "RedisCacheManager", expire: t.Optional[int] = None):
+        self.manager = manager
+        self.expire = expire
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "RedisHttpValidatorStorage":
+        return cls(
+            manager=load_object(settings.get("CONDITIONAL_FETCH_REDIS_MANAGER")),
+            expire=settings.getint("CONDITIONAL_FETCH_EXPIRE", 0) or None,
+        )
+
+    def get(self, url: str) -> t.Optional["HttpValidatorStructure"]:
+        value = self.manager.get(f"http:validator:{self.fingerprint(url)}")
+        return HttpValidatorStructure(**json.loads(value)) if value else None
+
+    def save(self, url: str, validator: "HttpValidatorStructure") -> None:
+        self.manager.set(f"http:validator:{self.fingerprint(url)}", json.dumps(asdict(validator)), expire=self.expire)
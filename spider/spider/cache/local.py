@@ -0,0 +1,111 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 23:18:52 UTC+08:00
+"""
+
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+
+class LocalCache:
+    """
+    进程内 LRU 缓存, 每个键有独立的过期时间
+
+    失效消息由 Redis 订阅线程写入, 所有读写都在锁内完成.
+
+    :param max_size: 最多缓存的键数量, 超出后淘汰最久未使用的键
+    :type max_size: int
+    :param ttl: 默认过期秒数
+    :type ttl: float
+    """
+
+    # 区分 "未缓存" 和 "缓存了 None"
+    MISSING: t.ClassVar[object] = object()
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # 键 -> (过期时间, 值)
+        self.entries: "OrderedDict[str, t.Tuple[float, t.Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> t.Any:
+        """
+        读取缓存, 未缓存或已过期时返回 LocalCache.MISSING
+
+        :param key: 键
+        :type key: str
+        :return: 缓存的值
+        :rtype: Any
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return self.MISSING
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: t.Any, ttl: t.Optional[float] = None) -> None:
+        """
+        写入缓存
+
+        :param key: 键
+        :type key: str
+        :param value: 值
+        :type value: Any
+        :param ttl: 过期秒数, 为 None 时使用默认值
+        :type ttl: float
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> t.Dict[str, t.Union[int, float]]:
+        """
+        命中统计
+
+        :return: 键数量、命中、未命中、淘汰、失效次数以及命中率
+        :rtype: dict
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,67 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 23:41:09 UTC+08:00
+"""
+
+import threading
+import typing as t
+
+T = t.TypeVar("T")
+
+
+class LazyManager(t.Generic[T]):
+    """
+    延迟创建的管理器代理, 首次访问属性时才调用工厂函数创建实例
+
+    模块级的管理器 (Redis / PostgreSQL) 使用它代替导入时直接实例化, 导入模块、``scrapy list`` 等不会建立网络连接.
+
+    :param factory: 创建实例的工厂函数
+    :type factory: callable
+    """
+
+    def __init__(self, factory: t.Callable[[], T]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def resolve(self) -> T:
+        """
+        获取实例, 未创建时创建
+
+        :return: 管理器实例
+        :rtype: Any
+        """
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+                instance = self._instance
+        return instance
+
+    def bind(self, instance: T) -> None:
+        """
+        直接指定实例, 用于离线运行时替换为替身
+
+        :param instance: 管理器实例
+        :type instance: Any
+        """
+        with self._lock:
+            object.__setattr__(self, "_instance", instance)
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> t.Any:
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        setattr(self.resolve(), name, value)
+
+    def __repr__(self) -> str:
+        return f"<LazyManager {self._instance if self._instance is not None else 'uninitialized'}>"
@@ -1,63 +1,287 @@
 # coding: UTF-8
 
+import hashlib
+import json
+import time
 import typing as t
-import scrapy
 
-import requests
+import scrapy
 from fairylandlogger import Logger, LogManager
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import load_object
+from twisted.internet.task import LoopingCall
+
+from spider.archive import ArchiveRecordStructure, ResponseArchiveWriter
+from spider.cache.http import HttpValidatorStorage, HttpValidatorStructure
+from spider.proxy import HTTP, HTTPS, ProxyPool, ProxyProvider, ProxyStructure
 
 
 class SpiderProxyMiddleware:
+    """
+    代理中间件: 从预取式代理池中无阻塞地租用代理, 并根据响应结果为代理打分
+
+    优先级必须大于 RetryMiddleware (550), 如 560: 否则 RetryMiddleware 先把失败的响应和下载异常转换为重试请求,
+    本中间件看不到这些失败, 无法为代理扣分, 租约也随 meta 复制到重试请求中而无法归还.
+
+    相关配置::
+
+        PROXY_PROVIDER: 代理提供方类路径, 默认 spider.proxy.ShenlongProxyProvider
+        PROXY_PROVIDER_URL: 代理接口地址模板
+        PROXY_STATIC_LIST: StaticProxyProvider 使用的代理列表
+        PROXY_POOL_MIN_SIZE / PROXY_POOL_BATCH_SIZE: 最少可用代理数和每次补充数量
+        PROXY_POOL_MAX_FAILURES: 连续失败多少次后淘汰代理
+        PROXY_POOL_TTL: 提供方未给出过期时间时的默认有效期
+        PROXY_POOL_PREFETCH_INTERVAL: 后台预取间隔 (秒)
+        PROXY_FAILURE_CODES: 视为代理失败的状态码
+    """
+
     Log: t.ClassVar["Logger"] = LogManager.get_logger("spider-middleware", "scrapy")
 
+    def __init__(self, pool: "ProxyPool", prefetch_interval: float = 30.0, failure_codes: t.Optional[t.Iterable[int]] = None):
+        self.pool = pool
+        self.prefetch_interval = prefetch_interval
+        self.failure_codes: t.Set[int] = set(failure_codes or (403, 407, 429, 502, 503, 504))
+        self.prefetcher: t.Optional["LoopingCall"] = None
+
+    @classmethod
+    def from_crawler(cls, crawler: "Crawler") -> "SpiderProxyMiddleware":
+        settings = crawler.settings
+        provider_class: t.Type["ProxyProvider"] = load_object(settings.get("PROXY_PROVIDER", "spider.proxy.ShenlongProxyProvider"))
+        pool = ProxyPool(
+            provider=provider_class.from_settings(settings),
+            min_size=settings.getint("PROXY_POOL_MIN_SIZE", 3),
+            batch_size=settings.getint("PROXY_POOL_BATCH_SIZE", 5),
+            max_failures=settings.getint("PROXY_POOL_MAX_FAILURES", 3),
+        )
+        middleware = cls(
+            pool,
+            prefetch_interval=settings.getfloat("PROXY_POOL_PREFETCH_INTERVAL", 30.0),
+            failure_codes=[int(code) for code in settings.getlist("PROXY_FAILURE_CODES", [403, 407, 429, 502, 503, 504])],
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider: scrapy.Spider) -> None:
+        self.pool.start()
+        self.prefetcher = LoopingCall(self.pool.prefetch)
+        self.prefetcher.start(self.prefetch_interval, now=True)
+
+    def spider_closed(self, spider: scrapy.Spider) -> None:
+        if self.prefetcher and self.prefetcher.running:
+            self.prefetcher.stop()
+        self.pool.stop()
+
     def process_request(self, request: scrapy.Request, spider: scrapy.Spider):
         self.Log.debug(f"获取代理处理请求: {request.url}")
         if request.url.startswith("http://"):
-            proxy = self.__get_proxy(typed=1)
-            if proxy:
-                request.meta["proxy"] = proxy
+            protocol = HTTP
         elif request.url.startswith("https://"):
-            proxy = self.__get_proxy(typed=2)
-            if proxy:
-                request.meta["proxy"] = proxy
+            protocol = HTTPS
         else:
             self.Log.warning(f"无法识别请求协议: {request.url}")
+            return None
+
+        # 上一次租用未归还就被复制到了重试请求中 (中间件顺序错误), 按失败归还, 避免租约泄漏
+        self.__release(request, success=False)
+
+        proxy = self.pool.lease(protocol)
+        if proxy is None:
+            self.Log.warning(f"代理池暂无可用代理, 直接请求: {request.url}")
+            request.meta.pop("proxy", None)
+            return None
+
+        request.meta["proxy"] = proxy.url
+        request.meta["_proxy_lease"] = (proxy, time.monotonic())
+        return None
+
+    def process_response(self, request: scrapy.Request, response: scrapy.http.Response, spider: scrapy.Spider) -> scrapy.http.Response:
+        self.__release(request, success=response.status not in self.failure_codes)
+        return response
+
+    def process_exception(self, request: scrapy.Request, exception: Exception, spider: scrapy.Spider) -> None:
+        self.Log.warning(f"代理请求异常: {request.meta.get('proxy')}, {exception!r}")
+        self.__release(request, success=False)
+        return None
+
+    def __release(self, request: scrapy.Request, success: bool) -> None:
+        lease: t.Optional[t.Tuple["ProxyStructure", float]] = request.meta.pop("_proxy_lease", None)
+        if lease is None:
+            return
+
+        proxy, leased_at = lease
+        self.pool.report(proxy, success=success, latency=time.monotonic() - leased_at)
+        if not success:
+            # 重试时重新租用代理
+            request.meta.pop("proxy", None)
+
+
+class ResponseArchiveMiddleware:
+    """
+    原始响应归档中间件: 将交给解析回调的成功响应写入本地压缩归档, 供 script/reparse.py 离线重新解析
+
+    优先级需低于 HttpCompressionMiddleware (590), 归档的是解压后的响应体.
+
+    相关配置::
+
+        ARCHIVE_ENABLED: 是否启用归档
+        ARCHIVE_DIR: 归档目录
+        ARCHIVE_SEGMENT_SIZE: 分段大小上限 (字节)
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("spider-middleware", "scrapy")
+
+    def __init__(self, writer: "ResponseArchiveWriter"):
+        self.writer = writer
+
+    @classmethod
+    def from_crawler(cls, crawler: "Crawler") -> "ResponseArchiveMiddleware":
+        settings = crawler.settings
+        if not settings.getbool("ARCHIVE_ENABLED", False):
+            raise NotConfigured
 
-    def __get_proxy(self, typed: int) -> t.Optional[str]:
-        response = requests.get(
-            url=f"http://api.shenlongip.com/ip?key=d9y2e6o6&protocol={typed}&mr=1&pattern=json&need=1111&count=1&sign=ab79686e9107b4f6b1ab6d8e25529091",
-            timeout=10,
+        writer = ResponseArchiveWriter(
+            directory=settings.get("ARCHIVE_DIR", "tmp/archive"),
+            segment_size=settings.getint("ARCHIVE_SEGMENT_SIZE", 256 * 1024 * 1024),
         )
-        response.raise_for_status()
-        data: t.Dict[str, int | t.List[t.Dict[str, int | str]]] = response.json()
-
-        self.Log.debug(f"代理IP响应数据: {data}")
-
-        ip = data.get("data", [{}])[0].get("ip", "")
-        port = data.get("data", [{}])[0].get("port", 0)
-
-        if ip and port:
-            proxies = {
-                "http": f"http://{ip}:{port}",
-                "https": f"https://{ip}:{port}",
-                "socks5": f"socks5://{ip}:{port}",
-            }
-
-            if typed == 2:
-                proxy = proxies.get("https", "")
-            else:
-                proxy = proxies.get("http", "")
-            self.Log.info(f"获取到代理IP: {proxy}")
-
-            return proxy
-
-            # test_response = requests.get("http://myip.ipip.net/", proxies=proxies, timeout=5)
-            # if test_response.status_code != 200:
-            #     self.Log.error(f"代理IP测试失败，状态码: {test_response.status_code}")
-            #     return self.__get_proxy(typed=typed)
-            # else:
-            #     self.Log.info(f"代理IP测试成功: {test_response.text.strip()}")
-            #     return proxy
-        else:
-            self.Log.error("未能获取到有效的代理IP")
+        middleware = cls(writer)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_closed(self, spider: scrapy.Spider) -> None:
+        self.writer.close()
+
+    def process_response(self, request: scrapy.Request, response: scrapy.http.Response, spider: scrapy.Spider) -> scrapy.http.Response:
+        if response.status != 200 or request.callback is None:
+            return response
+
+        try:
+            record = ArchiveRecordStructure(
+                url=response.url,
+                status=response.status,
+                headers={name.decode("UTF-8"): [value.decode("UTF-8", "replace") for value in values] for name, values in response.headers.items()},
+                body=response.body,
+                spider=spider.name,
+                callback=getattr(request.callback, "__name__", None),
+                cb_kwargs=self.__serializable(request.cb_kwargs),
+                meta=self.__serializable(request.meta),
+            )
+            self.writer.write(record)
+        except Exception as error:
+            # 归档失败不影响正常抓取
+            self.Log.error(f"归档响应失败: {response.url}, {error!r}")
+
+        return response
+
+    @staticmethod
+    def __serializable(data: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        """只保留可 JSON 序列化的用户参数, 跳过 Scrapy 和中间件的内部字段"""
+        result = {}
+        for key, value in data.items():
+            if key.startswith(("_", "download_", "conditional_")) or key in ("depth", "proxy", "cookiejar", "handle_httpstatus_list"):
+                continue
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            result[key] = value
+        return result
+
+
+class ConditionalFetchMiddleware:
+    """
+    条件请求中间件: 记录每个 URL 的 ETag、Last-Modified 和响应体哈希, 再次抓取时发送条件请求
+
+    只处理 meta 中 conditional_fetch 为 True 的请求. 服务端返回 304, 或返回 200 但响应体哈希与上次相同时,
+    在 meta 中设置 conditional_unchanged, 由解析回调跳过解析和入库.
+
+    新的校验信息在该响应产出的数据项全部通过 Pipeline 后才保存 (item_scraped 信号), 入库失败的页面下次仍会完整解析.
+
+    相关配置::
+
+        CONDITIONAL_FETCH_STORAGE: 存储类路径, 默认 spider.cache.http.DiskHttpValidatorStorage
+        CONDITIONAL_FETCH_DIR: 磁盘存储目录
+        CONDITIONAL_FETCH_REDIS_MANAGER: Redis 存储使用的缓存管理器对象路径
+        CONDITIONAL_FETCH_EXPIRE: Redis 存储过期秒数
+        CONDITIONAL_FETCH_HASH_CSS: 计算响应体哈希的 CSS 选择器, 只对解析用到的区域取哈希, 为空时对整个响应体取哈希
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("spider-middleware", "scrapy")
+
+    def __init__(self, storage: "HttpValidatorStorage", hash_css: t.Optional[str] = None):
+        self.storage = storage
+        self.hash_css = hash_css
+
+    @classmethod
+    def from_crawler(cls, crawler: "Crawler") -> "ConditionalFetchMiddleware":
+        settings = crawler.settings
+        storage_class: t.Type["HttpValidatorStorage"] = load_object(settings.get("CONDITIONAL_FETCH_STORAGE", "spider.cache.http.DiskHttpValidatorStorage"))
+        middleware = cls(storage_class.from_settings(settings), hash_css=settings.get("CONDITIONAL_FETCH_HASH_CSS") or None)
+        crawler.signals.connect(middleware.item_scraped, signal=signals.item_scraped)
+        return middleware
+
+    def process_request(self, request: scrapy.Request, spider: scrapy.Spider) -> None:
+        if not request.meta.get("conditional_fetch"):
+            return None
+
+        validator = self.storage.get(request.url)
+        request.meta["conditional_validator"] = validator
+        if validator is None:
             return None
+
+        if validator.etag:
+            request.headers["If-None-Match"] = validator.etag
+        if validator.last_modified:
+            request.headers["If-Modified-Since"] = validator.last_modified
+        request.meta["handle_httpstatus_list"] = list(set(request.meta.get("handle_httpstatus_list", [])) | {304})
+        return None
+
+    def process_response(self, request: scrapy.Request, response: scrapy.http.Response, spider: scrapy.Spider) -> scrapy.http.Response:
+        if not request.meta.get("conditional_fetch"):
+            return response
+
+        previous: t.Optional["HttpValidatorStructure"] = request.meta.get("conditional_validator")
+        if response.status == 304:
+            self.Log.info(f"页面未修改 (304): {request.url}")
+            request.meta["conditional_unchanged"] = True
+            return response
+
+        if response.status != 200:
+            return response
+
+        validator = HttpValidatorStructure(
+            etag=self.__header(response, "ETag"),
+            last_modified=self.__header(response, "Last-Modified"),
+            body_hash=self.body_hash(response),
+        )
+        if previous is not None and previous.body_hash == validator.body_hash:
+            self.Log.info(f"页面内容未变化: {request.url}")
+            request.meta["conditional_unchanged"] = True
+
+        request.meta["conditional_pending"] = validator
+        return response
+
+    def item_scraped(self, item: t.Any, response: scrapy.http.Response, spider: scrapy.Spider) -> None:
+        validator: t.Optional["HttpValidatorStructure"] = response.meta.get("conditional_pending") if response.request else None
+        if validator is None:
+            return
+
+        try:
+            self.storage.save(response.url, validator)
+        except Exception as error:
+            self.Log.error(f"保存条件请求校验信息失败: {response.url}, {error!r}")
+
+    def body_hash(self, response: scrapy.http.Response) -> str:
+        """对解析用到的区域取哈希, 页面上的广告、推荐等无关内容变化不影响判断"""
+        if self.hash_css and isinstance(response, scrapy.http.TextResponse):
+            content = "".join(response.css(self.hash_css).getall()).encode("UTF-8")
+        else:
+            content = response.body
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    @staticmethod
+    def __header(response: scrapy.http.Response, name: str) -> t.Optional[str]:
+        value = response.headers.get(name)
+        return value.decode("UTF-8", "replace") if value else None
@@ -0,0 +1,297 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 17:05:44 UTC+08:00
+"""
+
+import abc
+import datetime
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+import requests
+from fairylandlogger import LogManager, Logger
+from scrapy.settings import Settings
+from twisted.internet import threads
+from twisted.internet.defer import Deferred
+from twisted.python.threadpool import ThreadPool
+
+# 代理协议: 与代理服务商接口的 protocol 参数一致
+HTTP, HTTPS = 1, 2
+
+
+@dataclass
+class ProxyStructure:
+    """代理及其观测指标"""
+
+    url: str
+    protocol: int
+    expire_at: float
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    # 延迟指数移动平均 (秒)
+    latency: float = 1.0
+    in_use: int = 0
+    create_time: float = field(default_factory=time.time)
+
+    @property
+    def expired(self) -> bool:
+        return self.expire_at <= time.time()
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / (self.successes + self.failures + 1)
+
+    @property
+    def score(self) -> float:
+        """得分越高越优先: 成功率高、延迟低、当前占用少"""
+        return (1 - self.failure_rate) / (max(self.latency, 0.001) * (1 + self.in_use))
+
+
+class ProxyProvider(abc.ABC):
+    """代理提供方接口, 在线程池中调用, 可以阻塞"""
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "ProxyProvider":
+        return cls()
+
+    @abc.abstractmethod
+    def fetch(self, protocol: int, count: int) -> t.List["ProxyStructure"]: ...
+
+
+class StaticProxyProvider(ProxyProvider):
+    """
+    固定代理列表, 用于本地调试或测试
+
+    :param proxies: 代理地址列表
+    :type proxies: list
+    :param ttl: 代理有效期 (秒)
+    :type ttl: float
+    """
+
+    def __init__(self, proxies: t.Sequence[str], ttl: float = 3600.0):
+        self.proxies = list(proxies)
+        self.ttl = ttl
+        self.cursor = 0
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "StaticProxyProvider":
+        return cls(settings.getlist("PROXY_STATIC_LIST"), ttl=settings.getfloat("PROXY_POOL_TTL", 3600.0))
+
+    def fetch(self, protocol: int, count: int) -> t.List["ProxyStructure"]:
+        if not self.proxies:
+            return []
+
+        scheme = "https" if protocol == HTTPS else "http"
+        result = []
+        for _ in range(min(count, len(self.proxies))):
+            address = self.proxies[self.cursor % len(self.proxies)].split("://")[-1]
+            self.cursor += 1
+            result.append(ProxyStructure(url=f"{scheme}://{address}", protocol=protocol, expire_at=time.time() + self.ttl))
+        return result
+
+
+class ShenlongProxyProvider(ProxyProvider):
+    """
+    神龙代理接口
+
+    :param url: 接口地址模板, 支持 {protocol} 和 {count} 占位符
+    :type url: str
+    :param ttl: 接口未返回过期时间时的默认有效期 (秒)
+    :type ttl: float
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("spider-proxy", "scrapy")
+
+    DEFAULT_URL: t.ClassVar[str] = (
+        "http://api.shenlongip.com/ip?key=d9y2e6o6&protocol={protocol}&mr=1&pattern=json&need=1111&count={count}&sign=ab79686e9107b4f6b1ab6d8e25529091"
+    )
+
+    def __init__(self, url: t.Optional[str] = None, ttl: float = 180.0):
+        self.url = url or self.DEFAULT_URL
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "ShenlongProxyProvider":
+        return cls(settings.get("PROXY_PROVIDER_URL"), ttl=settings.getfloat("PROXY_POOL_TTL", 180.0))
+
+    def fetch(self, protocol: int, count: int) -> t.List["ProxyStructure"]:
+        response = requests.get(url=self.url.format(protocol=protocol, count=count), timeout=10)
+        response.raise_for_status()
+        data: t.Dict[str, int | t.List[t.Dict[str, int | str]]] = response.json()
+
+        self.Log.debug(f"代理IP响应数据: {data}")
+
+        scheme = "https" if protocol == HTTPS else "http"
+        proxies = []
+        for row in data.get("data") or []:
+            ip, port = row.get("ip", ""), row.get("port", 0)
+            if not ip or not port:
+                continue
+            proxies.append(ProxyStructure(url=f"{scheme}://{ip}:{port}", protocol=protocol, expire_at=self.__parse_expire(row)))
+
+        if not proxies:
+            self.Log.error("未能获取到有效的代理IP")
+        return proxies
+
+    def __parse_expire(self, row: t.Dict[str, t.Any]) -> float:
+        expire = row.get("expire_time") or row.get("expire")
+        if isinstance(expire, str):
+            try:
+                return datetime.datetime.strptime(expire, "%Y-%m-%d %H:%M:%S").timestamp()
+            except ValueError:
+                pass
+        return time.time() + self.ttl
+
+
+class ProxyPool:
+    """
+    预取式代理池: 后台线程向提供方补充代理, 请求从池中无阻塞租用得分最高的代理
+
+    补充代理在独立的线程池中执行, 不占用 reactor 线程池; 豆瓣爬虫将 reactor 线程池限制为 1 个线程,
+    在其中请求代理接口会阻塞 DNS 解析.
+
+    :param provider: 代理提供方
+    :type provider: ProxyProvider
+    :param min_size: 每种协议的最少可用代理数, 低于该值时触发补充
+    :type min_size: int
+    :param batch_size: 每次补充的代理数量
+    :type batch_size: int
+    :param max_failures: 连续失败多少次后淘汰
+    :type max_failures: int
+    :param expire_margin: 距过期不足该秒数时不再租出
+    :type expire_margin: float
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("spider-proxy", "scrapy")
+
+    def __init__(self, provider: "ProxyProvider", min_size: int = 3, batch_size: int = 5, max_failures: int = 3, expire_margin: float = 10.0):
+        self.provider = provider
+        self.min_size = min_size
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+        self.expire_margin = expire_margin
+
+        self.proxies: t.Dict[int, t.List["ProxyStructure"]] = {HTTP: [], HTTPS: []}
+        self.refilling: t.Dict[int, bool] = {HTTP: False, HTTPS: False}
+        self.thread_pool: t.Optional["ThreadPool"] = None
+
+    def start(self) -> None:
+        """启动补充代理的线程池, 每种协议最多一个线程"""
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPool(minthreads=0, maxthreads=len(self.proxies), name="spider-proxy")
+            self.thread_pool.start()
+
+    def stop(self) -> None:
+        if self.thread_pool is not None:
+            self.thread_pool.stop()
+            self.thread_pool = None
+
+    def available(self, protocol: int) -> t.List["ProxyStructure"]:
+        deadline = time.time() + self.expire_margin
+        return [proxy for proxy in self.proxies.get(protocol, []) if proxy.expire_at > deadline]
+
+    def lease(self, protocol: int) -> t.Optional["ProxyStructure"]:
+        """
+        租用得分最高的代理, 不阻塞; 池中无可用代理时返回 None 并触发补充
+
+        :param protocol: 代理协议
+        :type protocol: int
+        :return: 代理
+        :rtype: ProxyStructure
+        """
+        self.evict(protocol)
+        candidates = self.available(protocol)
+        if len(candidates) < self.min_size:
+            self.refill(protocol)
+        if not candidates:
+            return None
+
+        proxy = max(candidates, key=lambda item: item.score)
+        proxy.in_use += 1
+        return proxy
+
+    def report(self, proxy: "ProxyStructure", success: bool, latency: t.Optional[float] = None) -> None:
+        """
+        归还代理并记录本次请求结果
+
+        :param proxy: 代理
+        :type proxy: ProxyStructure
+        :param success: 请求是否成功
+        :type success: bool
+        :param latency: 请求耗时 (秒)
+        :type latency: float
+        """
+        proxy.in_use = max(0, proxy.in_use - 1)
+        if success:
+            proxy.successes += 1
+            proxy.consecutive_failures = 0
+        else:
+            proxy.failures += 1
+            proxy.consecutive_failures += 1
+        if latency is not None:
+            proxy.latency = 0.7 * proxy.latency + 0.3 * latency
+
+        if proxy.consecutive_failures >= self.max_failures:
+            self.Log.warning(f"代理连续失败 {proxy.consecutive_failures} 次, 淘汰: {proxy.url}")
+            self.remove(proxy)
+
+    def remove(self, proxy: "ProxyStructure") -> None:
+        proxies = self.proxies.get(proxy.protocol, [])
+        if proxy in proxies:
+            proxies.remove(proxy)
+
+    def evict(self, protocol: int) -> None:
+        """淘汰已过期的代理"""
+        proxies = self.proxies.get(protocol, [])
+        expired = [proxy for proxy in proxies if proxy.expired]
+        for proxy in expired:
+            self.Log.info(f"代理已过期, 淘汰: {proxy.url}")
+            proxies.remove(proxy)
+
+    def refill(self, protocol: int) -> t.Optional["Deferred"]:
+        """
+        在独立线程池中向提供方补充代理, 同一协议同时只有一个补充任务
+
+        :param protocol: 代理协议
+        :type protocol: int
+        :return: 补充完成的 Deferred
+        :rtype: Deferred
+        """
+        if self.refilling.get(protocol):
+            return None
+
+        from twisted.internet import reactor
+
+        self.start()
+        self.refilling[protocol] = True
+        deferred = threads.deferToThreadPool(reactor, self.thread_pool, self.provider.fetch, protocol, self.batch_size)
+        deferred.addCallback(self.__on_fetched, protocol)
+        deferred.addErrback(self.__on_fetch_failed, protocol)
+        deferred.addBoth(self.__on_refill_done, protocol)
+        return deferred
+
+    def prefetch(self) -> None:
+        """定时调用, 保持每种协议的代理数量不低于 min_size"""
+        for protocol in self.proxies:
+            self.evict(protocol)
+            if len(self.available(protocol)) < self.min_size:
+                self.refill(protocol)
+
+    def __on_fetched(self, proxies: t.List["ProxyStructure"], protocol: int) -> None:
+        known = {proxy.url for proxy in self.proxies[protocol]}
+        fresh = [proxy for proxy in proxies if proxy.url not in known and not proxy.expired]
+        self.proxies[protocol].extend(fresh)
+        self.Log.info(f"补充代理 {len(fresh)} 个, 协议 {protocol} 当前可用 {len(self.available(protocol))} 个")
+
+    def __on_fetch_failed(self, failure, protocol: int) -> None:
+        self.Log.error(f"获取代理失败, 协议 {protocol}: {failure.getErrorMessage()}")
+
+    def __on_refill_done(self, result, protocol: int):
+        self.refilling[protocol] = False
+        return result
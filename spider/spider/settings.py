@@ -56,6 +56,21 @@ ITEM_PIPELINES = {
 }
 
 DOWNLOADER_MIDDLEWARES = {
-    # 添加代理中间件
-    # "spider.middlewares.SpiderProxyMiddleware": 0,
+    # 添加代理中间件: 必须位于 RetryMiddleware (550) 之后, 才能在重试前看到失败的响应和异常
+    # "spider.middlewares.SpiderProxyMiddleware": 560,
 }
+
+# 代理池: 本地调试可改用 "spider.proxy.StaticProxyProvider" 并配置 PROXY_STATIC_LIST
+PROXY_PROVIDER = "spider.proxy.ShenlongProxyProvider"
+PROXY_POOL_MIN_SIZE = 3
+PROXY_POOL_BATCH_SIZE = 5
+PROXY_POOL_PREFETCH_INTERVAL = 30
+
+# 原始响应归档, 供 script/reparse.py 离线重新解析
+ARCHIVE_ENABLED = False
+ARCHIVE_DIR = "tmp/archive"
+ARCHIVE_SEGMENT_SIZE = 256 * 1024 * 1024
+
+# 条件请求: 记录 ETag / Last-Modified / 响应体哈希, 只对 meta 中 conditional_fetch 为 True 的请求生效
+CONDITIONAL_FETCH_STORAGE = "spider.cache.http.DiskHttpValidatorStorage"
+CONDITIONAL_FETCH_DIR = "tmp/validators"
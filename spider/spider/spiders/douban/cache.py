@@ -7,159 +7,715 @@
 @datetime: 2025-12-22 22:06:34 UTC+08:00
 """
 import json
+import random
 import time
 import typing as t
-from dataclasses import asdict
+import zlib
 
 from fairylandlogger import LogManager, Logger
-from redis import Redis
+from redis import Redis, RedisCluster
+from redis.client import Pipeline
+from redis.exceptions import NoScriptError
 
-from fairylandfuture.helpers.json.serializer import JsonSerializerHelper
 from spider.cache import RedisCacheManager
+from spider.cache.bloom import BloomFilter
 from spider.enums import SpiderStatus
+from spider.lazy import LazyManager
 from spider.spiders.douban.config import DoubanConfig
 from spider.spiders.douban.structures import MovieTask
+from spider.spiders.douban.utils import DoubanUtils
 
 
 class DoubanCacheManager(RedisCacheManager):
     Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-spider-cache", "douban")
 
+    # 任务存储命名空间: {namespace}:tasks 为 movie_id -> 任务数据的哈希, {namespace}:tasks:status:{status} 为各状态的 movie_id 集合
+    TASK_NAMESPACE: t.ClassVar[str] = "douban:movie"
+    COMMENT_TASK_NAMESPACE: t.ClassVar[str] = "douban:movie:comment"
+    # SCAN / HMGET / 批量清理每批的数量
+    SCAN_BATCH_SIZE: t.ClassVar[int] = 500
+
+    # 原子地弹出一批指定状态的任务 ID 并从任务哈希中删除
+    CLEAN_TASKS_SCRIPT: t.ClassVar[str] = """
+        local ids = redis.call('SPOP', KEYS[2], ARGV[1])
+        if #ids > 0 then
+            redis.call('HDEL', KEYS[1], unpack(ids))
+        end
+        return #ids
+    """
+
+    # 任务状态转换图: 当前状态 -> 允许转换到的状态
+    TASK_TRANSITIONS: t.ClassVar[t.Dict["SpiderStatus", t.Set["SpiderStatus"]]] = {
+        SpiderStatus.PENDING: {SpiderStatus.PROCESSING, SpiderStatus.FAILED},
+        SpiderStatus.PROCESSING: {SpiderStatus.PROCESSING, SpiderStatus.PARSED, SpiderStatus.COMPLETED, SpiderStatus.FAILED},
+        SpiderStatus.PARSED: {SpiderStatus.PROCESSING, SpiderStatus.PARSED, SpiderStatus.COMPLETED, SpiderStatus.FAILED},
+        SpiderStatus.COMPLETED: {SpiderStatus.PROCESSING, SpiderStatus.COMPLETED},
+        SpiderStatus.FAILED: {SpiderStatus.PROCESSING, SpiderStatus.FAILED},
+    }
+
+    # 任务的紧凑编码: "状态码|创建时间|更新时间|重试次数|最大重试次数|错误信息", 时间精确到秒, 不保存数据项内容
+    TASK_STATUS_CODES: t.ClassVar[t.Dict["SpiderStatus", str]] = {
+        SpiderStatus.PENDING: "0",
+        SpiderStatus.PROCESSING: "1",
+        SpiderStatus.PARSED: "2",
+        SpiderStatus.COMPLETED: "3",
+        SpiderStatus.FAILED: "4",
+    }
+    # 错误信息最多保留的字符数
+    TASK_ERROR_MAX_LENGTH: t.ClassVar[int] = 200
+
+    # 在服务端校验并执行一次状态转换, 失败时按指数退避加入重试队列或死信集合
+    # KEYS: 任务哈希, 目标状态集合, 重试队列, 死信集合, 其他状态集合...
+    # ARGV: movie_id, 目标状态码, 允许的当前状态码 (逗号分隔), 当前时间, 错误信息, 是否为失败,
+    #       重试基础间隔, 重试最大间隔, 随机抖动系数
+    # 返回 {是否成功, 转换前的状态码, 下次重试时间 (0 表示未加入重试队列, -1 表示进入死信)}
+    # 兼容迁移前的 JSON 编码, 写回时统一使用紧凑编码
+    TRANSITION_TASK_SCRIPT: t.ClassVar[str] = """
+        local raw = redis.call('HGET', KEYS[1], ARGV[1])
+        if not raw then
+            return {0, '', 0}
+        end
+
+        local codes = {pending = '0', processing = '1', parsed = '2', completed = '3', failed = '4'}
+        local current, create_time, retry_count, max_retries
+        if string.sub(raw, 1, 1) == '{' then
+            local task = cjson.decode(raw)
+            current = codes[task['status']]
+            create_time = math.floor(tonumber(task['create_time']) or 0)
+            retry_count = tonumber(task['retry_count']) or 0
+            max_retries = tonumber(task['max_retries']) or 0
+        else
+            local fields = {string.match(raw, '^(%d)|(%d+)|%d+|(%d+)|(%d+)|')}
+            current, create_time, retry_count, max_retries = fields[1], fields[2], tonumber(fields[3]), tonumber(fields[4])
+        end
+
+        if not string.find(',' .. ARGV[3] .. ',', ',' .. current .. ',', 1, true) then
+            return {0, current, 0}
+        end
+
+        local now = tonumber(ARGV[4])
+        local eligible = 0
+        if ARGV[6] ~= '1' then
+            redis.call('ZREM', KEYS[3], ARGV[1])
+        elseif current ~= ARGV[2] then
+            -- 同一次尝试中重复上报的失败不再累加重试次数
+            retry_count = retry_count + 1
+            if retry_count > max_retries then
+                redis.call('ZREM', KEYS[3], ARGV[1])
+                redis.call('SADD', KEYS[4], ARGV[1])
+                eligible = -1
+            else
+                local delay = math.min(tonumber(ARGV[8]), tonumber(ARGV[7]) * 2 ^ (retry_count - 1))
+                eligible = now + delay * (1 + tonumber(ARGV[9]))
+                redis.call('ZADD', KEYS[3], eligible, ARGV[1])
+            end
+        end
+
+        local value = table.concat({ARGV[2], create_time, math.floor(now), retry_count, max_retries, ARGV[5]}, '|')
+        redis.call('HSET', KEYS[1], ARGV[1], value)
+        for i = 5, #KEYS do
+            redis.call('SREM', KEYS[i], ARGV[1])
+        end
+        redis.call('SADD', KEYS[2], ARGV[1])
+        return {1, current, math.floor(eligible)}
+    """
+
+    # 仅当任务仍为迁移前读取的旧值时才写入紧凑编码, 避免覆盖并发的状态转换
+    # KEYS: 任务哈希; ARGV: movie_id, 旧值, 新值, ...
+    REENCODE_TASKS_SCRIPT: t.ClassVar[str] = """
+        local count = 0
+        for i = 1, #ARGV, 3 do
+            if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+                redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+                count = count + 1
+            end
+        end
+        return count
+    """
+
+    # 原子地弹出已到期的重试任务, 多个爬虫进程不会取到同一个任务
+    # KEYS: 重试队列; ARGV: 当前时间, 数量
+    POP_DUE_RETRIES_SCRIPT: t.ClassVar[str] = """
+        local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+        if #ids > 0 then
+            redis.call('ZREM', KEYS[1], unpack(ids))
+        end
+        return ids
+    """
+
     def __init__(self):
-        super().__init__(client=self._create_redis_client())
+        config: t.Dict[str, t.Any] = DoubanConfig.load().get("redis", {})
+        super().__init__(client=self._create_redis_client(config), hash_tags=bool(config.get("cluster") or config.get("hash_tags")))
+        # 任务分桶数: 每个桶的任务哈希、状态集合、重试队列、死信集合带有相同的哈希标签, 位于同一个槽, 不同的桶分散到各节点
+        self.task_buckets = int(config.get("task_buckets", 16 if self.hash_tags else 1))
+        self.clean_tasks_script = self.redis.register_script(self.CLEAN_TASKS_SCRIPT)
+        self.transition_task_script = self.redis.register_script(self.TRANSITION_TASK_SCRIPT)
+        self.pop_due_retries_script = self.redis.register_script(self.POP_DUE_RETRIES_SCRIPT)
+        self.reencode_tasks_script = self.redis.register_script(self.REENCODE_TASKS_SCRIPT)
 
-    def _create_redis_client(self) -> "Redis":
-        config: t.Dict[str, str] = DoubanConfig.load().get("redis", {})
-        self.Log.debug(f"Redis 配置: {config}")
+        # 失败任务重试的指数退避参数 (秒), 由爬虫根据配置调用 configure_retry 修改
+        self.retry_base_delay, self.retry_max_delay, self.retry_jitter = 300.0, 6 * 3600.0, 0.2
 
-        client = Redis(
-            host=config.get("host"),
-            port=int(config.get("port", 6379)),
-            db=int(config.get("db", 0)),
-            password=config.get("password"),
-        )
+        # 已入库电影ID的进程内布隆过滤器, 调用 enable_seen_filter 后启用
+        self.seen_filter: t.Optional["BloomFilter"] = None
+
+    def _create_redis_client(self, config: t.Dict[str, t.Any]) -> t.Union["Redis", "RedisCluster"]:
+        """
+        创建 Redis 客户端, 配置了 cluster 时连接 Redis Cluster
+
+        :param config: Redis 配置
+        :type config: dict
+        :return: Redis 客户端
+        :rtype: Redis | RedisCluster
+        """
+        self.Log.debug(f"Redis 配置: {dict(config, password='******')}")
+        client = self.create_client(config)
 
         try:
             client.ping()
-            self.Log.info("成功连接到 Redis 服务器")
+            self.Log.info(f"成功连接到 Redis {'集群' if isinstance(client, RedisCluster) else '服务器'}")
             return client
         except Exception as error:
             self.Log.error(f"连接到 Redis 服务器失败: {error}")
+            client.close()
             raise error
 
-    def save_task(self, task: "MovieTask"):
+    def _task_bucket(self, movie_id: t.Union[str, bytes]) -> int:
+        if self.task_buckets == 1:
+            return 0
+        return zlib.crc32(movie_id.encode("UTF-8") if isinstance(movie_id, str) else movie_id) % self.task_buckets
+
+    def _task_suffix(self, namespace: str, bucket: int) -> str:
+        # 单机且不分桶时沿用原来的键名
+        if self.task_buckets == 1 and not self.hash_tags:
+            return ""
+        return f":{self._tag(f'{namespace}:{bucket:02d}')}"
+
+    def _task_key(self, namespace: str, bucket: int = 0) -> str:
+        return self._get_key(f"{namespace}:tasks{self._task_suffix(namespace, bucket)}")
+
+    def _task_status_key(self, namespace: str, status: "SpiderStatus", bucket: int = 0) -> str:
+        return self._get_key(f"{namespace}:tasks:status:{status.value}{self._task_suffix(namespace, bucket)}")
+
+    def _task_retry_key(self, namespace: str, bucket: int = 0) -> str:
+        return self._get_key(f"{namespace}:tasks:retry{self._task_suffix(namespace, bucket)}")
+
+    def _task_dead_key(self, namespace: str, bucket: int = 0) -> str:
+        return self._get_key(f"{namespace}:tasks:dead{self._task_suffix(namespace, bucket)}")
+
+    def movie_key(self, name: str, movie_id: str, *parts: str) -> str:
+        """
+        电影相关的键 (不含前缀): 启用哈希标签时电影ID作为标签, 同一电影的断点、分页进度、已完成排序位于同一个槽
+
+        :param name: 键名
+        :type name: str
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param parts: 电影ID之后的部分
+        :type parts: str
+        :return: 键
+        :rtype: str
+        """
+        return ":".join((name, self._tag(movie_id), *parts))
+
+    def _movie_key(self, name: str, movie_id: str, *parts: str) -> str:
+        return self._get_key(self.movie_key(name, movie_id, *parts))
+
+    @classmethod
+    def _encode_task(cls, task: "MovieTask") -> str:
+        """
+        紧凑编码任务, 数据项已保存在数据库中, 不再写入缓存
+
+        :param task: 任务
+        :type task: MovieTask
+        :return: 编码后的任务
+        :rtype: str
+        """
+        error_msg = (task.error_msg or "")[: cls.TASK_ERROR_MAX_LENGTH]
+        return "|".join(
+            (cls.TASK_STATUS_CODES.get(task.status), str(int(task.create_time)), str(int(task.update_time)), str(task.retry_count), str(task.max_retries), error_msg)
+        )
+
+    @classmethod
+    def _decode_task(cls, movie_id: t.Union[str, bytes], value: t.Union[str, bytes]) -> "MovieTask":
+        """
+        解码任务, 兼容迁移前的 JSON 编码
+
+        :param movie_id: 电影ID
+        :type movie_id: str | bytes
+        :param value: 编码后的任务
+        :type value: str | bytes
+        :return: 任务
+        :rtype: MovieTask
+        """
+        movie_id = movie_id.decode("UTF-8") if isinstance(movie_id, bytes) else movie_id
+        value = value.decode("UTF-8") if isinstance(value, bytes) else value
+        if value.startswith("{"):
+            task_data: t.Dict[str, t.Any] = json.loads(value)
+            task_data["status"] = SpiderStatus(task_data["status"])
+            task_data.update(movie_id=movie_id, data=None)
+            return MovieTask(**task_data)
+
+        code, create_time, update_time, retry_count, max_retries, error_msg = value.split("|", 5)
+        return MovieTask(
+            movie_id=movie_id,
+            status=cls.__status_from_code(code),
+            create_time=float(create_time),
+            update_time=float(update_time),
+            retry_count=int(retry_count),
+            max_retries=int(max_retries),
+            error_msg=error_msg or None,
+        )
+
+    @classmethod
+    def __status_from_code(cls, code: t.Union[str, bytes]) -> "SpiderStatus":
+        code = code.decode("UTF-8") if isinstance(code, bytes) else code
+        return next(status for status, value in cls.TASK_STATUS_CODES.items() if value == code)
+
+    def _save_task(self, namespace: str, task: "MovieTask", label: str) -> bool:
+        """
+        保存任务, 在同一个事务中写入任务哈希并维护状态集合
+
+        :param namespace: 任务命名空间
+        :type namespace: str
+        :param task: 任务
+        :type task: MovieTask
+        :param label: 日志中的任务名称
+        :type label: str
+        :return: 是否保存成功
+        :rtype: bool
+        """
         try:
-            key = f"douban:movie:task:{task.movie_id}"
             task.update_time = time.time()
+            self.Log.info(f"保存{label} {task.movie_id} 到缓存, 状态: {task.status.value}")
 
-            task_data = asdict(task)
-            task_data.update(status=task.status.value)
-            self.Log.info(f"任务数据: {task_data}")
-
-            self.Log.info(f"保存任务 {key} 到缓存")
-            self.set(key=key, value=json.dumps(task_data, ensure_ascii=False, separators=(",", ":")))
+            bucket = self._task_bucket(task.movie_id)
+            pipeline = self.redis.pipeline(transaction=True)
+            pipeline.hset(self._task_key(namespace, bucket), task.movie_id, self._encode_task(task))
+            for status in SpiderStatus:
+                if status != task.status:
+                    pipeline.srem(self._task_status_key(namespace, status, bucket), task.movie_id)
+            pipeline.sadd(self._task_status_key(namespace, task.status, bucket), task.movie_id)
+            # 重新保存的任务从头开始, 不再保留重试计划和死信记录
+            pipeline.zrem(self._task_retry_key(namespace, bucket), task.movie_id)
+            pipeline.srem(self._task_dead_key(namespace, bucket), task.movie_id)
+            pipeline.execute()
             return True
         except Exception as error:
-            self.Log.error(f"保存任务 {task.movie_id} 失败: {error}")
+            self.Log.error(f"保存{label} {task.movie_id} 失败: {error}")
             return False
 
-    def get_task(self, movie_id: str) -> t.Optional["MovieTask"]:
-        key = self._get_key(f"douban:movie:task:{movie_id}")
-        self.Log.info(f"从缓存获取任务 {key}")
-        data = self.redis.get(key)
-
+    def _get_task(self, namespace: str, movie_id: str, label: str) -> t.Optional["MovieTask"]:
+        data = self.redis.hget(self._task_key(namespace, self._task_bucket(movie_id)), movie_id)
         if not data:
-            self.Log.warning(f"任务 {movie_id} 不存在于缓存")
+            self.Log.warning(f"{label} {movie_id} 不存在于缓存")
             return None
 
         try:
-            task_data = json.loads(data)
-            task_data["status"] = SpiderStatus(task_data["status"])
-            self.Log.info(f"{movie_id} 任务数据: {task_data}")
-            return MovieTask(**task_data)
-        except (json.JSONDecodeError, KeyError, ValueError) as error:
-            print(f"解析任务数据失败 {movie_id}: {error}")
+            return self._decode_task(movie_id, data)
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as error:
+            self.Log.error(f"解析{label}数据失败 {movie_id}: {error}")
             return None
 
-    def get_tasks(self):
-        pattern = self._get_key("douban:movie:task:*")
-        keys: t.List[bytes] = self.redis.keys(pattern)
-        self.Log.info(f"获取所有任务，匹配模式: {pattern}")
+    def _iter_tasks(self, namespace: str, statuses: t.Optional[t.Iterable["SpiderStatus"]], label: str) -> t.Iterator["MovieTask"]:
+        """
+        以游标方式逐批遍历任务, 不阻塞 Redis, 内存中只保留一批
 
-        tasks: t.List["MovieTask"] = []
-        for key in keys:
-            key: bytes
-            value: bytes = self.redis.get(key.decode("UTF-8"))
-            if not value:
-                self.Log.warning(f"任务 {key.decode('UTF-8')} 数据为空, 跳过")
+        未指定状态时 HSCAN 任务哈希; 指定状态时 SSCAN 状态集合, 每批 ID 用一次 HMGET 取回任务数据.
+        """
+        for batch in self.__iter_task_batches(namespace, statuses, label):
+            for movie_id, value in batch:
+                if not value:
+                    continue
+                try:
+                    yield self._decode_task(movie_id, value)
+                except (json.JSONDecodeError, KeyError, ValueError, TypeError) as error:
+                    self.Log.warning(f"解析{label}数据失败, 跳过: {error}")
+
+    def __iter_task_batches(self, namespace: str, statuses: t.Optional[t.Iterable["SpiderStatus"]], label: str) -> t.Iterator[t.List[t.Tuple[bytes, bytes]]]:
+        if statuses is None:
+            for bucket in range(self.task_buckets):
+                task_key = self._task_key(namespace, bucket)
+                self.Log.info(f"遍历所有{label}: {task_key}")
+                yield from DoubanUtils.batched(self.redis.hscan_iter(task_key, count=self.SCAN_BATCH_SIZE), self.SCAN_BATCH_SIZE)
+            return
+
+        for status in statuses:
+            for bucket in range(self.task_buckets):
+                task_key, status_key = self._task_key(namespace, bucket), self._task_status_key(namespace, status, bucket)
+                self.Log.info(f"遍历状态为 {status.value} 的{label}: {status_key}")
+                for batch in DoubanUtils.batched(self.redis.sscan_iter(status_key, count=self.SCAN_BATCH_SIZE), self.SCAN_BATCH_SIZE):
+                    yield list(zip(batch, self.redis.hmget(task_key, batch)))
+
+    def _get_tasks(self, namespace: str, statuses: t.Optional[t.Iterable["SpiderStatus"]], label: str) -> t.List["MovieTask"]:
+        return list(self._iter_tasks(namespace, statuses, label))
+
+    def _filter_members(
+        self,
+        ids: t.Sequence[str],
+        keys: t.Iterable[str] = (),
+        namespace: t.Optional[str] = None,
+        statuses: t.Iterable["SpiderStatus"] = (),
+    ) -> t.List[str]:
+        """
+        一次往返判断一批ID是否属于任一集合 (每个集合一次 SMISMEMBER), 任务状态集合按桶分组判断
+
+        :param ids: 待判断的ID
+        :type ids: list
+        :param keys: 共用的集合键
+        :type keys: list
+        :param namespace: 任务命名空间
+        :type namespace: str
+        :param statuses: 任务状态
+        :type statuses: list
+        :return: 不属于任何集合的ID, 保持原顺序
+        :rtype: list
+        """
+        if not ids:
+            return []
+
+        groups: t.List[t.Tuple[str, t.List[str]]] = [(key, list(ids)) for key in keys]
+        if namespace is not None:
+            buckets: t.Dict[int, t.List[str]] = {}
+            for movie_id in ids:
+                buckets.setdefault(self._task_bucket(movie_id), []).append(movie_id)
+            groups.extend((self._task_status_key(namespace, status, bucket), members) for status in statuses for bucket, members in buckets.items())
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, members in groups:
+            pipeline.smismember(key, members)
+        found = {movie_id for (_, members), flags in zip(groups, pipeline.execute()) for movie_id, flag in zip(members, flags) if flag}
+
+        return [movie_id for movie_id in ids if movie_id not in found]
+
+    def _clean_tasks(self, namespace: str, status: "SpiderStatus", label: str) -> int:
+        """
+        批量删除指定状态的任务, 每批在服务端原子地弹出 ID 并删除任务数据
+
+        :return: 删除的任务数量
+        :rtype: int
+        """
+        removed = 0
+        for bucket in range(self.task_buckets):
+            task_key, status_key = self._task_key(namespace, bucket), self._task_status_key(namespace, status, bucket)
+            while True:
+                count = self.clean_tasks_script(keys=[task_key, status_key], args=[self.SCAN_BATCH_SIZE])
+                removed += count
+                if count < self.SCAN_BATCH_SIZE:
+                    break
+
+        self.Log.info(f"清理状态为 {status.value} 的{label} {removed} 个")
+        return removed
+
+    def _transition_task(
+        self,
+        namespace: str,
+        movie_id: str,
+        status: "SpiderStatus",
+        label: str,
+        error_msg: str = "",
+        retry: bool = False,
+        pipeline: t.Optional["Pipeline"] = None,
+    ) -> t.Optional[bool]:
+        """
+        一次往返完成任务状态转换, 由 Lua 脚本在服务端校验状态图并更新时间和重试次数, 多个爬虫进程并发时不会相互覆盖
+
+        :param namespace: 任务命名空间
+        :type namespace: str
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param status: 目标状态
+        :type status: SpiderStatus
+        :param label: 日志中的任务名称
+        :type label: str
+        :param error_msg: 错误信息
+        :type error_msg: str
+        :param retry: 是否为失败转换, 失败时累加重试次数并按指数退避加入重试队列, 超过最大重试次数后进入死信集合
+        :type retry: bool
+        :param pipeline: 传入时只把脚本调用加入管道, 由调用方执行管道后用 _log_transition 处理结果
+        :type pipeline: Pipeline
+        :return: 是否转换成功, 使用管道时为 None
+        :rtype: bool
+        """
+        sources = [self.TASK_STATUS_CODES.get(source) for source, targets in self.TASK_TRANSITIONS.items() if status in targets]
+        bucket = self._task_bucket(movie_id)
+        keys = [self._task_key(namespace, bucket), self._task_status_key(namespace, status, bucket), self._task_retry_key(namespace, bucket), self._task_dead_key(namespace, bucket)]
+        keys.extend(self._task_status_key(namespace, other, bucket) for other in SpiderStatus if other != status)
+        args = [
+            movie_id,
+            self.TASK_STATUS_CODES.get(status),
+            ",".join(sources),
+            time.time(),
+            (error_msg or "")[: self.TASK_ERROR_MAX_LENGTH],
+            int(retry),
+            self.retry_base_delay,
+            self.retry_max_delay,
+            random.uniform(0, self.retry_jitter),
+        ]
+
+        if pipeline is not None:
+            self.transition_task_script(keys=keys, args=args, client=pipeline)
+            return None
+
+        try:
+            result = self.transition_task_script(keys=keys, args=args)
+        except Exception as error:
+            self.Log.error(f"{label} {movie_id} 状态转换为 {status.value} 失败: {error}")
+            return False
+        return self._log_transition(movie_id, status, label, result)
+
+    def _log_transition(self, movie_id: str, status: "SpiderStatus", label: str, result: t.List[t.Any]) -> bool:
+        success, current, eligible = result
+        if not success:
+            if current:
+                self.Log.warning(f"{label} {movie_id} 不允许从 {self.__status_from_code(current).value} 转换为 {status.value}, 忽略")
+            else:
+                self.Log.warning(f"{label} {movie_id} 不存在于缓存, 无法转换为 {status.value}")
+        elif eligible < 0:
+            self.Log.warning(f"{label} {movie_id} 超过最大重试次数, 进入死信集合")
+        elif eligible > 0:
+            self.Log.info(f"{label} {movie_id} 将在 {eligible - time.time():.0f} 秒后重试")
+        return bool(success)
+
+    def configure_retry(self, base_delay: float, max_delay: float, jitter: float = 0.2) -> None:
+        """
+        设置失败任务重试的指数退避参数
+
+        :param base_delay: 第一次重试的间隔 (秒), 之后每次翻倍
+        :type base_delay: float
+        :param max_delay: 重试间隔上限 (秒)
+        :type max_delay: float
+        :param jitter: 随机抖动系数, 避免同时失败的任务同时重试
+        :type jitter: float
+        """
+        self.retry_base_delay, self.retry_max_delay, self.retry_jitter = base_delay, max_delay, jitter
+
+    def _pop_due_retries(self, namespace: str, limit: int) -> t.List[str]:
+        ids: t.List[str] = []
+        # 从随机的桶开始, 避免总是优先弹出前面几个桶的任务
+        offset = random.randrange(self.task_buckets)
+        for index in range(self.task_buckets):
+            if len(ids) >= limit:
+                break
+            bucket = (offset + index) % self.task_buckets
+            popped = self.pop_due_retries_script(keys=[self._task_retry_key(namespace, bucket)], args=[time.time(), limit - len(ids)])
+            ids.extend(movie_id.decode("UTF-8") for movie_id in popped)
+        return ids
+
+    def _next_retry_time(self, namespace: str) -> t.Optional[float]:
+        pipeline = self.redis.pipeline(transaction=False)
+        for bucket in range(self.task_buckets):
+            pipeline.zrange(self._task_retry_key(namespace, bucket), 0, 0, withscores=True)
+        heads = [head[0][1] for head in pipeline.execute() if head]
+        return min(heads) if heads else None
+
+    def _schedule_failed_tasks(self, namespace: str, label: str) -> int:
+        """
+        将没有重试计划也不在死信集合中的失败任务 (例如旧版本遗留) 加入重试队列, 在一个基础间隔内均匀分散
+
+        :return: 加入重试队列的任务数量
+        :rtype: int
+        """
+        scheduled = 0
+        for bucket in range(self.task_buckets):
+            retry_key, dead_key = self._task_retry_key(namespace, bucket), self._task_dead_key(namespace, bucket)
+            failed = list(self.redis.sscan_iter(self._task_status_key(namespace, SpiderStatus.FAILED, bucket), count=self.SCAN_BATCH_SIZE))
+            if not failed:
                 continue
 
-            value_asdict: t.Dict[str, t.Any] = json.loads(value)
-            task = MovieTask(
-                movie_id=value_asdict.get("movie_id"),
-                status=SpiderStatus(value_asdict.get("status")),
-                create_time=value_asdict.get("create_time"),
-                update_time=value_asdict.get("update_time"),
-                retry_count=value_asdict.get("retry_count"),
-                max_retries=value_asdict.get("max_retries"),
-                error_msg=value_asdict.get("error_msg"),
-                data=value_asdict.get("data"),
-            )
-            tasks.append(task)
-
-        return tasks
+            pipeline = self.redis.pipeline(transaction=False)
+            for movie_id in failed:
+                pipeline.zscore(retry_key, movie_id)
+                pipeline.sismember(dead_key, movie_id)
+            results = pipeline.execute()
 
-    def clean_completed_tasks(self):
-        pattern = self._get_key("douban:movie:task:*")
-        keys: t.List[bytes] = self.redis.keys(pattern)
-        self.Log.info(f"清理已完成任务，匹配模式: {pattern}")
+            now = time.time()
+            orphans = {movie_id: now + random.uniform(0, self.retry_base_delay) for movie_id, due, dead in zip(failed, results[::2], results[1::2]) if due is None and not dead}
+            if orphans:
+                self.redis.zadd(retry_key, orphans, nx=True)
+                scheduled += len(orphans)
+
+        if scheduled:
+            self.Log.info(f"将 {scheduled} 个未计划重试的失败{label}加入重试队列")
+        return scheduled
+
+    def pop_due_retries(self, limit: int = 20) -> t.List[str]:
+        return self._pop_due_retries(self.TASK_NAMESPACE, limit)
+
+    def pop_due_comment_retries(self, limit: int = 20) -> t.List[str]:
+        return self._pop_due_retries(self.COMMENT_TASK_NAMESPACE, limit)
+
+    def next_retry_time(self) -> t.Optional[float]:
+        return self._next_retry_time(self.TASK_NAMESPACE)
+
+    def next_comment_retry_time(self) -> t.Optional[float]:
+        return self._next_retry_time(self.COMMENT_TASK_NAMESPACE)
+
+    def schedule_failed_tasks(self) -> int:
+        return self._schedule_failed_tasks(self.TASK_NAMESPACE, "任务")
+
+    def schedule_failed_comment_tasks(self) -> int:
+        return self._schedule_failed_tasks(self.COMMENT_TASK_NAMESPACE, "短评任务")
+
+    def migrate_legacy_tasks(self) -> int:
+        """
+        将旧版逐个字符串键保存的任务 ({namespace}:task:{movie_id}) 迁移到任务哈希, 以 SCAN 遍历, 不阻塞 Redis
 
+        :return: 迁移的任务数量
+        :rtype: int
+        """
+        marker = "douban:movie:tasks:migrated"
+        if self.get(marker):
+            return 0
+
+        migrated = 0
+        for namespace, label in ((self.TASK_NAMESPACE, "任务"), (self.COMMENT_TASK_NAMESPACE, "短评任务")):
+            keys: t.List[bytes] = []
+            for key in self.redis.scan_iter(match=self._get_key(f"{namespace}:task:*"), count=self.SCAN_BATCH_SIZE):
+                keys.append(key)
+                if len(keys) >= self.SCAN_BATCH_SIZE:
+                    migrated += self.__migrate_legacy_batch(namespace, keys, label)
+                    keys = []
+            if keys:
+                migrated += self.__migrate_legacy_batch(namespace, keys, label)
+
+        self.set(marker, "1")
+        self.Log.info(f"迁移旧版任务 {migrated} 个")
+        return migrated
+
+    def __migrate_legacy_batch(self, namespace: str, keys: t.List[bytes], label: str) -> int:
+        migrated: t.List[bytes] = []
+        pipeline = self.redis.pipeline(transaction=False)
         for key in keys:
-            key: bytes
-            value: bytes = self.redis.get(key.decode("UTF-8"))
+            pipeline.get(key)
+        for key, value in zip(keys, pipeline.execute()):
             if not value:
-                self.Log.warning(f"任务 {key.decode('UTF-8')} 数据为空, 跳过")
                 continue
+            try:
+                task = self._decode_task(key.decode("UTF-8").rsplit(":", 1)[-1], value)
+            except (json.JSONDecodeError, KeyError, ValueError, TypeError) as error:
+                self.Log.warning(f"旧版{label} {key.decode('UTF-8')} 数据无法解析, 跳过: {error}")
+                continue
+            if self._save_task(namespace, task, label):
+                migrated.append(key)
+
+        if migrated:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in migrated:
+                pipeline.delete(key)
+            pipeline.execute()
+        return len(migrated)
+
+    def migrate_task_encoding(self) -> int:
+        """
+        将任务哈希中的 JSON 编码改写为紧凑编码, 以 HSCAN 遍历, 每批在服务端比较旧值后写入
+
+        :return: 改写的任务数量
+        :rtype: int
+        """
+        migrated = 0
+        for namespace, label, bucket in ((namespace, label, bucket) for namespace, label in ((self.TASK_NAMESPACE, "任务"), (self.COMMENT_TASK_NAMESPACE, "短评任务")) for bucket in range(self.task_buckets)):
+            task_key = self._task_key(namespace, bucket)
+            args: t.List[t.Union[str, bytes]] = []
+            for movie_id, value in self.redis.hscan_iter(task_key, count=self.SCAN_BATCH_SIZE):
+                if not value.startswith(b"{"):
+                    continue
+                try:
+                    args.extend((movie_id, value, self._encode_task(self._decode_task(movie_id, value))))
+                except (json.JSONDecodeError, KeyError, ValueError, TypeError) as error:
+                    self.Log.warning(f"{label} {movie_id.decode('UTF-8')} 数据无法解析, 跳过: {error}")
+                    continue
+                if len(args) >= self.SCAN_BATCH_SIZE * 3:
+                    migrated += self.reencode_tasks_script(keys=[task_key], args=args)
+                    args = []
+            if args:
+                migrated += self.reencode_tasks_script(keys=[task_key], args=args)
+
+        self.Log.info(f"改写任务编码 {migrated} 个")
+        return migrated
+
+    def task_memory_usage(self) -> t.Dict[str, t.Dict[str, int]]:
+        """
+        统计任务相关键的数量和内存占用 (MEMORY USAGE)
+
+        :return: 键 -> {"length": 元素数量, "bytes": 占用字节数}
+        :rtype: dict
+        """
+        keys: t.List[t.Tuple[str, str]] = []
+        for namespace in (self.TASK_NAMESPACE, self.COMMENT_TASK_NAMESPACE):
+            for bucket in range(self.task_buckets):
+                keys.append((self._task_key(namespace, bucket), "hash"))
+                keys.extend((self._task_status_key(namespace, status, bucket), "set") for status in SpiderStatus)
+                keys.append((self._task_retry_key(namespace, bucket), "zset"))
+                keys.append((self._task_dead_key(namespace, bucket), "set"))
+
+        length_commands = {"hash": "HLEN", "set": "SCARD", "zset": "ZCARD"}
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, kind in keys:
+            pipeline.execute_command(length_commands.get(kind), key)
+            pipeline.execute_command("MEMORY USAGE", key, "SAMPLES", "0")
+        results = pipeline.execute()
 
-            value_asdict: t.Dict[str, t.Any] = json.loads(value)
-            status = SpiderStatus(value_asdict.get("status"))
-            if status == SpiderStatus.COMPLETED:
-                self.Log.info(f"删除已完成任务 {key.decode('UTF-8')}")
-                self.redis.delete(key)
+        return {key: {"length": int(length or 0), "bytes": int(size or 0)} for (key, _), length, size in zip(keys, results[::2], results[1::2])}
+
+    def save_task(self, task: "MovieTask"):
+        return self._save_task(self.TASK_NAMESPACE, task, "任务")
+
+    def get_task(self, movie_id: str) -> t.Optional["MovieTask"]:
+        return self._get_task(self.TASK_NAMESPACE, movie_id, "任务")
+
+    def get_tasks(self, statuses: t.Optional[t.Iterable["SpiderStatus"]] = None) -> t.List["MovieTask"]:
+        """
+        获取任务列表
+
+        :param statuses: 只获取指定状态的任务, 为 None 时获取全部任务
+        :type statuses: list
+        :return: 任务列表
+        :rtype: list
+        """
+        return self._get_tasks(self.TASK_NAMESPACE, statuses, "任务")
+
+    def iter_tasks(self, statuses: t.Optional[t.Iterable["SpiderStatus"]] = None) -> t.Iterator["MovieTask"]:
+        return self._iter_tasks(self.TASK_NAMESPACE, statuses, "任务")
+
+    def filter_movie_ids_without_task(self, ids: t.Sequence[str], statuses: t.Iterable["SpiderStatus"]) -> t.List[str]:
+        """
+        过滤掉处于指定状态的任务
+
+        :param ids: 电影ID
+        :type ids: list
+        :param statuses: 任务状态
+        :type statuses: list
+        :return: 不处于这些状态的电影ID
+        :rtype: list
+        """
+        return self._filter_members(ids, namespace=self.TASK_NAMESPACE, statuses=statuses)
+
+    def clean_completed_tasks(self):
+        return self._clean_tasks(self.TASK_NAMESPACE, SpiderStatus.COMPLETED, "任务")
 
     def mark_processing(self, movie_id: str) -> bool:
         self.Log.info(f"标记任务 {movie_id} 为处理中")
-        task = self.get_task(movie_id)
-        task.status = SpiderStatus.PROCESSING
-        task.error_msg = ""
-        return self.save_task(task)
+        return self._transition_task(self.TASK_NAMESPACE, movie_id, SpiderStatus.PROCESSING, "任务")
 
     def mark_parsed(self, movie_id: str) -> bool:
         self.Log.info(f"标记任务 {movie_id} 为信息已解析")
-        task = self.get_task(movie_id)
-        task.status = SpiderStatus.PARSED
-        task.error_msg = ""
-        return self.save_task(task)
+        return self._transition_task(self.TASK_NAMESPACE, movie_id, SpiderStatus.PARSED, "任务")
 
-    def mark_completed(self, movie_id: str, data: dict = None) -> bool:
+    def mark_completed(self, movie_id: str) -> bool:
         self.Log.info(f"标记任务 {movie_id} 为已完成")
-        task = self.get_task(movie_id)
-        task.status = SpiderStatus.COMPLETED
-        task.error_msg = ""
-        task.data = JsonSerializerHelper.serialize(data)
-        return self.save_task(task)
+        return self._transition_task(self.TASK_NAMESPACE, movie_id, SpiderStatus.COMPLETED, "任务")
 
     def mark_failed(self, movie_id: str, error_msg: str) -> bool:
         self.Log.info(f"标记任务 {movie_id} 为失败，错误信息: {error_msg}")
-        task = self.get_task(movie_id)
-        task.status = SpiderStatus.FAILED
-        task.error_msg = error_msg
-        task.retry_count += 1
-        return self.save_task(task)
+        return self._transition_task(self.TASK_NAMESPACE, movie_id, SpiderStatus.FAILED, "任务", error_msg=error_msg, retry=True)
 
     def save_db_movie_ids(self, ids: t.List[str]):
         key = self._get_key("douban:movie:db:movie_ids")
         self.Log.info(f"保存数据库电影ID列表到缓存: {key}")
         self.redis.sadd(key, *ids)
+        if self.seen_filter is not None:
+            self.seen_filter.update(ids)
 
     def get_db_movie_ids(self) -> t.Set[str]:
         key = self._get_key("douban:movie:db:movie_ids")
@@ -168,132 +724,330 @@ class DoubanCacheManager(RedisCacheManager):
 
         return {movie_id.decode("UTF-8") for movie_id in ids}
 
+    def iter_db_movie_ids(self) -> t.Iterator[str]:
+        """以 SSCAN 遍历缓存中的数据库电影ID"""
+        key = self._get_key("douban:movie:db:movie_ids")
+        self.Log.info(f"遍历缓存中的数据库电影ID: {key}")
+        for movie_id in self.redis.sscan_iter(key, count=self.SCAN_BATCH_SIZE):
+            yield movie_id.decode("UTF-8")
+
     def add_to_db_movie_ids(self, movie_id: str):
         key = self._get_key("douban:movie:db:movie_ids")
         self.Log.info(f"添加电影ID {movie_id} 到数据库电影ID列表缓存: {key}")
         self.redis.sadd(key, movie_id)
+        if self.seen_filter is not None:
+            self.seen_filter.add(movie_id)
 
-    def save_comment_task(self, task: "MovieTask"):
-        try:
-            key = f"douban:movie:comment:task:{task.movie_id}"
-            task.update_time = time.time()
+    def enable_seen_filter(self, capacity: t.Optional[int] = None, error_rate: float = 0.001) -> None:
+        """
+        启用已入库电影ID的布隆过滤器, 并用 SSCAN 从缓存加载现有ID
 
-            task_data = asdict(task)
-            task_data.update(status=task.status.value)
-            self.Log.info(f"短评任务数据: {task_data}")
+        布隆过滤器判定不存在的ID无需访问 Redis; 其他进程新增的ID只有重新加载后才能感知, 最坏情况是重复请求一次详情页.
 
-            self.Log.info(f"保存短评任务 {key} 到缓存")
-            self.set(key=key, value=json.dumps(task_data, ensure_ascii=False, separators=(",", ":")))
-            return True
-        except Exception as error:
-            self.Log.error(f"保存短评任务 {task.movie_id} 失败: {error}")
-            return False
+        :param capacity: 预计ID数量, 默认取当前集合大小的两倍
+        :type capacity: int
+        :param error_rate: 期望误判率
+        :type error_rate: float
+        """
+        key = self._get_key("douban:movie:db:movie_ids")
+        capacity = capacity or max(self.redis.scard(key) * 2, 10000)
+        seen_filter = BloomFilter(capacity=capacity, error_rate=error_rate)
+        for movie_id in self.redis.sscan_iter(key, count=1000):
+            seen_filter.add(movie_id.decode("UTF-8"))
 
-    def get_comment_task(self, movie_id: str) -> t.Optional["MovieTask"]:
-        key = self._get_key(f"douban:movie:comment:task:{movie_id}")
-        self.Log.info(f"从缓存获取短评任务 {key}")
-        data = self.redis.get(key)
+        self.seen_filter = seen_filter
+        self.Log.info(f"已启用电影ID布隆过滤器: 容量 {capacity}, 已加载 {len(seen_filter)} 个ID")
 
-        if not data:
-            self.Log.warning(f"短评任务 {movie_id} 不存在于缓存")
-            return None
+    def filter_unseen_movie_ids(self, ids: t.Sequence[str]) -> t.List[str]:
+        """
+        批量判断电影ID是否已入库, 一次往返完成 (SMISMEMBER)
 
-        try:
-            task_data = json.loads(data)
-            task_data["status"] = SpiderStatus(task_data["status"])
-            self.Log.info(f"{movie_id} 短评任务数据: {task_data}")
-            return MovieTask(**task_data)
-        except (json.JSONDecodeError, KeyError, ValueError) as error:
-            print(f"解析短评任务数据失败 {movie_id}: {error}")
-            return None
+        :param ids: 待判断的电影ID
+        :type ids: list
+        :return: 未入库的电影ID, 保持原顺序
+        :rtype: list
+        """
+        if not ids:
+            return []
 
-    def get_comment_tasks(self):
-        pattern = self._get_key("douban:movie:comment:task:*")
-        keys: t.List[bytes] = self.redis.keys(pattern)
-        self.Log.info(f"获取所有短评任务，匹配模式: {pattern}")
+        if self.seen_filter is not None:
+            candidates = [movie_id for movie_id in ids if movie_id in self.seen_filter]
+        else:
+            candidates = list(ids)
 
-        tasks: t.List["MovieTask"] = []
-        for key in keys:
-            key: bytes
-            value: bytes = self.redis.get(key.decode("UTF-8"))
-            if not value:
-                self.Log.warning(f"短评任务 {key.decode('UTF-8')} 数据为空, 跳过")
-                continue
+        seen: t.Set[str] = set()
+        if candidates:
+            key = self._get_key("douban:movie:db:movie_ids")
+            flags = self.redis.smismember(key, candidates)
+            seen = {movie_id for movie_id, flag in zip(candidates, flags) if flag}
 
-            value_asdict: t.Dict[str, t.Any] = json.loads(value)
-            task = MovieTask(
-                movie_id=value_asdict.get("movie_id"),
-                status=SpiderStatus(value_asdict.get("status")),
-                create_time=value_asdict.get("create_time"),
-                update_time=value_asdict.get("update_time"),
-                retry_count=value_asdict.get("retry_count"),
-                max_retries=value_asdict.get("max_retries"),
-                error_msg=value_asdict.get("error_msg"),
-                data=value_asdict.get("data"),
-            )
-            tasks.append(task)
-
-        return tasks
+        self.Log.info(f"批量检查电影ID: 共 {len(ids)} 个, Redis 检查 {len(candidates)} 个, 已入库 {len(seen)} 个")
+        return [movie_id for movie_id in ids if movie_id not in seen]
 
-    def clean_comment_completed_tasks(self):
-        pattern = self._get_key("douban:movie:comment:task:*")
-        keys: t.List[bytes] = self.redis.keys(pattern)
-        self.Log.info(f"清理已完成短评任务，匹配模式: {pattern}")
+    def save_comment_task(self, task: "MovieTask"):
+        return self._save_task(self.COMMENT_TASK_NAMESPACE, task, "短评任务")
 
-        for key in keys:
-            key: bytes
-            value: bytes = self.redis.get(key.decode("UTF-8"))
-            if not value:
-                self.Log.warning(f"短评任务 {key.decode('UTF-8')} 数据为空, 跳过")
-                continue
+    def get_comment_task(self, movie_id: str) -> t.Optional["MovieTask"]:
+        return self._get_task(self.COMMENT_TASK_NAMESPACE, movie_id, "短评任务")
 
-            value_asdict: t.Dict[str, t.Any] = json.loads(value)
-            status = SpiderStatus(value_asdict.get("status"))
-            if status == SpiderStatus.COMPLETED:
-                self.Log.info(f"删除已完成短评任务 {key.decode('UTF-8')}")
-                self.redis.delete(key)
+    def get_comment_tasks(self, statuses: t.Optional[t.Iterable["SpiderStatus"]] = None) -> t.List["MovieTask"]:
+        return self._get_tasks(self.COMMENT_TASK_NAMESPACE, statuses, "短评任务")
+
+    def iter_comment_tasks(self, statuses: t.Optional[t.Iterable["SpiderStatus"]] = None) -> t.Iterator["MovieTask"]:
+        return self._iter_tasks(self.COMMENT_TASK_NAMESPACE, statuses, "短评任务")
+
+    def filter_pending_comment_movie_ids(self, ids: t.Sequence[str]) -> t.List[str]:
+        """
+        过滤掉短评已完成 (持久化集合) 和等待重试 (失败状态) 的电影
+
+        :param ids: 电影ID
+        :type ids: list
+        :return: 需要获取短评的电影ID, 保持原顺序
+        :rtype: list
+        """
+        return self._filter_members(
+            ids,
+            [self._get_key("douban:movie:durable:comment:completed")],
+            namespace=self.COMMENT_TASK_NAMESPACE,
+            statuses=[SpiderStatus.FAILED],
+        )
+
+    def clean_comment_completed_tasks(self):
+        return self._clean_tasks(self.COMMENT_TASK_NAMESPACE, SpiderStatus.COMPLETED, "短评任务")
 
     def mark_comment_processing(self, movie_id: str) -> bool:
         self.Log.info(f"标记短评任务 {movie_id} 为处理中")
-        task = self.get_comment_task(movie_id)
-        task.status = SpiderStatus.PROCESSING
-        task.error_msg = ""
-        return self.save_comment_task(task)
+        return self._transition_task(self.COMMENT_TASK_NAMESPACE, movie_id, SpiderStatus.PROCESSING, "短评任务")
 
     def mark_comment_parsed(self, movie_id: str) -> bool:
         self.Log.info(f"标记短评任务 {movie_id} 为信息已解析")
-        task = self.get_comment_task(movie_id)
-        task.status = SpiderStatus.PARSED
-        task.error_msg = ""
-        return self.save_comment_task(task)
+        return self._transition_task(self.COMMENT_TASK_NAMESPACE, movie_id, SpiderStatus.PARSED, "短评任务")
 
-    def mark_comment_completed(self, movie_id: str, data: dict = None) -> bool:
+    def mark_comment_completed(self, movie_id: str) -> bool:
         self.Log.info(f"标记短评任务 {movie_id} 为已完成")
-        task = self.get_comment_task(movie_id)
-        task.status = SpiderStatus.COMPLETED
-        task.error_msg = ""
-        task.data = JsonSerializerHelper.serialize(data)
-        return self.save_comment_task(task)
+        return self._transition_task(self.COMMENT_TASK_NAMESPACE, movie_id, SpiderStatus.COMPLETED, "短评任务")
 
     def mark_comment_failed(self, movie_id: str, error_msg: str) -> bool:
         self.Log.info(f"标记短评任务 {movie_id} 为失败，错误信息: {error_msg}")
-        task = self.get_comment_task(movie_id)
-        task.status = SpiderStatus.FAILED
-        task.error_msg = error_msg
-        task.retry_count += 1
-        return self.save_comment_task(task)
+        return self._transition_task(self.COMMENT_TASK_NAMESPACE, movie_id, SpiderStatus.FAILED, "短评任务", error_msg=error_msg, retry=True)
+
+    def save_comment_expected_pages(self, movie_id: str, sort: str, pages: int) -> None:
+        """
+        记录并行分页模式下某个电影排序的总页数
+
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param sort: 排序方式
+        :type sort: str
+        :param pages: 总页数
+        :type pages: int
+        """
+        key = self._movie_key("douban:movie:comment:pages:expected", movie_id, sort)
+        self.Log.info(f"保存电影 {movie_id} 分类 {sort} 短评总页数 {pages}: {key}")
+        self.redis.set(key, pages)
+
+    def mark_comment_page_done(self, movie_id: str, sort: str, start: int) -> t.Tuple[int, t.Optional[int]]:
+        """
+        记录并行分页模式下已完成的页, 一次往返返回已完成页数和总页数
+
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param sort: 排序方式
+        :type sort: str
+        :param start: 页起始偏移
+        :type start: int
+        :return: (已完成页数, 总页数), 总页数未知时为 None
+        :rtype: tuple
+        """
+        done_key = self._movie_key("douban:movie:comment:pages:done", movie_id, sort)
+        expected_key = self._movie_key("douban:movie:comment:pages:expected", movie_id, sort)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.sadd(done_key, start)
+        pipeline.scard(done_key)
+        pipeline.get(expected_key)
+        _, done, expected = pipeline.execute()
+
+        return int(done), int(expected) if expected is not None else None
+
+    def clean_comment_pages(self, movie_id: str, sort: str) -> None:
+        self.redis.delete(
+            self._movie_key("douban:movie:comment:pages:done", movie_id, sort),
+            self._movie_key("douban:movie:comment:pages:expected", movie_id, sort),
+        )
+
+    def save_comment_checkpoint(self, movie_id: str, sort: str, start: int) -> None:
+        """
+        保存短评分页断点, 记录下一次应从哪个偏移继续获取
+
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param sort: 排序方式
+        :type sort: str
+        :param start: 下一页起始偏移
+        :type start: int
+        """
+        key = self._movie_key("douban:movie:comment:checkpoint", movie_id)
+        self.Log.info(f"保存电影 {movie_id} 分类 {sort} 短评断点 {start}: {key}")
+        self.redis.hset(key, sort, start)
+
+    def get_comment_checkpoints(self, movie_id: str) -> t.Dict[str, int]:
+        """
+        获取电影各排序方式的短评分页断点
+
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :return: 排序方式 -> 下一页起始偏移
+        :rtype: dict
+        """
+        key = self._movie_key("douban:movie:comment:checkpoint", movie_id)
+        checkpoints = self.redis.hgetall(key)
+
+        return {sort.decode("UTF-8"): int(start) for sort, start in checkpoints.items()}
+
+    def clean_comment_checkpoint(self, movie_id: str) -> None:
+        self.redis.delete(self._movie_key("douban:movie:comment:checkpoint", movie_id))
+
+    def get_comment_completed_sorts(self, movie_id: str) -> t.Set[str]:
+        completed_sorts = self.get(self.movie_key("douban:movie:comment:completed_sorts", movie_id)) or ""
+        return set(completed_sorts.split(",")) if completed_sorts else set()
+
+    def add_comment_completed_sort(self, movie_id: str, sort: str) -> t.Set[str]:
+        """
+        记录电影某个排序的短评已全部入库
+
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param sort: 排序方式
+        :type sort: str
+        :return: 已完成的排序方式
+        :rtype: set
+        """
+        completed_sorts = self.get_comment_completed_sorts(movie_id)
+        completed_sorts.add(sort)
+        self.set(self.movie_key("douban:movie:comment:completed_sorts", movie_id), ",".join(sorted(completed_sorts)))
+        return completed_sorts
+
+    def clean_comment_completed_sorts(self, movie_id: str) -> None:
+        self.delete(self.movie_key("douban:movie:comment:completed_sorts", movie_id))
 
     def save_druable_comment_completed(self, movie_id: str):
         key = self._get_key("douban:movie:durable:comment:completed")
         self.Log.info(f"保存持久化已完成短评电影ID {movie_id} 到缓存: {key}")
         self.redis.sadd(key, movie_id)
+        self.invalidate("douban:movie:durable:comment:completed")
 
-    def get_druable_comment_completed(self) -> t.Set[str]:
+    def get_druable_comment_completed(self) -> t.AbstractSet[str]:
         key = self._get_key("douban:movie:durable:comment:completed")
-        self.Log.info(f"从缓存获取持久化已完成短评电影ID列表: {key}")
-        ids = self.redis.smembers(key)
 
-        return {movie_id.decode("UTF-8") for movie_id in ids}
+        def load() -> t.FrozenSet[str]:
+            self.Log.info(f"从缓存获取持久化已完成短评电影ID列表: {key}")
+            return frozenset(movie_id.decode("UTF-8") for movie_id in self.redis.smembers(key))
+
+        return self.get_or_load("douban:movie:durable:comment:completed", load)
+
+    def session(self, batch_size: int = 100) -> "DoubanCacheSession":
+        """
+        创建写回式缓存会话
+
+        :param batch_size: 自动写入的操作数量阈值
+        :type batch_size: int
+        :return: 缓存会话
+        :rtype: DoubanCacheSession
+        """
+        return DoubanCacheSession(self, batch_size)
+
+
+class DoubanCacheSession:
+    """
+    写回式缓存会话: 在内存中合并任务状态更新和分页断点, 调用 flush 时通过一个 Redis 管道一次写入
+
+    同一电影连续相同的状态转换只保留一次, 同一电影排序的断点只保留最新值; 待写入的操作达到 batch_size 时自动写入.
+
+    :param manager: 缓存管理器
+    :type manager: DoubanCacheManager
+    :param batch_size: 自动写入的操作数量阈值
+    :type batch_size: int
+    """
+
+    Log: t.ClassVar["Logger"] = DoubanCacheManager.Log
+
+    def __init__(self, manager: "DoubanCacheManager", batch_size: int = 100):
+        self.manager = manager
+        self.batch_size = batch_size
+
+        # 按顺序排列的待执行状态转换: (命名空间, movie_id, 目标状态, 日志名称, 其他参数)
+        self.transitions: t.List[t.Tuple[str, str, "SpiderStatus", str, t.Dict[str, t.Any]]] = []
+        # (movie_id, sort) -> 下一页起始偏移
+        self.checkpoints: t.Dict[t.Tuple[str, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.transitions) + len(self.checkpoints)
+
+    def __transition(self, namespace: str, movie_id: str, status: "SpiderStatus", label: str, **kwargs) -> None:
+        operation = (namespace, movie_id, status, label, kwargs)
+        # 同一电影的所有操作中, 只跳过与该电影上一次操作完全相同的重复操作
+        previous = next((item for item in reversed(self.transitions) if item[0] == namespace and item[1] == movie_id), None)
+        if previous != operation:
+            self.transitions.append(operation)
+        if len(self) >= self.batch_size:
+            self.flush()
+
+    def mark_comment_parsed(self, movie_id: str) -> None:
+        self.__transition(self.manager.COMMENT_TASK_NAMESPACE, movie_id, SpiderStatus.PARSED, "短评任务")
+
+    def mark_comment_failed(self, movie_id: str, error_msg: str) -> None:
+        self.__transition(self.manager.COMMENT_TASK_NAMESPACE, movie_id, SpiderStatus.FAILED, "短评任务", error_msg=error_msg, retry=True)
+
+    def save_comment_checkpoint(self, movie_id: str, sort: str, start: int) -> None:
+        self.checkpoints[(movie_id, sort)] = start
+        if len(self) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        通过一个管道写入所有待写入的操作
+
+        :return: 写入的操作数量
+        :rtype: int
+        """
+        if not len(self):
+            return 0
+
+        transitions, checkpoints = self.transitions, self.checkpoints
+        self.transitions, self.checkpoints = [], {}
+
+        if self.manager.cluster:
+            # 集群管道不会像单机管道那样在执行前加载脚本, 先在所有主节点加载状态转换脚本
+            try:
+                self.manager.redis.script_load(self.manager.TRANSITION_TASK_SCRIPT)
+            except Exception as error:
+                self.Log.warning(f"加载状态转换脚本失败: {error}")
+
+        pipeline = self.manager.redis.pipeline(transaction=False)
+        for namespace, movie_id, status, label, kwargs in transitions:
+            self.manager._transition_task(namespace, movie_id, status, label, pipeline=pipeline, **kwargs)
+        for (movie_id, sort), start in checkpoints.items():
+            pipeline.hset(self.manager._movie_key("douban:movie:comment:checkpoint", movie_id), sort, start)
+
+        try:
+            results = pipeline.execute(raise_on_error=False)
+        except Exception as error:
+            self.Log.error(f"批量写入缓存失败: {error}")
+            return 0
+
+        for (namespace, movie_id, status, label, kwargs), result in zip(transitions, results):
+            if isinstance(result, NoScriptError):
+                # 节点上没有脚本 (如故障转移或 SCRIPT FLUSH 之后), 直接调用脚本, 由脚本对象加载后重新执行
+                self.manager._transition_task(namespace, movie_id, status, label, **kwargs)
+            elif isinstance(result, Exception):
+                self.Log.error(f"{label} {movie_id} 状态转换为 {status.value} 失败: {result}")
+            else:
+                self.manager._log_transition(movie_id, status, label, result)
+
+        self.Log.info(f"批量写入缓存: 状态转换 {len(transitions)} 个, 分页断点 {len(checkpoints)} 个")
+        return len(transitions) + len(checkpoints)
 
 
-RedisManager = DoubanCacheManager()
+# 首次访问属性时才连接 Redis
+RedisManager: "DoubanCacheManager" = LazyManager(DoubanCacheManager)
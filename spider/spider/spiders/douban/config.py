@@ -7,15 +7,29 @@
 @datetime: 2025-12-22 23:05:57 UTC+08:00
 """
 
+import threading
 import typing as t
 
 import yaml
 
 
 class DoubanConfig:
+    # 配置文件只读取一次, 之后返回缓存的结果
+    _config: t.ClassVar[t.Optional[t.Dict[str, t.Any]]] = None
+    _lock: t.ClassVar[threading.Lock] = threading.Lock()
 
     @classmethod
     def load(cls) -> t.Dict[str, t.Any]:
-        with open("config/application.yaml", "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-        return config.get("douban", {})
+        if cls._config is None:
+            with cls._lock:
+                if cls._config is None:
+                    with open("config/application.yaml", "r", encoding="utf-8") as f:
+                        config = yaml.safe_load(f)
+                    cls._config = config.get("douban", {})
+        return cls._config
+
+    @classmethod
+    def reload(cls) -> t.Dict[str, t.Any]:
+        with cls._lock:
+            cls._config = None
+        return cls.load()
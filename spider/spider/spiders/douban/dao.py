@@ -9,14 +9,12 @@
 
 import traceback
 import typing as t
-from collections import namedtuple
 
 from fairylandlogger import LogManager, Logger
 
-from fairylandfuture.database.postgresql import PostgreSQLOperator
-from fairylandfuture.structures.database import PostgreSQLExecuteStructure
+from spider.spiders.douban.database import PostgreSQLPoolOperator
+from spider.spiders.douban.statements import DoubanStatements, PreparedStatement
 from spider.spiders.douban.structures import MovieStructure, MovieArtistStructure
-from spider.spiders.douban.utils import DoubanUtils
 
 Log: "Logger" = LogManager.get_logger("douban-dao", "douban")
 
@@ -24,84 +22,241 @@ Log: "Logger" = LogManager.get_logger("douban-dao", "douban")
 class MovieDAO:
     """电影数据访问对象"""
 
-    def __init__(self, db: "PostgreSQLOperator"):
+    SELECT_MOVIE_IDS: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_select_movie_ids",
+        """
+        select movie_id
+        from movie.tb_movie
+        where deleted is false;
+        """,
+    )
+
+    # 服务端命名游标 (DECLARE) 不能使用预备语句, 只在导入时清理一次
+    ITER_MOVIE_IDS_QUERY: t.ClassVar[str] = SELECT_MOVIE_IDS.query
+
+    INSERT_MOVIE: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_movie",
+        """
+        insert into
+            movie.tb_movie (movie_id, full_name, chinese_name, original_name, release_date, score, summary, icon)
+        values
+            (%(movie_id)s, %(full_name)s, %(chinese_name)s, %(original_name)s, %(release_date)s, %(score)s, %(summary)s, %(icon)s)
+        on conflict (movie_id) do update
+            set movie_id = excluded.movie_id,
+                full_name = excluded.full_name,
+                chinese_name = excluded.chinese_name,
+                original_name = excluded.original_name,
+                release_date = excluded.release_date,
+                score = excluded.score,
+                summary = excluded.summary,
+                icon = excluded.icon,
+                updated_at = now()
+        returning id;
+        """,
+    )
+
+    UPSERT_ARTISTS: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_upsert_artists",
+        """
+        insert into
+            movie.tb_artist (artist_id, name)
+        select artist_id, name
+        from unnest(%(artist_ids)s::varchar[], %(names)s::varchar[]) as artist (artist_id, name)
+        on conflict (artist_id) do update
+            set name = excluded.name,
+                updated_at = now()
+        returning artist_id, id;
+        """,
+    )
+
+    # 角色 -> 批量插入关系的语句, 表名不能作为参数传入, 每个关系表各注册一条
+    INSERT_ARTIST_RELATIONS: t.ClassVar[t.Dict[str, "PreparedStatement"]] = {
+        role: DoubanStatements.register(
+            f"douban_insert_movie_{role}_relations",
+            f"""
+            insert into
+                movie.tb_movie_{role}_artist_relation (movie_id, artist_id)
+            select %(movie_id)s::varchar, artist_id
+            from unnest(%(artist_ids)s::integer[]) as artist_id
+            on conflict (movie_id, artist_id) do update
+                set updated_at = now();
+            """,
+        )
+        for role in ("director", "writer", "actor")
+    }
+
+    INSERT_TYPE_RELATIONS: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_movie_type_relations",
+        """
+        insert into
+            movie.tb_movie_type_relation (movie_id, type_id)
+        select %(movie_id)s::varchar, id
+        from movie.tb_movie_type
+        where name = any (%(type_names)s::varchar[])
+          and deleted is false
+        on conflict (movie_id, type_id) do update
+            set updated_at = now();
+        """,
+    )
+
+    INSERT_COUNTRY_RELATIONS: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_movie_country_relations",
+        """
+        with country_upsert as (
+            insert into movie.tb_movie_country (name)
+                select name
+                from unnest(%(country_names)s::varchar[]) as name
+                on conflict (name) do update
+                    set updated_at = now()
+                returning id
+            )
+        insert
+        into
+            movie.tb_movie_country_relation (movie_id, country_id)
+        select %(movie_id)s::varchar, id
+        from country_upsert
+        on conflict (movie_id, country_id) do update
+            set updated_at = now();
+        """,
+    )
+
+    def __init__(self, db: "PostgreSQLPoolOperator"):
         self.db = db
 
     def get_movie_id_all(self):
-        query = """
-                select movie_id
-                from movie.tb_movie
-                where deleted is false;
-                """
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"查询所有电影ID, Query: {query}, Vars: {{}}")
-        execute = PostgreSQLExecuteStructure(query, {})
-        MovieRow = namedtuple("MovieRow", ("movie_id",))
-        result: t.Tuple[MovieRow, ...] = self.db.select(execute)
+        Log.debug(f"查询所有电影ID, Query: {self.SELECT_MOVIE_IDS.query}, Vars: {{}}")
+        result = self.db.execute_prepared(self.SELECT_MOVIE_IDS)
 
         if isinstance(result, t.Sequence) and len(result) > 0:
             return [row.movie_id for row in result]
         else:
             return []
 
+    def iter_movie_ids(self, batch_size: int = 2000) -> t.Iterator[str]:
+        """
+        以服务端命名游标逐批读取所有电影ID, 内存占用与电影数量无关; 遍历期间占用一个连接和事务
+
+        :param batch_size: 每次从服务端取回的行数
+        :type batch_size: int
+        :return: 电影ID生成器
+        :rtype: Iterator[str]
+        """
+        Log.debug(f"遍历所有电影ID, Query: {self.ITER_MOVIE_IDS_QUERY}, Batch: {batch_size}")
+        with self.db.transaction() as transaction, transaction.connection.cursor(name="douban_movie_id_cursor") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(self.ITER_MOVIE_IDS_QUERY)
+            for row in cursor:
+                yield row[0]
+
     def insert_movie(self, movie_data: "MovieStructure"):
-        query = """
-                insert into
-                    movie.tb_movie (movie_id, full_name, chinese_name, original_name, release_date, score, summary, icon)
-                values
-                    (%(movie_id)s, %(full_name)s, %(chinese_name)s, %(original_name)s, %(release_date)s, %(score)s, %(summary)s, %(icon)s)
-                on conflict (movie_id) do update
-                    set movie_id = excluded.movie_id,
-                        full_name = excluded.full_name,
-                        chinese_name = excluded.chinese_name,
-                        original_name = excluded.original_name,
-                        release_date = excluded.release_date,
-                        score = excluded.score,
-                        summary = excluded.summary,
-                        icon = excluded.icon,
-                        updated_at = now()
-                returning id;
-                """
         params = movie_data.to_dict()
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"插入电影信息, Query: {query}, Params: {params}")
-
-        execute = PostgreSQLExecuteStructure(query, params)
+        Log.debug(f"插入电影信息, Statement: {self.INSERT_MOVIE.name}, Params: {params}")
 
         try:
-            result = self.db.insert(execute)
+            result = self.db.execute_prepared(self.INSERT_MOVIE, params)
             Log.info(f"插入电影信息, BD Result: {result}")
             Log.info(f"保存电影: {movie_data.full_name} ({movie_data.movie_id})")
         except Exception as error:
             Log.error(f"保存电影失败: {error}")
             raise error
 
+    def save_movie(
+        self,
+        movie_data: "MovieStructure",
+        artists: t.Dict[str, t.Sequence["MovieArtistStructure"]],
+        types: t.Sequence[str],
+        countries: t.Sequence[str],
+    ) -> t.Dict[str, int]:
+        """
+        在一个事务中批量保存电影及其所有关系: 电影一条语句, 所有艺术家一条多行 upsert 并返回 artist_id -> id,
+        每种角色的关系、类型关系、国家/地区关系各一条 unnest 语句, 任一语句失败时整体回滚
+
+        :param movie_data: 电影信息
+        :type movie_data: MovieStructure
+        :param artists: 角色 (director / writer / actor) -> 艺术家列表
+        :type artists: dict
+        :param types: 类型名称
+        :type types: list
+        :param countries: 制片国家/地区名称
+        :type countries: list
+        :return: 艺术家ID -> tb_artist.id
+        :rtype: dict
+        """
+        movie_id = movie_data.movie_id
+        # 同一艺术家可能同时是导演和编剧, 一条 upsert 中同一行不能更新两次, 先去重
+        unique_artists = {artist.artist_id: artist.name for role_artists in artists.values() for artist in role_artists}
+        types, countries = list(dict.fromkeys(types)), list(dict.fromkeys(countries))
+        statements = self.db.statements
+
+        with self.db.transaction() as cursor:
+            statements.execute(cursor, self.INSERT_MOVIE, movie_data.to_dict())
+
+            artist_ids: t.Dict[str, int] = {}
+            if unique_artists:
+                statements.execute(cursor, self.UPSERT_ARTISTS, {"artist_ids": list(unique_artists), "names": list(unique_artists.values())})
+                artist_ids = {row.artist_id: row.id for row in cursor.fetchall()}
+
+            for role, role_artists in artists.items():
+                ids = list(dict.fromkeys(artist_ids[artist.artist_id] for artist in role_artists))
+                if ids:
+                    statements.execute(cursor, self.INSERT_ARTIST_RELATIONS[role], {"movie_id": movie_id, "artist_ids": ids})
+
+            if types:
+                statements.execute(cursor, self.INSERT_TYPE_RELATIONS, {"movie_id": movie_id, "type_names": types})
+
+            if countries:
+                statements.execute(cursor, self.INSERT_COUNTRY_RELATIONS, {"movie_id": movie_id, "country_names": countries})
+
+        Log.info(f"保存电影: {movie_data.full_name} ({movie_id}), 艺术家 {len(artist_ids)} 个, 类型 {len(types)} 个, 国家/地区 {len(countries)} 个")
+        return artist_ids
+
 
 class ArtistDAO:
     """演员数据访问对象"""
 
-    def __init__(self, db: "PostgreSQLOperator"):
+    INSERT_ARTIST: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_artist",
+        """
+        insert into
+            movie.tb_artist (artist_id, name)
+        values
+            (%(artist_id)s, %(name)s)
+        on conflict (artist_id) do update
+            set artist_id = excluded.artist_id,
+                name = excluded.name,
+                updated_at = now()
+        returning id;
+        """,
+    )
+
+    # 角色 -> 插入单条关系的语句
+    INSERT_MOVIE_ARTIST_RELATION: t.ClassVar[t.Dict[str, "PreparedStatement"]] = {
+        role: DoubanStatements.register(
+            f"douban_insert_movie_{role}_relation",
+            f"""
+            insert into
+                movie.tb_movie_{role}_artist_relation (movie_id, artist_id)
+            values
+                (%(movie_id)s, %(artist_id)s)
+            on conflict (movie_id, artist_id) do update
+                set movie_id = excluded.movie_id,
+                    artist_id = excluded.artist_id,
+                    updated_at = now()
+            returning id;
+            """,
+        )
+        for role in ("director", "writer", "actor")
+    }
+
+    def __init__(self, db: "PostgreSQLPoolOperator"):
         self.db = db
 
     def insert_artist(self, artist_data: "MovieArtistStructure"):
-        query = """
-                insert into
-                    movie.tb_artist (artist_id, name)
-                values
-                    (%(artist_id)s, %(name)s)
-                on conflict (artist_id) do update
-                    set artist_id = excluded.artist_id,
-                        name = excluded.name,
-                        updated_at = now()
-                returning id;
-                """
         params = artist_data.to_dict()
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"插入演员信息, Query: {query}, Params: {params}")
+        Log.debug(f"插入演员信息, Statement: {self.INSERT_ARTIST.name}, Params: {params}")
 
-        execute = PostgreSQLExecuteStructure(query, params)
         try:
-            result = self.db.insert(execute)
+            result = self.db.execute_prepared(self.INSERT_ARTIST, params)
             Log.info(f"插入演员信息, BD Result: {result}")
             Log.info(f"保存艺术家: {artist_data.name}")
             return result
@@ -111,50 +266,13 @@ class ArtistDAO:
             raise error
 
     def insert_movie_artist_relation(self, typed: str, movie_id: str, artist_id: int):
-        if typed == "director":
-            query = """
-                    insert into
-                        movie.tb_movie_director_artist_relation (movie_id, artist_id)
-                    values
-                        (%(movie_id)s, %(artist_id)s)
-                    on conflict (movie_id, artist_id) do update
-                        set movie_id = excluded.movie_id,
-                            artist_id = excluded.artist_id,
-                            updated_at = now()
-                    returning id;
-                    """
-        elif typed == "writer":
-            query = """
-                    insert into
-                        movie.tb_movie_writer_artist_relation (movie_id, artist_id)
-                    values
-                        (%(movie_id)s, %(artist_id)s)
-                    on conflict (movie_id, artist_id) do update
-                        set movie_id = excluded.movie_id,
-                            artist_id = excluded.artist_id,
-                            updated_at = now()
-                    returning id;
-                    """
-        else:  # actor
-            query = """
-                    insert into
-                        movie.tb_movie_actor_artist_relation (movie_id, artist_id)
-                    values
-                        (%(movie_id)s, %(artist_id)s)
-                    on conflict (movie_id, artist_id) do update
-                        set movie_id = excluded.movie_id,
-                            artist_id = excluded.artist_id,
-                            updated_at = now()
-                    returning id;
-                    """
+        # 未知角色按演员处理
+        statement = self.INSERT_MOVIE_ARTIST_RELATION.get(typed, self.INSERT_MOVIE_ARTIST_RELATION.get("actor"))
         params = {"movie_id": movie_id, "artist_id": artist_id}
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"插入电影-{typed}关系, Query: {query}, Params: {params}")
-
-        execute = PostgreSQLExecuteStructure(query, params)
+        Log.debug(f"插入电影-{typed}关系, Statement: {statement.name}, Params: {params}")
 
         try:
-            result = self.db.insert(execute)
+            result = self.db.execute_prepared(statement, params)
             Log.info(f"插入电影-艺术家关系, BD Result: {result}")
             Log.info(f"保存电影-艺术家关系: movie_id={movie_id}, artist_id={artist_id}, type={typed}")
         except Exception as error:
@@ -165,21 +283,53 @@ class ArtistDAO:
 class MovieTypeDAO:
     """电影类型数据访问对象"""
 
-    def __init__(self, db: "PostgreSQLOperator"):
+    SELECT_ALL_TYPES: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_select_movie_types",
+        """
+        select id, name
+        from movie.tb_movie_type
+        where deleted is false
+        order by id;
+        """,
+    )
+
+    SELECT_ID_BY_NAME: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_select_movie_type_id",
+        """
+        select id
+        from movie.tb_movie_type
+        where name = %(type_name)s
+          and deleted is false;
+        """,
+    )
+
+    INSERT_MOVIE_TYPE_RELATION: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_movie_type_relation",
+        """
+        with type_lookup as (select id as type_id
+                             from movie.tb_movie_type
+                             where name = %(type_name)s
+                               and deleted is false
+                             )
+        insert
+        into
+            movie.tb_movie_type_relation (movie_id, type_id)
+        select %(movie_id)s::varchar, type_id
+        from type_lookup
+        on conflict (movie_id, type_id) do update
+            set movie_id = excluded.movie_id,
+                type_id = excluded.type_id,
+                updated_at = now()
+        returning id;
+        """,
+    )
+
+    def __init__(self, db: "PostgreSQLPoolOperator"):
         self.db = db
 
     def get_all_types(self):
-        query = """
-                select id, name
-                from movie.tb_movie_type
-                where deleted is false
-                order by id;
-                """
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"查询所有电影类型, Query: {query}, Vars: {{}}")
-        execute = PostgreSQLExecuteStructure(query, {})
-        MovieTypeRow = namedtuple("MovieTypeRow", ("id", "name"))
-        result: t.Tuple[MovieTypeRow, ...] = self.db.select(execute)
+        Log.debug(f"查询所有电影类型, Query: {self.SELECT_ALL_TYPES.query}, Vars: {{}}")
+        result = self.db.execute_prepared(self.SELECT_ALL_TYPES)
 
         if isinstance(result, t.Sequence) and len(result) > 0:
             return [{"id": row.id, "name": row.name} for row in result]
@@ -187,23 +337,13 @@ class MovieTypeDAO:
             return []
 
     def get_id_by_name(self, type_name: str) -> t.Optional[int]:
-        query = """
-                select id
-                from movie.tb_movie_type
-                where name = %(type_name)s
-                  and deleted is false;
-                """
         params = {"type_name": type_name}
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"查询电影类型ID, Query: {query}, Params: {params}")
-
-        execute = PostgreSQLExecuteStructure(query, params)
+        Log.debug(f"查询电影类型ID, Statement: {self.SELECT_ID_BY_NAME.name}, Params: {params}")
 
         try:
-            MovieTypeRow = namedtuple("MovieTypeRow", ("id",))
-            result: t.Tuple[MovieTypeRow, ...] = self.db.select(execute)
+            result = self.db.execute_prepared(self.SELECT_ID_BY_NAME, params)
             Log.info(f"查询电影类型ID, BD Result: {result}")
-            if result and len(result) > 0:
+            if isinstance(result, t.Sequence) and len(result) > 0:
                 return result[0].id
             else:
                 return None
@@ -213,31 +353,11 @@ class MovieTypeDAO:
 
     def insert_movie_type_relation(self, movie_id: str, type_name: str):
         """插入电影类型关系"""
-        query = """
-                with type_lookup as (select id as type_id
-                                     from movie.tb_movie_type
-                                     where name = %(type_name)s
-                                       and deleted is false
-                                     )
-                insert
-                into
-                    movie.tb_movie_type_relation (movie_id, type_id)
-                select %(movie_id)s, type_id
-                from type_lookup
-                on conflict (movie_id, type_id) do update
-                    set movie_id = excluded.movie_id,
-                        type_id = excluded.type_id,
-                        updated_at = now()
-                returning id;
-                """
         params = {"movie_id": movie_id, "type_name": type_name}
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"插入电影类型关系, Query: {query}, Params: {params}")
-
-        execute = PostgreSQLExecuteStructure(query, params)
+        Log.debug(f"插入电影类型关系, Statement: {self.INSERT_MOVIE_TYPE_RELATION.name}, Params: {params}")
 
         try:
-            result = self.db.execute(execute)
+            result = self.db.execute_prepared(self.INSERT_MOVIE_TYPE_RELATION, params)
             Log.info(f"插入电影类型关系, BD Result: {result}")
             Log.info(f"保存电影类型关系: movie_id={movie_id}, type_name={type_name}")
         except Exception as error:
@@ -248,35 +368,36 @@ class MovieTypeDAO:
 class MovieCountryDAO:
     """电影国家数据访问对象"""
 
-    def __init__(self, db: "PostgreSQLOperator"):
+    INSERT_MOVIE_COUNTRY_RELATION: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_movie_country_relation",
+        """
+        with country_upsert as (
+            insert into movie.tb_movie_country (name)
+                values (%(country_name)s)
+                on conflict (name) do update
+                    set updated_at = now()
+                returning id
+            )
+        insert
+        into
+            movie.tb_movie_country_relation (movie_id, country_id)
+        select %(movie_id)s::varchar, id
+        from country_upsert
+        on conflict (movie_id, country_id) do update
+            set updated_at = now()
+        returning id;
+        """,
+    )
+
+    def __init__(self, db: "PostgreSQLPoolOperator"):
         self.db = db
 
     def insert_movie_country_relation(self, movie_id: str, country_name: str):
-        query = """
-                with country_upsert as (
-                    insert into movie.tb_movie_country (name)
-                        values (%(country_name)s)
-                        on conflict (name) do update
-                            set updated_at = now()
-                        returning id
-                    )
-                insert
-                into
-                    movie.tb_movie_country_relation (movie_id, country_id)
-                select %(movie_id)s, id
-                from country_upsert
-                on conflict (movie_id, country_id) do update
-                    set updated_at = now()
-                returning id;
-                """
         params = {"movie_id": movie_id, "country_name": country_name}
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"插入电影国家关系, Query: {query}, Params: {params}")
-
-        execute = PostgreSQLExecuteStructure(query, params)
+        Log.debug(f"插入电影国家关系, Statement: {self.INSERT_MOVIE_COUNTRY_RELATION.name}, Params: {params}")
 
         try:
-            result = self.db.execute(execute)
+            result = self.db.execute_prepared(self.INSERT_MOVIE_COUNTRY_RELATION, params)
             Log.info(f"插入电影国家关系, BD Result: {result}")
             Log.info(f"保存电影国家关系: movie_id={movie_id}, country_name={country_name}")
         except Exception as error:
@@ -286,27 +407,29 @@ class MovieCountryDAO:
 class MovieCommentDAO:
     """电影评论数据访问对象"""
 
-    def __init__(self, db: "PostgreSQLOperator"):
+    INSERT_COMMENT: t.ClassVar["PreparedStatement"] = DoubanStatements.register(
+        "douban_insert_movie_comment",
+        """
+        insert into
+            movie.tb_movie_comment (movie_id, comment_id, content)
+        values
+            (%(movie_id)s, %(comment_id)s, %(content)s)
+        on conflict (comment_id) do update
+            set movie_id = excluded.movie_id,
+                content = excluded.content,
+                updated_at = now()
+        returning id;
+        """,
+    )
+
+    def __init__(self, db: "PostgreSQLPoolOperator"):
         self.db = db
 
     def insert_comment(self, comment_data: dict):
-        query = """
-                insert into
-                    movie.tb_movie_comment (movie_id, comment_id, content)
-                values
-                    (%(movie_id)s, %(comment_id)s, %(content)s)
-                on conflict (comment_id) do update
-                    set movie_id = excluded.movie_id,
-                        content = excluded.content,
-                        updated_at = now()
-                returning id;
-                """
-        query = DoubanUtils.query_sql_clean(query)
-        Log.debug(f"插入电影评论, Query: {query}, Params: {comment_data}")
-
-        execute = PostgreSQLExecuteStructure(query, comment_data)
+        Log.debug(f"插入电影评论, Statement: {self.INSERT_COMMENT.name}, Params: {comment_data}")
+
         try:
-            result = self.db.insert(execute)
+            result = self.db.execute_prepared(self.INSERT_COMMENT, comment_data)
             Log.info(f"插入电影评论, DB Result: {result}")
             return result
         except Exception as error:
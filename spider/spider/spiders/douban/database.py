@@ -7,13 +7,24 @@
 @datetime: 2025-12-25 19:35:42 UTC+08:00
 """
 
+import contextlib
+import threading
+import time
 import typing as t
 
 import psycopg2
 from fairylandlogger import LogManager, Logger
+from psycopg2.extras import NamedTupleCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
+from spider.lazy import LazyManager
 from spider.spiders.douban.config import DoubanConfig
+from fairylandfuture.abstract.database import AbstractPostgreSQLOperator
 from fairylandfuture.database.postgresql import PostgreSQLConnector
+from fairylandfuture.exceptions.database import SQLSyntaxException
+from fairylandfuture.exceptions.messages.database import SQLSyntaxExceptMessage
+from fairylandfuture.structures.database import PostgreSQLExecuteStructure
+from spider.spiders.douban.statements import DoubanStatements, PreparedStatement, StatementRegistry
 
 
 class DatabaseManager:
@@ -28,7 +39,60 @@ class DatabaseManager:
 
     def __init__(self):
         self.config: t.Dict[str, t.Any] = DoubanConfig.load().get("postgresql", {})
-        self.connector: "PostgreSQLConnector" = self.get_connector()
+        # 连接池大小, 以及借出的连接距上次检查超过多少秒时先探测是否存活;
+        # 池中已有 pool_min 个空闲连接时归还的连接会被关闭, pool_min 即保留的空闲连接数, 默认与 pool_size 相同, 避免反复建连
+        self.pool_size = int(self.config.get("pool_size", 8))
+        self.pool_min = min(int(self.config.get("pool_min", self.pool_size)), self.pool_size)
+        self.health_check_interval = float(self.config.get("health_check_interval", 30))
+        # 连接全部借出时等待归还的最长秒数; ThreadedConnectionPool 耗尽时直接抛出 PoolError, 借出前先占用一个名额
+        self.pool_timeout = float(self.config.get("pool_timeout", 30))
+        self.__slots = threading.BoundedSemaphore(self.pool_size)
+
+        self.__connector: t.Optional["PostgreSQLConnector"] = None
+        self.__pool: t.Optional["ThreadedConnectionPool"] = None
+        self.__operator: t.Optional["PostgreSQLPoolOperator"] = None
+        self.__lock = threading.Lock()
+        # 连接 -> 上次确认存活的时间
+        self.__checked_at: t.Dict[int, float] = {}
+        # 连接被关闭丢弃时的回调, 参数为连接的 id
+        self.__discard_listeners: t.List[t.Callable[[int], None]] = []
+
+    @property
+    def connector(self) -> "PostgreSQLConnector":
+        """共享的单连接, 首次访问时连接"""
+        if self.__connector is None:
+            with self.__lock:
+                if self.__connector is None:
+                    self.__connector = self.get_connector()
+        return self.__connector
+
+    @property
+    def pool(self) -> "ThreadedConnectionPool":
+        """线程安全的连接池, 首次访问时创建"""
+        if self.__pool is None:
+            with self.__lock:
+                if self.__pool is None:
+                    self.__pool = ThreadedConnectionPool(
+                        self.pool_min,
+                        self.pool_size,
+                        host=self.config.get("host"),
+                        port=self.config.get("port"),
+                        dbname=self.config.get("database"),
+                        user=self.config.get("user"),
+                        password=self.config.get("password"),
+                        options="-c timezone=Asia/Shanghai",
+                    )
+                    self.Log.info(f"创建数据库连接池: {self.pool_min} - {self.pool_size} 个连接")
+        return self.__pool
+
+    @property
+    def operator(self) -> "PostgreSQLPoolOperator":
+        """基于连接池的线程安全操作器, 供 DAO 使用"""
+        if self.__operator is None:
+            with self.__lock:
+                if self.__operator is None:
+                    self.__operator = PostgreSQLPoolOperator(self)
+        return self.__operator
 
     def get_connector(self) -> "PostgreSQLConnector":
         connector = PostgreSQLConnector(
@@ -44,6 +108,69 @@ class DatabaseManager:
 
         return connector
 
+    def on_discard(self, listener: t.Callable[[int], None]) -> None:
+        """
+        注册连接丢弃回调, 按连接缓存游标或预备语句的对象在连接关闭后清理对应的条目
+
+        :param listener: 回调, 参数为被丢弃连接的 id
+        :type listener: callable
+        """
+        self.__discard_listeners.append(listener)
+
+    def __discard(self, connection: "psycopg2.extensions.connection") -> None:
+        self.__checked_at.pop(id(connection), None)
+        for listener in self.__discard_listeners:
+            listener(id(connection))
+
+    def __alive(self, connection: "psycopg2.extensions.connection") -> bool:
+        if connection.closed != 0:
+            return False
+        if time.monotonic() - self.__checked_at.get(id(connection), 0.0) < self.health_check_interval:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+        self.__checked_at[id(connection)] = time.monotonic()
+        return True
+
+    @contextlib.contextmanager
+    def connection(self) -> t.Iterator["psycopg2.extensions.connection"]:
+        """
+        从连接池借出一个连接, 连接全部借出时最多等待 pool_timeout 秒; 借出前检查是否存活, 断开的连接丢弃后重新借出;
+        退出时归还, 异常时先回滚
+
+        :return: 数据库连接
+        :rtype: psycopg2.extensions.connection
+        """
+        if not self.__slots.acquire(timeout=self.pool_timeout):
+            raise PoolError(f"等待数据库连接超时: {self.pool_size} 个连接已全部借出超过 {self.pool_timeout} 秒")
+
+        try:
+            connection = self.pool.getconn()
+            while not self.__alive(connection):
+                self.Log.warning("连接池中的数据库连接已断开, 丢弃并重新连接")
+                self.pool.putconn(connection, close=True)
+                self.__discard(connection)
+                connection = self.pool.getconn()
+
+            try:
+                yield connection
+            except Exception:
+                if connection.closed == 0:
+                    connection.rollback()
+                raise
+            finally:
+                self.pool.putconn(connection, close=connection.closed != 0)
+                # 连接已断开, 或池中空闲连接已满时被连接池关闭
+                if connection.closed != 0:
+                    self.__discard(connection)
+        finally:
+            self.__slots.release()
+
     def ping(self):
         """
         探测连接是否存活
@@ -57,8 +184,148 @@ class DatabaseManager:
                 cursor.execute("SELECT 1")
 
         except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-            print(f"检测到连接丢失 ({e})，正在执行重连...")
+            self.Log.warning(f"检测到连接丢失 ({e})，正在执行重连...")
+            # 远端断开的连接本地仍标记为存在, 先关闭才能让 reconnect 重新建立
+            with contextlib.suppress(psycopg2.Error):
+                self.connector.close()
             self.connector.reconnect()
 
+    def close(self) -> None:
+        if self.__pool is not None:
+            connections = [*self.__pool._pool, *self.__pool._used.values()]
+            self.__pool.closeall()
+            self.__pool = None
+            for connection in connections:
+                self.__discard(connection)
+        if self.__connector is not None:
+            self.__connector.close()
+            self.__connector = None
+
+
+class PostgreSQLPoolOperator(AbstractPostgreSQLOperator):
+    """
+    线程安全的 PostgreSQL 操作器
+
+    每条语句从连接池借出连接 (借出时检查存活), 执行并提交后归还, 不再关闭游标或断开连接; 每个连接保留一个长期使用的游标.
+    在 transaction() 中, 当前线程固定使用同一个连接, 其中的所有语句在退出时一起提交, 异常时回滚.
+
+    :param database: 数据库管理器
+    :type database: DatabaseManager
+    """
+
+    def __init__(self, database: "DatabaseManager", statements: "StatementRegistry" = DoubanStatements):
+        self.database = database
+        self.statements = statements
+        # 连接 id -> 长期使用的游标; 游标引用着连接, 不能用弱引用字典, 连接被丢弃时由数据库管理器回调移除
+        self.__cursors: t.Dict[int, "NamedTupleCursor"] = {}
+        self.__cursors_lock = threading.Lock()
+        # 当前线程事务中的游标
+        self.__local = threading.local()
+
+        self.database.on_discard(self.forget)
+        self.database.on_discard(self.statements.forget)
+
+    def cursor(self, connection: "psycopg2.extensions.connection") -> "NamedTupleCursor":
+        """
+        连接的长期游标, 不存在或已关闭时创建
+
+        :param connection: 数据库连接
+        :type connection: psycopg2.extensions.connection
+        :return: 游标
+        :rtype: NamedTupleCursor
+        """
+        with self.__cursors_lock:
+            cursor = self.__cursors.get(id(connection))
+            if cursor is None or cursor.closed or cursor.connection is not connection:
+                cursor = connection.cursor(cursor_factory=NamedTupleCursor)
+                self.__cursors[id(connection)] = cursor
+            return cursor
+
+    def forget(self, connection_id: int) -> None:
+        """
+        移除已丢弃连接的游标
+
+        :param connection_id: 连接的 id
+        :type connection_id: int
+        """
+        with self.__cursors_lock:
+            self.__cursors.pop(connection_id, None)
+
+    @property
+    def in_transaction(self) -> bool:
+        return getattr(self.__local, "cursor", None) is not None
+
+    @contextlib.contextmanager
+    def transaction(self) -> t.Iterator["NamedTupleCursor"]:
+        """
+        在一个事务中执行多条语句, 嵌套时加入外层事务
+
+        :return: 事务使用的游标
+        :rtype: NamedTupleCursor
+        """
+        if self.in_transaction:
+            yield self.__local.cursor
+            return
+
+        with self.database.connection() as connection:
+            cursor = self.cursor(connection)
+            self.__local.cursor = cursor
+            try:
+                yield cursor
+                connection.commit()
+            finally:
+                self.__local.cursor = None
+
+    def execute(self, struct: "PostgreSQLExecuteStructure", /) -> t.Union[bool, t.Tuple[t.NamedTuple, ...]]:
+        """
+        执行一条语句, 不在事务中时立即提交
+
+        :param struct: 语句和参数
+        :type struct: PostgreSQLExecuteStructure
+        :return: 结果行, 没有结果时为 True
+        :rtype: bool | tuple
+        """
+        with self.transaction() as cursor:
+            cursor.execute(struct.query, struct.vars)
+            data = cursor.fetchall() if cursor.description is not None else None
+
+        return tuple(data) if data else True
+
+    def execute_prepared(self, statement: "PreparedStatement", params: t.Optional[t.Mapping[str, t.Any]] = None) -> t.Union[bool, t.Tuple[t.NamedTuple, ...]]:
+        """
+        以服务端预备语句执行一条已注册的语句, 不在事务中时立即提交
+
+        :param statement: 预备语句
+        :type statement: PreparedStatement
+        :param params: 参数
+        :type params: dict
+        :return: 结果行, 没有结果时为 True
+        :rtype: bool | tuple
+        """
+        with self.transaction() as cursor:
+            self.statements.execute(cursor, statement, params)
+            data = cursor.fetchall() if cursor.description is not None else None
+
+        return tuple(data) if data else True
+
+    def executemany(self, struct: "PostgreSQLExecuteStructure", /) -> bool:
+        with self.transaction() as cursor:
+            cursor.executemany(struct.query, struct.vars)
+        return True
+
+    def multiexecute(self, structs: t.Sequence["PostgreSQLExecuteStructure"], /) -> bool:
+        with self.transaction() as cursor:
+            for struct in structs:
+                if struct.query.lower().startswith("select"):
+                    raise SQLSyntaxException(SQLSyntaxExceptMessage.SQL_MUST_NOT_SELECT)
+                cursor.execute(struct.query, struct.vars)
+        return True
+
+    def select(self, struct: "PostgreSQLExecuteStructure", /) -> t.Tuple[t.NamedTuple, ...]:
+        if not struct.query.lower().startswith("select"):
+            raise SQLSyntaxException(SQLSyntaxExceptMessage.SQL_MUST_SELECT)
+        return self.execute(struct)
+
 
-PostgreSQLManager = DatabaseManager()
+# 首次访问属性时才连接 PostgreSQL
+PostgreSQLManager: "DatabaseManager" = LazyManager(DatabaseManager)
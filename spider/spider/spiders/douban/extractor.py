@@ -0,0 +1,143 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 11:02:18 UTC+08:00
+"""
+
+import typing as t
+
+import scrapy
+from fairylandlogger import LogManager, Logger
+from lxml.html import HtmlElement
+
+from spider.spiders.douban.structures import MovieInfoSectionStructure
+
+
+class MovieInfoExtractor:
+    """
+    电影详情页 div#info 单次遍历提取器
+
+    div#info 由若干 "<span class="pl">标签</span> 值 <br>" 组成, 按文档顺序遍历一次,
+    以 <br> 为界将每个标签下的文本和链接归集为一个字段.
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-extractor", "douban")
+
+    # 标签 -> MovieInfoSectionStructure 字段
+    LABELS: t.ClassVar[t.Dict[str, str]] = {
+        "导演": "directors",
+        "编剧": "writers",
+        "主演": "actors",
+        "类型": "types",
+        "制片国家/地区": "countries",
+        "语言": "languages",
+        "上映日期": "release_dates",
+        "首播": "release_dates",
+        "片长": "runtime",
+        "单集片长": "runtime",
+        "又名": "aliases",
+        "IMDb": "imdb",
+    }
+    # 以链接形式给出的艺术家字段
+    ARTIST_FIELDS: t.ClassVar[t.Set[str]] = {"directors", "writers", "actors"}
+
+    @classmethod
+    def extract(cls, response: scrapy.http.Response) -> "MovieInfoSectionStructure":
+        """
+        提取 div#info 中所有带标签的字段
+
+        :param response: 页面响应
+        :type response: scrapy.http.Response
+        :return: div#info 区块数据
+        :rtype: MovieInfoSectionStructure
+        """
+        section = MovieInfoSectionStructure()
+
+        selector = response.xpath('//div[@id="info"]')
+        if not selector:
+            cls.Log.warning("页面中未找到 div#info 区块")
+            return section
+
+        label: t.Optional[str] = None
+        texts: t.List[str] = []
+        links: t.List[t.Tuple[str, str]] = []
+
+        for kind, value, href in cls.__walk(selector[0].root):
+            if kind == "label":
+                cls.__collect(section, label, texts, links)
+                label, texts, links = value, [], []
+            elif kind == "break":
+                cls.__collect(section, label, texts, links)
+                label, texts, links = None, [], []
+            elif label is None:
+                continue
+            elif kind == "link":
+                links.append((value, href))
+            else:
+                texts.append(value)
+        cls.__collect(section, label, texts, links)
+
+        cls.Log.info(
+            f"提取 div#info: 导演 {len(section.directors)} 人, 编剧 {len(section.writers)} 人, 演员 {len(section.actors)} 人, "
+            f"类型 {section.types}, 国家/地区 {section.countries}, 上映日期 {section.release_dates}"
+        )
+        return section
+
+    @classmethod
+    def __walk(cls, element: "HtmlElement") -> t.Iterator[t.Tuple[str, str, t.Optional[str]]]:
+        """
+        按文档顺序生成 (类型, 值, 链接) 记号, 类型为 label / link / text / break
+
+        :param element: div#info 元素
+        :type element: HtmlElement
+        """
+        if element.text:
+            yield "text", element.text, None
+
+        for child in element:
+            tag = child.tag
+            if not isinstance(tag, str):
+                # 注释等节点
+                pass
+            elif tag == "br":
+                yield "break", "", None
+            elif tag == "span" and "pl" in (child.get("class") or "").split():
+                yield "label", "".join(child.itertext()).strip().rstrip(":：").strip(), None
+            elif tag == "a":
+                yield "link", "".join(child.itertext()).strip(), child.get("href")
+            else:
+                yield from cls.__walk(child)
+
+            if child.tail:
+                yield "text", child.tail, None
+
+    @classmethod
+    def __collect(cls, section: "MovieInfoSectionStructure", label: t.Optional[str], texts: t.List[str], links: t.List[t.Tuple[str, str]]) -> None:
+        """将一个标签下归集的文本和链接写入对应字段"""
+        if not label:
+            return
+
+        attr = cls.LABELS.get(label)
+        if attr in cls.ARTIST_FIELDS:
+            artists = getattr(section, attr)
+            for name, url in links:
+                if url and url.startswith("javascript"):
+                    # "更多..." 之类的展开链接
+                    continue
+                artists.append({"artist_id": url.strip("/").split("/")[-1] if url else None, "name": name})
+            return
+
+        text = "".join(texts).strip().lstrip(":：").strip()
+        if not text and links:
+            text = " / ".join(name for name, _ in links)
+        values = [value.strip() for value in text.split("/") if value.strip()]
+
+        if attr in ("runtime", "imdb"):
+            setattr(section, attr, text)
+        elif attr:
+            getattr(section, attr).extend(values)
+        else:
+            section.extras[label] = values
@@ -0,0 +1,190 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 15:41:27 UTC+08:00
+"""
+
+import time
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+import fake_useragent
+from fairylandlogger import LogManager, Logger
+
+from spider.spiders.douban.utils import DoubanUtils
+
+if t.TYPE_CHECKING:
+    from spider.spiders.douban.middlewares import AdaptiveRateLimiter
+
+# 请求推荐列表 API 时附加的请求头
+API_HEADER_PROFILE: t.Dict[str, str] = {
+    "authority": "m.douban.com",
+    "accept": "application/json, text/plain, */*",
+    "accept-encoding": "gzip, deflate, br, zstd",
+    "accept-language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "cache-control": "no-cache",
+    "origin": "https://movie.douban.com",
+    "pragma": "no-cache",
+    "priority": "u=1, i",
+    "referer": "https://movie.douban.com/explore",
+    "sec-ch-ua": '"Google Chrome";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-site",
+}
+
+
+@dataclass
+class DoubanIdentity:
+    """
+    豆瓣访问身份: 一份 Cookie + 固定的 UA + 独立的限速器
+
+    """
+
+    name: str
+    cookies: t.Dict[str, str]
+    user_agent: str
+    limiter: "AdaptiveRateLimiter"
+    in_flight: int = 0
+    quarantined_until: float = 0.0
+    quarantine_streak: int = 0
+    requests: int = 0
+
+    @property
+    def headers(self) -> t.Dict[str, str]:
+        return {
+            "User-Agent": self.user_agent,
+            "Referer": "https://movie.douban.com/explore",
+        }
+
+    def made_headers(self) -> t.Dict[str, str]:
+        """
+        生成请求电影ID列表的请求头
+
+        :return: 请求头
+        :rtype: dict
+        """
+        headers = self.headers.copy()
+        headers.update(API_HEADER_PROFILE)
+        return headers
+
+    @property
+    def healthy(self) -> bool:
+        return self.quarantined_until <= time.monotonic()
+
+
+class DoubanIdentityPool:
+    """
+    多身份会话池, 请求分配给当前负载最低的健康身份
+
+    :param identities: 身份列表
+    :type identities: list
+    :param quarantine: 首次隔离秒数, 连续被封时翻倍
+    :type quarantine: float
+    :param max_quarantine: 隔离秒数上限
+    :type max_quarantine: float
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-identity", "douban")
+
+    def __init__(self, identities: t.List["DoubanIdentity"], quarantine: float = 600.0, max_quarantine: float = 86400.0):
+        self.identities: t.Dict[str, "DoubanIdentity"] = {identity.name: identity for identity in identities}
+        self.quarantine_seconds = quarantine
+        self.max_quarantine = max_quarantine
+
+    @classmethod
+    def load_from_dir(
+        cls,
+        dir_path: t.Union[str, Path],
+        limiter_factory: t.Callable[[], "AdaptiveRateLimiter"],
+        **kwargs,
+    ) -> "DoubanIdentityPool":
+        """
+        从 Cookie 目录加载身份, 每个 *.cookies 文件对应一个身份
+
+        :param dir_path: Cookie 目录
+        :type dir_path: str | Path
+        :param limiter_factory: 为每个身份创建限速器
+        :type limiter_factory: callable
+        :return: 身份池
+        :rtype: DoubanIdentityPool
+        """
+        identities = []
+        for name, cookies in DoubanUtils.load_cookies_from_dir(dir_path).items():
+            identities.append(
+                DoubanIdentity(
+                    name=name,
+                    cookies=cookies,
+                    user_agent=fake_useragent.FakeUserAgent(os="Windows").random,
+                    limiter=limiter_factory(),
+                )
+            )
+        cls.Log.info(f"从 {dir_path} 加载 {len(identities)} 个身份: {[identity.name for identity in identities]}")
+        return cls(identities, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.identities)
+
+    def get(self, name: str) -> t.Optional["DoubanIdentity"]:
+        return self.identities.get(name)
+
+    def acquire(self) -> t.Tuple["DoubanIdentity", float]:
+        """
+        选取负载最低的健康身份并预定一个令牌
+
+        :return: (身份, 需要等待的秒数)
+        :rtype: tuple
+        """
+        now = time.monotonic()
+        healthy = [identity for identity in self.identities.values() if identity.healthy]
+        if healthy:
+            identity = min(healthy, key=lambda item: (item.in_flight, item.limiter.peek(), item.requests))
+            wait = identity.limiter.reserve()
+        else:
+            # 全部被隔离时, 选最早解除隔离的身份排队等待
+            identity = min(self.identities.values(), key=lambda item: item.quarantined_until)
+            wait = max(identity.limiter.reserve(), identity.quarantined_until - now)
+            self.Log.warning(f"所有身份均处于隔离中, 身份 {identity.name} 将在 {wait:.0f} 秒后继续使用")
+
+        identity.in_flight += 1
+        identity.requests += 1
+        return identity, wait
+
+    def occupy(self, identity: "DoubanIdentity") -> float:
+        """已指定身份的请求 (例如重试) 直接占用该身份"""
+        identity.in_flight += 1
+        identity.requests += 1
+        return max(identity.limiter.reserve(), identity.quarantined_until - time.monotonic())
+
+    def release(self, identity: "DoubanIdentity") -> None:
+        identity.in_flight = max(0, identity.in_flight - 1)
+
+    def quarantine(self, identity: "DoubanIdentity") -> float:
+        """
+        隔离身份, 连续被封时隔离时间翻倍
+
+        :return: 隔离秒数
+        :rtype: float
+        """
+        identity.quarantine_streak += 1
+        identity.limiter.on_blocked()
+        seconds = min(self.max_quarantine, self.quarantine_seconds * 2 ** (identity.quarantine_streak - 1))
+        identity.quarantined_until = time.monotonic() + seconds
+        self.Log.warning(f"身份 {identity.name} 被封禁, 隔离 {seconds:.0f} 秒")
+        return seconds
+
+    def recover(self, identity: "DoubanIdentity") -> bool:
+        """
+        记录一次正常响应
+
+        :return: 速率是否发生变化
+        :rtype: bool
+        """
+        identity.quarantine_streak = 0
+        return identity.limiter.on_success()
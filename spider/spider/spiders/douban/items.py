@@ -43,3 +43,14 @@ class MovieCommentItem(scrapy.Item):
     movie_id = scrapy.Field()  # 电影ID（豆瓣ID）
     comment_id = scrapy.Field()  # 评论ID
     content = scrapy.Field()  # 评论内容
+    sort = scrapy.Field()  # 排序方式
+    start = scrapy.Field()  # 所在页起始偏移
+    limit = scrapy.Field()  # 每页条数
+    page_count = scrapy.Field()  # 所在页评论条数
+
+
+class MovieCommentCompletedItem(scrapy.Item):
+    """电影某个排序的短评已全部获取, 由 Pipeline 在这些短评全部入库后标记完成"""
+
+    movie_id = scrapy.Field()  # 电影ID（豆瓣ID）
+    sort = scrapy.Field()  # 排序方式
@@ -0,0 +1,379 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-16 14:20:05 UTC+08:00
+"""
+
+import json
+import random
+import time
+import typing as t
+
+import scrapy
+from fairylandlogger import LogManager, Logger
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import deferLater
+
+from spider.spiders.douban.cache import DoubanCacheManager, RedisManager
+from spider.spiders.douban.identity import DoubanIdentity, DoubanIdentityPool
+
+
+class AdaptiveRateLimiter:
+    """
+    自适应令牌桶限速器
+
+    响应正常时按固定步长提高速率 (加性增), 遇到封禁信号时按比例降低速率并进入指数递增的冷却期 (乘性减).
+
+    :param rate: 初始速率 (请求/秒)
+    :type rate: float
+    :param min_rate: 最低速率
+    :type min_rate: float
+    :param max_rate: 最高速率
+    :type max_rate: float
+    :param burst: 令牌桶容量
+    :type burst: float
+    :param increase_step: 每次提速的步长
+    :type increase_step: float
+    :param increase_every: 连续多少个正常响应后提速一次
+    :type increase_every: int
+    :param backoff_factor: 封禁时速率乘数
+    :type backoff_factor: float
+    :param penalty: 首次封禁的冷却秒数, 连续封禁时翻倍
+    :type penalty: float
+    :param max_penalty: 冷却秒数上限
+    :type max_penalty: float
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+        burst: float = 1.0,
+        increase_step: float = 0.01,
+        increase_every: int = 10,
+        backoff_factor: float = 0.5,
+        penalty: float = 60.0,
+        max_penalty: float = 3600.0,
+    ):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.burst = max(burst, 1.0)
+        self.increase_step = increase_step
+        self.increase_every = max(increase_every, 1)
+        self.backoff_factor = backoff_factor
+        self.penalty = penalty
+        self.max_penalty = max_penalty
+
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.clean_streak = 0
+        self.block_streak = 0
+
+    def __refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def peek(self) -> float:
+        """
+        不消耗令牌, 估算下一个请求需要等待的秒数
+
+        :return: 需要等待的秒数
+        :rtype: float
+        """
+        now = time.monotonic()
+        self.__refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate, self.blocked_until - now)
+
+    def reserve(self) -> float:
+        """
+        预定一个令牌
+
+        :return: 需要等待的秒数, 0 表示可立即发出请求
+        :rtype: float
+        """
+        now = time.monotonic()
+        self.__refill(now)
+        self.tokens -= 1
+
+        wait = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+        return wait
+
+    def on_success(self) -> bool:
+        """
+        记录一次正常响应
+
+        :return: 速率是否发生变化
+        :rtype: bool
+        """
+        self.block_streak = 0
+        self.clean_streak += 1
+        if self.clean_streak < self.increase_every or self.rate >= self.max_rate:
+            return False
+
+        self.clean_streak = 0
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+        return True
+
+    def on_blocked(self) -> float:
+        """
+        记录一次封禁响应, 降低速率并进入冷却期
+
+        :return: 冷却秒数
+        :rtype: float
+        """
+        self.clean_streak = 0
+        self.block_streak += 1
+        self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+
+        cooldown = min(self.max_penalty, self.penalty * 2 ** (self.block_streak - 1))
+        now = time.monotonic()
+        self.__refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.blocked_until = max(self.blocked_until, now + cooldown)
+        return cooldown
+
+    def dump(self) -> t.Dict[str, t.Any]:
+        return {"rate": self.rate, "block_streak": self.block_streak, "update_time": time.time()}
+
+    def load(self, state: t.Dict[str, t.Any]) -> None:
+        rate = state.get("rate")
+        if rate:
+            self.rate = min(max(float(rate), self.min_rate), self.max_rate)
+        self.block_streak = int(state.get("block_streak") or 0)
+
+
+class AdaptiveRateLimitMiddleware:
+    """
+    基于反馈的自适应限速下载中间件, 替代固定的 DOWNLOAD_DELAY
+
+    相关配置::
+
+        DOUBAN_RATE_LIMIT_ENABLED: 是否启用, 默认 True
+        DOUBAN_RATE_LIMIT_KEY: Redis 中保存限速状态的键
+        DOUBAN_RATE_LIMIT_INITIAL_RATE: 初始速率 (请求/秒), 默认 1/30
+        DOUBAN_RATE_LIMIT_MIN_RATE / DOUBAN_RATE_LIMIT_MAX_RATE: 速率上下限
+        DOUBAN_RATE_LIMIT_BURST: 令牌桶容量
+        DOUBAN_RATE_LIMIT_INCREASE_STEP / DOUBAN_RATE_LIMIT_INCREASE_EVERY: 提速步长和间隔
+        DOUBAN_RATE_LIMIT_BACKOFF_FACTOR: 封禁时速率乘数
+        DOUBAN_RATE_LIMIT_PENALTY / DOUBAN_RATE_LIMIT_MAX_PENALTY: 冷却秒数及上限
+        DOUBAN_RATE_LIMIT_JITTER: 每次等待额外附加的随机抖动比例
+        DOUBAN_RATE_LIMIT_BLOCK_CODES: 视为封禁的状态码
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-rate-limit", "douban")
+
+    # 重定向到以下地址视为被要求登录/验证
+    BLOCK_REDIRECT_MARKERS: t.ClassVar[t.Tuple[str, ...]] = ("accounts.douban.com", "sec.douban.com", "/login", "/misc/sorry")
+
+    def __init__(self, crawler: "Crawler", cache: "DoubanCacheManager"):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.cache = cache
+
+        self.key: str = settings.get("DOUBAN_RATE_LIMIT_KEY", "douban:ratelimit:state")
+        self.jitter: float = settings.getfloat("DOUBAN_RATE_LIMIT_JITTER", 0.2)
+        self.block_codes: t.Set[int] = set(settings.getlist("DOUBAN_RATE_LIMIT_BLOCK_CODES", [403, 429]))
+        self.limiter = self.create_limiter(settings)
+
+    @staticmethod
+    def create_limiter(settings: "Settings") -> "AdaptiveRateLimiter":
+        return AdaptiveRateLimiter(
+            rate=settings.getfloat("DOUBAN_RATE_LIMIT_INITIAL_RATE", 1 / 30),
+            min_rate=settings.getfloat("DOUBAN_RATE_LIMIT_MIN_RATE", 1 / 120),
+            max_rate=settings.getfloat("DOUBAN_RATE_LIMIT_MAX_RATE", 2.0),
+            burst=settings.getfloat("DOUBAN_RATE_LIMIT_BURST", 1.0),
+            increase_step=settings.getfloat("DOUBAN_RATE_LIMIT_INCREASE_STEP", 0.01),
+            increase_every=settings.getint("DOUBAN_RATE_LIMIT_INCREASE_EVERY", 10),
+            backoff_factor=settings.getfloat("DOUBAN_RATE_LIMIT_BACKOFF_FACTOR", 0.5),
+            penalty=settings.getfloat("DOUBAN_RATE_LIMIT_PENALTY", 60.0),
+            max_penalty=settings.getfloat("DOUBAN_RATE_LIMIT_MAX_PENALTY", 3600.0),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler: "Crawler") -> "AdaptiveRateLimitMiddleware":
+        if not crawler.settings.getbool("DOUBAN_RATE_LIMIT_ENABLED", True):
+            raise NotConfigured("DOUBAN_RATE_LIMIT_ENABLED is False")
+
+        middleware = cls(crawler, RedisManager)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider: scrapy.Spider) -> None:
+        try:
+            state = self.cache.get(self.key)
+            if state:
+                self.limiter.load(json.loads(state))
+                self.Log.info(f"从缓存恢复限速状态: {state}")
+        except Exception as error:
+            self.Log.warning(f"恢复限速状态失败, 使用初始速率: {error}")
+        self.Log.info(f"初始请求速率: {self.limiter.rate:.4f} 次/秒")
+
+    def spider_closed(self, spider: scrapy.Spider) -> None:
+        self.__save_state()
+
+    def __save_state(self) -> None:
+        try:
+            self.cache.set(self.key, json.dumps(self.limiter.dump(), separators=(",", ":")))
+        except Exception as error:
+            self.Log.warning(f"保存限速状态失败: {error}")
+
+    def process_request(self, request: scrapy.Request, spider: scrapy.Spider) -> t.Optional["Deferred"]:
+        if "douban_identity" in request.meta:
+            # 已由身份池按身份限速
+            return None
+
+        wait = self.limiter.reserve()
+        if wait <= 0:
+            return None
+
+        wait += wait * random.uniform(0, self.jitter)
+        self.Log.debug(f"限速等待 {wait:.2f} 秒: {request.url}")
+        return deferLater(reactor, wait, lambda: None)
+
+    def process_response(self, request: scrapy.Request, response: scrapy.http.Response, spider: scrapy.Spider) -> scrapy.http.Response:
+        if "douban_identity" in request.meta:
+            return response
+
+        if self.is_blocked(response):
+            cooldown = self.limiter.on_blocked()
+            self.Log.warning(f"检测到封禁响应 {response.status}: {response.url}, 速率降至 {self.limiter.rate:.4f} 次/秒, 冷却 {cooldown:.0f} 秒")
+            self.__save_state()
+        elif 200 <= response.status < 300 and self.limiter.on_success():
+            self.Log.info(f"响应正常, 速率提升至 {self.limiter.rate:.4f} 次/秒")
+            self.__save_state()
+
+        return response
+
+    def is_blocked(self, response: scrapy.http.Response) -> bool:
+        return response.status in self.block_codes or self.is_login_redirect(response)
+
+    @classmethod
+    def is_login_redirect(cls, response: scrapy.http.Response) -> bool:
+        if 300 <= response.status < 400:
+            location = response.headers.get("Location", b"").decode("UTF-8", errors="ignore")
+            return any(marker in location for marker in cls.BLOCK_REDIRECT_MARKERS)
+        return False
+
+
+class DoubanIdentityMiddleware:
+    """
+    多身份下载中间件: 为每个请求分配负载最低的健康身份, 替换 Cookie、UA 和请求头, 并按身份限速
+
+    请求 meta 中 douban_header_profile 为 "api" 时使用推荐列表 API 的请求头.
+    身份返回 403 或被重定向到登录/验证页时自动隔离, 请求交给 RetryMiddleware 以其他身份重试.
+
+    相关配置::
+
+        DOUBAN_IDENTITY_DIR: Cookie 目录, 每个 *.cookies 文件为一个身份, 默认 config/cookies
+        DOUBAN_IDENTITY_QUARANTINE / DOUBAN_IDENTITY_MAX_QUARANTINE: 隔离秒数及上限
+        DOUBAN_RATE_LIMIT_*: 每个身份的限速参数, 与 AdaptiveRateLimitMiddleware 相同
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-identity", "douban")
+
+    def __init__(self, crawler: "Crawler", pool: "DoubanIdentityPool", cache: "DoubanCacheManager"):
+        self.crawler = crawler
+        self.pool = pool
+        self.cache = cache
+        self.jitter: float = crawler.settings.getfloat("DOUBAN_RATE_LIMIT_JITTER", 0.2)
+
+    @classmethod
+    def from_crawler(cls, crawler: "Crawler") -> "DoubanIdentityMiddleware":
+        settings = crawler.settings
+        pool = DoubanIdentityPool.load_from_dir(
+            settings.get("DOUBAN_IDENTITY_DIR", "config/cookies"),
+            limiter_factory=lambda: AdaptiveRateLimitMiddleware.create_limiter(settings),
+            quarantine=settings.getfloat("DOUBAN_IDENTITY_QUARANTINE", 600.0),
+            max_quarantine=settings.getfloat("DOUBAN_IDENTITY_MAX_QUARANTINE", 86400.0),
+        )
+        if not pool:
+            raise NotConfigured("没有可用的身份 Cookie 目录, 使用单一 Cookie")
+
+        middleware = cls(crawler, pool, RedisManager)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    @staticmethod
+    def state_key(identity: "DoubanIdentity") -> str:
+        return f"douban:identity:{identity.name}:ratelimit"
+
+    def spider_opened(self, spider: scrapy.Spider) -> None:
+        for identity in self.pool.identities.values():
+            try:
+                state = self.cache.get(self.state_key(identity))
+                if state:
+                    identity.limiter.load(json.loads(state))
+            except Exception as error:
+                self.Log.warning(f"恢复身份 {identity.name} 限速状态失败: {error}")
+            self.Log.info(f"身份 {identity.name} 初始请求速率: {identity.limiter.rate:.4f} 次/秒")
+
+    def spider_closed(self, spider: scrapy.Spider) -> None:
+        for identity in self.pool.identities.values():
+            self.__save_state(identity)
+
+    def __save_state(self, identity: "DoubanIdentity") -> None:
+        try:
+            self.cache.set(self.state_key(identity), json.dumps(identity.limiter.dump(), separators=(",", ":")))
+        except Exception as error:
+            self.Log.warning(f"保存身份 {identity.name} 限速状态失败: {error}")
+
+    def process_request(self, request: scrapy.Request, spider: scrapy.Spider) -> t.Optional["Deferred"]:
+        identity = self.pool.get(request.meta.get("douban_identity", ""))
+        if identity is not None:
+            wait = self.pool.occupy(identity)
+        else:
+            identity, wait = self.pool.acquire()
+
+        request.meta["douban_identity"] = identity.name
+        request.meta["cookiejar"] = identity.name
+        request.cookies = dict(identity.cookies)
+        profile = identity.made_headers() if request.meta.get("douban_header_profile") == "api" else identity.headers
+        for name, value in profile.items():
+            request.headers[name] = value
+
+        if wait <= 0:
+            return None
+
+        wait += wait * random.uniform(0, self.jitter)
+        self.Log.debug(f"身份 {identity.name} 限速等待 {wait:.2f} 秒: {request.url}")
+        return deferLater(reactor, wait, lambda: None)
+
+    def process_response(self, request: scrapy.Request, response: scrapy.http.Response, spider: scrapy.Spider) -> scrapy.http.Response:
+        identity = self.pool.get(request.meta.get("douban_identity", ""))
+        if identity is None:
+            return response
+
+        self.pool.release(identity)
+        if response.status == 403 or AdaptiveRateLimitMiddleware.is_login_redirect(response):
+            self.pool.quarantine(identity)
+            self.__save_state(identity)
+            # 重试时重新分配身份
+            request.meta.pop("douban_identity", None)
+        elif response.status == 429:
+            cooldown = identity.limiter.on_blocked()
+            self.Log.warning(f"身份 {identity.name} 请求过快, 速率降至 {identity.limiter.rate:.4f} 次/秒, 冷却 {cooldown:.0f} 秒")
+            self.__save_state(identity)
+        elif 200 <= response.status < 300 and self.pool.recover(identity):
+            self.Log.info(f"身份 {identity.name} 响应正常, 速率提升至 {identity.limiter.rate:.4f} 次/秒")
+            self.__save_state(identity)
+
+        return response
+
+    def process_exception(self, request: scrapy.Request, exception: Exception, spider: scrapy.Spider) -> None:
+        identity = self.pool.get(request.meta.get("douban_identity", ""))
+        if identity is not None:
+            self.pool.release(identity)
+        return None
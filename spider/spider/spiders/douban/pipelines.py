@@ -7,19 +7,25 @@
 @datetime: 2025-12-24 00:34:45 UTC+08:00
 """
 
-import traceback
 import typing as t
 
 import scrapy
 from fairylandlogger import LogManager, Logger
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall
+from twisted.python.failure import Failure
 
-from fairylandfuture.database.postgresql import PostgreSQLOperator
-from spider.spiders.douban.cache import RedisManager, DoubanCacheManager
+from spider.spiders.douban.cache import RedisManager, DoubanCacheManager, DoubanCacheSession
+from spider.enums import SpiderStatus
 from spider.spiders.douban.dao import MovieDAO, ArtistDAO, MovieCountryDAO, MovieTypeDAO, MovieCommentDAO
-from spider.spiders.douban.database import PostgreSQLManager, DatabaseManager
-from spider.spiders.douban.items import MovieInfoTiem, MovieCommentItem
+from spider.spiders.douban.database import PostgreSQLManager, DatabaseManager, PostgreSQLPoolOperator
+from spider.spiders.douban.items import MovieInfoTiem, MovieCommentItem, MovieCommentCompletedItem
+from spider.spiders.douban.sink import MovieCommentSink, CommentBatchResult
+from spider.spiders.douban.statements import DoubanStatements
 from spider.spiders.douban.structures import MovieStructure, MovieArtistStructure
+from spider.spiders.douban.writer import DatabaseWriter
 
 
 class DoubanMoviePipeline:
@@ -30,14 +36,32 @@ class DoubanMoviePipeline:
     def __init__(self):
         self.__dbm: DatabaseManager = PostgreSQLManager
 
-        self.db: PostgreSQLOperator = PostgreSQLOperator(self.__dbm.connector)
+        self.db: "PostgreSQLPoolOperator" = self.__dbm.operator
         self.cache: "DoubanCacheManager" = RedisManager
+        # 短评的任务状态和分页断点先在会话中合并, 每页入库后一次写入
+        self.cache_session: "DoubanCacheSession" = self.cache.session()
 
         self.movie_dao: t.Optional["MovieDAO"] = None
         self.movie_artist_dao: t.Optional["ArtistDAO"] = None
         self.movie_type_dao: t.Optional["MovieTypeDAO"] = None
         self.movie_country_dao: t.Optional["MovieCountryDAO"] = None
         self.movie_comment_dao: t.Optional["MovieCommentDAO"] = None
+        # 短评缓冲写入, 整批写入成功后才推进分页断点
+        self.comment_sink: t.Optional["MovieCommentSink"] = None
+        self.comment_flush_loop: t.Optional["LoopingCall"] = None
+        # 数据库写入在独立线程中执行, reactor 线程只处理回调和 Redis 状态
+        self.writer: t.Optional["DatabaseWriter"] = None
+
+        # (电影ID, 排序, 页偏移) -> 已入库评论条数
+        self.comment_page_commits: t.Dict[t.Tuple[str, str, int], int] = {}
+        # (电影ID, 排序) -> 已入库但尚未连续的页偏移
+        self.comment_committed_pages: t.Dict[t.Tuple[str, str], t.Set[int]] = {}
+        # (电影ID, 排序) -> 已保存的断点 (下一页起始偏移)
+        self.comment_checkpoints: t.Dict[t.Tuple[str, str], int] = {}
+        # (电影ID, 排序) -> 已交给写入器、尚未确认入库的短评条数
+        self.comment_outstanding: t.Dict[t.Tuple[str, str], int] = {}
+        # 爬虫已获取全部短评, 等待其余短评入库后标记完成的 (电影ID, 排序)
+        self.comment_completions: t.Set[t.Tuple[str, str]] = set()
 
     def open_spider(self, spider):
         """爬虫启动时连接数据库"""
@@ -51,26 +75,76 @@ class DoubanMoviePipeline:
             self.Log.error(f"数据库连接失败: {err}")
             raise err
 
-    def close_spider(self, spider):
+        # 写入线程多于连接池保留的空闲连接时, 超出的连接归还即关闭, 每次写入都要重新建连;
+        # 同时至少留出一个连接给 reactor 线程 (读取类型、遍历电影ID), 写入满载时它不必等待写入线程归还连接
+        threads = spider.settings.getint("DOUBAN_DB_WRITER_THREADS", 4)
+        limit = max(min(self.__dbm.pool_min, self.__dbm.pool_size - 1), 1)
+        if threads > limit:
+            self.Log.warning(f"数据库写入线程数 {threads} 超过可用连接数 {limit} (保留空闲连接 {self.__dbm.pool_min}, 连接池 {self.__dbm.pool_size}), 调整为 {limit}")
+            threads = limit
+        self.writer = DatabaseWriter(
+            threads=threads,
+            max_pending=spider.settings.getint("DOUBAN_DB_WRITER_MAX_PENDING", 64),
+        )
+        self.writer.start()
+
+        flush_interval = spider.settings.getfloat("DOUBAN_COMMENT_FLUSH_INTERVAL", 5)
+        self.comment_sink = MovieCommentSink(self.__dbm, batch_size=spider.settings.getint("DOUBAN_COMMENT_BATCH_SIZE", 500), flush_interval=flush_interval)
+        # 短评停止到达时, 缓冲中剩余的短评也在 flush_interval 秒内写入
+        self.comment_flush_loop = LoopingCall(self.__flush_due_comments)
+        self.comment_flush_loop.start(flush_interval, now=False)
+
+    def close_spider(self, spider) -> "Deferred":
+        """等待已提交的写入完成, 写入剩余的短评后再保存缓存状态"""
+        if self.comment_flush_loop and self.comment_flush_loop.running:
+            self.comment_flush_loop.stop()
+
+        deferred = self.writer.drain()
+        if self.comment_sink is not None:
+            deferred.addCallback(lambda _: self.writer.submit(self.comment_sink.close))
+            deferred.addCallback(self.__on_comment_batch)
+        deferred.addErrback(lambda failure: self.Log.error(f"关闭时写入数据库失败: {failure.value}"))
+        deferred.addCallback(lambda _: self.__close_cache(spider))
+        return deferred
+
+    def __close_cache(self, spider):
+        self.writer.stop()
+        DoubanStatements.log_stats()
+        self.cache_session.flush()
         if spider.name == "douban-movie-info":
             self.cache.clean_completed_tasks()
         elif spider.name == "douban-movie-short-comment":
             self.cache.clean_comment_completed_tasks()
 
-    def process_item(self, item: scrapy.Item, spider: scrapy.Spider) -> scrapy.Item:
-        """处理数据项"""
-        try:
-            if isinstance(item, MovieInfoTiem):
-                self.__process_movie_info(item)
-                self.cache.mark_completed(item.get("movie_id"), {k: v for k, v in item.items()})
-                self.cache.add_to_db_movie_ids(item.get("movie_id"))
-            elif isinstance(item, MovieCommentItem):
-                self.__process_movie_comment(item)
-        except Exception as err:
-            self.Log.error(f"处理数据项失败: {err}")
-            self.Log.error(traceback.format_exc())
+    def process_item(self, item: scrapy.Item, spider: scrapy.Spider) -> t.Union[scrapy.Item, "Deferred"]:
+        """处理数据项, 数据库写入在写入线程中执行, 写入完成后才更新缓存中的任务状态"""
+        if isinstance(item, MovieInfoTiem):
+            deferred = self.writer.submit(self.__process_movie_info, item)
+            deferred.addCallback(lambda _: self.__on_movie_saved(item))
+        elif isinstance(item, MovieCommentItem):
+            self.__track_comment(item, 1)
+            deferred = self.writer.submit(self.__add_movie_comment, item)
+            deferred.addCallbacks(self.__on_comment_batch, self.__on_comment_rejected, errbackArgs=(item,))
+        elif isinstance(item, MovieCommentCompletedItem):
+            self.comment_completions.add((item.get("movie_id"), item.get("sort")))
+            self.__complete_comment_sort(item.get("movie_id"), item.get("sort"))
+            return item
+        else:
+            return item
+
+        deferred.addCallback(lambda _: item)
+        deferred.addErrback(self.__on_item_failed)
+        return deferred
 
-        return item
+    def __on_movie_saved(self, item: "MovieInfoTiem"):
+        self.cache.mark_completed(item.get("movie_id"))
+        self.cache.add_to_db_movie_ids(item.get("movie_id"))
+
+    def __on_item_failed(self, failure: "Failure"):
+        self.Log.error(f"处理数据项失败: {failure.value}")
+        self.Log.error(failure.getTraceback())
+        # 入库失败的数据项不触发 item_scraped, 条件请求中间件不会保存该页面的校验信息
+        raise DropItem(f"处理数据项失败: {failure.value}")
 
     def __process_movie_info(self, item: "MovieInfoTiem"):
         item = ItemAdapter(item)
@@ -92,43 +166,147 @@ class DoubanMoviePipeline:
         types: t.List[str] = item.get("types", [])
         countries: t.List[str] = item.get("countries", [])
 
-        # 插入电影信息
         movie_data = MovieStructure(**movie_info)
-        self.movie_dao.insert_movie(movie_data)
-
-        # 插入导演、编剧、演员 到 tb_artist 并建立关系
-        artists: t.List[t.Dict[str, str]] = []
-        artists.extend([{"artist_id": director.get("artist_id"), "name": director.get("name"), "role": "director"} for director in directors])
-        artists.extend([{"artist_id": writer.get("artist_id"), "name": writer.get("name"), "role": "writer"} for writer in writers])
-        artists.extend([{"artist_id": actor.get("artist_id"), "name": actor.get("name"), "role": "actor"} for actor in actors])
-        for artist in artists:
-            role = artist.get("role")
-            artist_data = MovieArtistStructure(artist_id=artist.get("artist_id"), name=artist.get("name"))
-            # 插入艺术家信息
-            (artist_relation,) = self.movie_artist_dao.insert_artist(artist_data)
-
-            # 建立电影与艺术家关系
-            self.movie_artist_dao.insert_movie_artist_relation(role, movie_data.movie_id, artist_relation.id)
-
-        # 插入电影类型关系
-        for movie_type in types:
-            self.movie_type_dao.insert_movie_type_relation(movie_data.movie_id, movie_type)
-
-        # 插入制片国家/地区关系
-        for country in countries:
-            self.movie_country_dao.insert_movie_country_relation(movie_data.movie_id, country)
-
-    def __process_movie_comment(self, item: "MovieCommentItem"):
-        try:
-            item = ItemAdapter(item)
-            comment_info = {
-                "movie_id": item.get("movie_id"),
-                "comment_id": item.get("comment_id"),
-                "content": item.get("content"),
-            }
-            self.movie_comment_dao.insert_comment(comment_info)
-            self.cache.mark_comment_completed(comment_info.get("movie_id"), comment_info)
-        except Exception as error:
-            self.Log.error(f"处理电影评论失败: {error}")
-            self.cache.mark_comment_failed(item.get("movie_id"), str(error))
-            raise error
+        artists: t.Dict[str, t.List["MovieArtistStructure"]] = {
+            role: [MovieArtistStructure(artist_id=artist.get("artist_id"), name=artist.get("name")) for artist in role_artists]
+            for role, role_artists in (("director", directors), ("writer", writers), ("actor", actors))
+        }
+
+        # 电影、艺术家以及所有关系在一个事务中批量写入, 每部电影只有几次往返和一次提交
+        self.movie_dao.save_movie(movie_data, artists, types, countries)
+
+    def __add_movie_comment(self, item: "MovieCommentItem") -> t.Optional["CommentBatchResult"]:
+        item = ItemAdapter(item)
+        comment_info = {
+            "movie_id": item.get("movie_id"),
+            "comment_id": item.get("comment_id"),
+            "content": item.get("content"),
+        }
+        return self.comment_sink.add(comment_info, item)
+
+    def __flush_due_comments(self):
+        if not self.comment_sink.due:
+            return
+        deferred = self.writer.submit(self.comment_sink.flush_if_due)
+        deferred.addCallback(self.__on_comment_batch)
+        deferred.addErrback(lambda failure: self.Log.error(f"定时写入短评失败: {failure.value}"))
+
+    def __on_comment_batch(self, result: t.Optional["CommentBatchResult"]):
+        """
+        处理一批短评的写入结果: 成功时逐条推进分页断点, 失败时将本批涉及的短评任务标记为失败, 等待重试
+
+        :param result: 写入结果
+        :type result: CommentBatchResult
+        """
+        if result is None:
+            return
+
+        for item in result.contexts:
+            self.__track_comment(item, -1)
+
+        if not result.success:
+            for movie_id in dict.fromkeys(row.get("movie_id") for row in result.rows):
+                # 本轮已丢失部分短评, 不再标记完成, 由重试队列从断点重新获取
+                self.comment_completions = {task for task in self.comment_completions if task[0] != movie_id}
+                self.cache_session.mark_comment_failed(movie_id, str(result.error))
+            self.cache_session.flush()
+            return
+
+        for item in result.contexts:
+            self.cache_session.mark_comment_parsed(item.get("movie_id"))
+            self.__commit_comment_page(item)
+
+        # 爬虫已获取全部短评的排序, 在最后一批短评入库后标记完成
+        for movie_id, sort in dict.fromkeys((item.get("movie_id"), item.get("sort")) for item in result.contexts):
+            self.__complete_comment_sort(movie_id, sort)
+
+    def __on_comment_rejected(self, failure: "Failure", item: "MovieCommentItem") -> "Failure":
+        """短评未能加入写入器 (如写入器已关闭), 标记短评任务失败"""
+        self.__track_comment(item, -1)
+        self.comment_completions.discard((item.get("movie_id"), item.get("sort")))
+        self.cache_session.mark_comment_failed(item.get("movie_id"), str(failure.value))
+        self.cache_session.flush()
+        return failure
+
+    def __track_comment(self, item: t.Union["MovieCommentItem", "ItemAdapter"], delta: int) -> None:
+        task = (item.get("movie_id"), item.get("sort"))
+        outstanding = self.comment_outstanding.get(task, 0) + delta
+        if outstanding > 0:
+            self.comment_outstanding[task] = outstanding
+        else:
+            self.comment_outstanding.pop(task, None)
+
+    def __complete_comment_sort(self, movie_id: str, sort: str):
+        """
+        爬虫已获取全部短评且这些短评都已入库时, 标记电影的该排序完成, 两种排序都完成时标记短评任务完成
+
+        短评还在缓冲中或写入中时不标记, 否则写入失败或进程崩溃会丢失这些短评, 已完成的电影却不会再被获取.
+
+        :param movie_id: 电影ID
+        :type movie_id: str
+        :param sort: 排序方式
+        :type sort: str
+        """
+        task = (movie_id, sort)
+        if task not in self.comment_completions or self.comment_outstanding.get(task):
+            return
+        self.comment_completions.discard(task)
+
+        # 先写入会话中合并的状态和断点, 避免完成之后再被改回已解析或重新写入断点
+        self.cache_session.flush()
+        comment_task = self.cache.get_comment_task(movie_id)
+        if comment_task is not None and comment_task.status == SpiderStatus.FAILED:
+            self.Log.warning(f"电影 {movie_id} 的短评任务已失败, 不标记分类 {sort} 完成")
+            return
+
+        completed_sorts = self.cache.add_comment_completed_sort(movie_id, sort)
+        self.Log.info(f"电影 {movie_id} 分类 {sort} 的短评已全部入库")
+        # 已完成 new_score 和 time 两种排序
+        if len(completed_sorts) >= 2:
+            self.Log.info(f"电影 {movie_id} 所有短评分类已完成")
+            self.cache.save_druable_comment_completed(movie_id)
+            self.cache.mark_comment_completed(movie_id)
+            self.cache.clean_comment_completed_sorts(movie_id)
+            self.cache.clean_comment_checkpoint(movie_id)
+            for completed_sort in completed_sorts:
+                self.comment_checkpoints.pop((movie_id, completed_sort), None)
+                self.comment_committed_pages.pop((movie_id, completed_sort), None)
+
+    def __commit_comment_page(self, item: "ItemAdapter"):
+        """
+        统计每页已入库的评论, 整页入库后推进该电影排序的分页断点
+
+        并行分页时各页完成顺序不确定, 断点只推进到连续入库的最后一页之后, 保证重启后不会跳过未入库的页.
+
+        :param item: 评论数据项
+        :type item: ItemAdapter
+        """
+        movie_id, sort, start, limit = item.get("movie_id"), item.get("sort"), item.get("start"), item.get("limit")
+        if sort is None or start is None or not limit:
+            return
+
+        page = (movie_id, sort, start)
+        self.comment_page_commits[page] = self.comment_page_commits.get(page, 0) + 1
+        if self.comment_page_commits.get(page) < item.get("page_count", 0):
+            return
+        self.comment_page_commits.pop(page)
+
+        task = (movie_id, sort)
+        if task not in self.comment_checkpoints:
+            self.comment_checkpoints[task] = (self.cache.get_comment_checkpoints(movie_id) or {}).get(sort, 0)
+        checkpoint = self.comment_checkpoints.get(task)
+        if start < checkpoint:
+            self.cache_session.flush()
+            return
+
+        committed = self.comment_committed_pages.setdefault(task, set())
+        committed.add(start)
+        while checkpoint in committed:
+            committed.discard(checkpoint)
+            checkpoint += limit
+
+        if checkpoint != self.comment_checkpoints.get(task):
+            self.comment_checkpoints[task] = checkpoint
+            self.cache_session.save_comment_checkpoint(movie_id, sort, checkpoint)
+        # 整页入库后一次写入该页合并后的任务状态和断点
+        self.cache_session.flush()
@@ -0,0 +1,206 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-17 01:06:48 UTC+08:00
+"""
+
+import io
+import threading
+import time
+import traceback
+import typing as t
+from dataclasses import dataclass, field
+
+from fairylandlogger import LogManager, Logger
+
+from spider.spiders.douban.utils import DoubanUtils
+
+if t.TYPE_CHECKING:
+    from spider.spiders.douban.database import DatabaseManager
+
+
+@dataclass(frozen=False)
+class CommentBatchResult:
+    """一批短评的写入结果"""
+
+    # 本批的短评, 以及与之一一对应的调用方上下文 (如数据项)
+    rows: t.List[t.Dict[str, t.Any]] = field(default_factory=list)
+    contexts: t.List[t.Any] = field(default_factory=list)
+    # 实际插入或更新的行数 (本批内重复的评论只写入最后一条)
+    written: int = 0
+    elapsed: float = 0.0
+    error: t.Optional[BaseException] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+class MovieCommentSink:
+    """
+    带缓冲的短评写入器
+
+    短评先缓存在内存中, 达到 batch_size 条或距上次写入超过 flush_interval 秒时写入一批: 用 COPY 导入会话级临时表,
+    再以一条 INSERT ... SELECT ... ON CONFLICT 合并到 movie.tb_movie_comment, 每批一个事务、一次提交.
+    写入失败时整批回滚, 结果中带有异常和本批的全部短评, 由调用方决定重试或标记失败. 关闭时写入剩余的短评.
+
+    :param database: 数据库管理器
+    :type database: DatabaseManager
+    :param batch_size: 每批的短评数量
+    :type batch_size: int
+    :param flush_interval: 最长缓冲秒数
+    :type flush_interval: float
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-comment-sink", "douban")
+
+    CREATE_STAGING_QUERY: t.ClassVar[str] = """
+        create temporary table if not exists tmp_movie_comment
+        (
+            movie_id   varchar(32),
+            comment_id varchar(32),
+            content    text
+        ) on commit delete rows;
+        """
+
+    COPY_STAGING_QUERY: t.ClassVar[str] = "copy tmp_movie_comment (movie_id, comment_id, content) from stdin"
+
+    # 同一批中重复的评论只保留最后一条, 否则 ON CONFLICT 会在一条语句中两次更新同一行
+    MERGE_QUERY: t.ClassVar[str] = """
+        insert into
+            movie.tb_movie_comment (movie_id, comment_id, content)
+        select distinct on (comment_id) movie_id, comment_id, content
+        from tmp_movie_comment
+        order by comment_id, ctid desc
+        on conflict (comment_id) do update
+            set movie_id = excluded.movie_id,
+                content = excluded.content,
+                updated_at = now();
+        """
+
+    # COPY 文本格式中需要转义的字符
+    COPY_ESCAPES: t.ClassVar[t.Dict[int, str]] = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+    def __init__(self, database: "DatabaseManager", batch_size: int = 500, flush_interval: float = 5.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.rows: t.List[t.Dict[str, t.Any]] = []
+        self.contexts: t.List[t.Any] = []
+        self.flushed_at = time.monotonic()
+        self.closed = False
+        self.lock = threading.Lock()
+
+        self.batches = 0
+        self.failed_batches = 0
+        self.written = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __enter__(self) -> "MovieCommentSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def due(self) -> bool:
+        """缓冲中有短评且距上次写入超过 flush_interval 秒"""
+        return bool(self.rows) and time.monotonic() - self.flushed_at >= self.flush_interval
+
+    def add(self, comment: t.Dict[str, t.Any], context: t.Any = None) -> t.Optional["CommentBatchResult"]:
+        """
+        加入一条短评, 达到批量或时间阈值时写入
+
+        :param comment: 短评 (movie_id, comment_id, content)
+        :type comment: dict
+        :param context: 调用方上下文, 随写入结果返回
+        :type context: Any
+        :return: 触发写入时返回本批结果, 否则为 None
+        :rtype: CommentBatchResult
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("短评写入器已关闭")
+            self.rows.append(comment)
+            self.contexts.append(context)
+            if len(self.rows) < self.batch_size and not self.due:
+                return None
+            return self.__flush()
+
+    def flush(self) -> t.Optional["CommentBatchResult"]:
+        """
+        立即写入缓冲中的短评
+
+        :return: 本批结果, 缓冲为空时为 None
+        :rtype: CommentBatchResult
+        """
+        with self.lock:
+            return self.__flush()
+
+    def flush_if_due(self) -> t.Optional["CommentBatchResult"]:
+        """超过时间阈值时写入, 供定时任务调用"""
+        with self.lock:
+            return self.__flush() if self.due else None
+
+    def close(self) -> t.Optional["CommentBatchResult"]:
+        """
+        写入剩余的短评并关闭, 关闭后不能再加入
+
+        :return: 最后一批的结果
+        :rtype: CommentBatchResult
+        """
+        with self.lock:
+            if self.closed:
+                return None
+            result = self.__flush()
+            self.closed = True
+            self.Log.info(f"短评写入器关闭: 共 {self.batches} 批, 写入 {self.written} 条, 失败 {self.failed_batches} 批")
+            return result
+
+    def __flush(self) -> t.Optional["CommentBatchResult"]:
+        self.flushed_at = time.monotonic()
+        if not self.rows:
+            return None
+
+        result = CommentBatchResult(rows=self.rows, contexts=self.contexts)
+        self.rows, self.contexts = [], []
+
+        begin = time.perf_counter()
+        try:
+            result.written = self.__write(result.rows)
+        except Exception as error:
+            result.error = error
+            self.failed_batches += 1
+            self.Log.error(f"写入 {len(result.rows)} 条短评失败, 整批回滚: {error}")
+            self.Log.debug(traceback.format_exc())
+        else:
+            self.written += result.written
+            self.Log.info(f"写入 {len(result.rows)} 条短评, 合并 {result.written} 行")
+        result.elapsed = time.perf_counter() - begin
+        self.batches += 1
+
+        return result
+
+    def __write(self, rows: t.List[t.Dict[str, t.Any]]) -> int:
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(self.__escape(row.get(column)) for column in ("movie_id", "comment_id", "content")))
+            buffer.write("\n")
+        buffer.seek(0)
+
+        with self.database.connection() as connection:
+            with connection, connection.cursor() as cursor:
+                cursor.execute(DoubanUtils.query_sql_clean(self.CREATE_STAGING_QUERY))
+                cursor.copy_expert(self.COPY_STAGING_QUERY, buffer)
+                cursor.execute(DoubanUtils.query_sql_clean(self.MERGE_QUERY))
+                return cursor.rowcount
+
+    @classmethod
+    def __escape(cls, value: t.Any) -> str:
+        return "\\N" if value is None else str(value).translate(cls.COPY_ESCAPES)
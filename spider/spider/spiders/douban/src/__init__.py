@@ -7,13 +7,20 @@
 @datetime: 2025-12-24 19:03:59 UTC+08:00
 """
 
+import os
+import time
 import typing as t
 
 import scrapy
 from fairylandlogger import Logger, LogManager
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet.task import LoopingCall
 
 from spider.spiders.douban.cache import DoubanCacheManager, RedisManager
 from spider.spiders.douban.database import PostgreSQLManager, DatabaseManager
+from spider.spiders.douban.utils import DoubanUtils
 
 
 class DoubanMovieSpiderBase(scrapy.Spider):
@@ -29,12 +36,138 @@ class DoubanMovieSpiderBase(scrapy.Spider):
     allowed_domains = ["douban.com", "m.douban.com"]
 
     custom_settings = {
-        "CONCURRENT_REQUESTS": 1,
-        "CONCURRENT_REQUESTS_PER_DOMAIN": 1,
-        "CONCURRENT_REQUESTS_PER_IP": 1,
+        "CONCURRENT_REQUESTS": 8,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 8,
+        "CONCURRENT_REQUESTS_PER_IP": 8,
         "CONCURRENT_ITEMS": 1,
         "REACTOR_THREADPOOL_MAXSIZE": 1,
-        "DOWNLOAD_DELAY": 30,
+        # 请求间隔由 AdaptiveRateLimitMiddleware 根据响应反馈动态调整
+        "DOWNLOAD_DELAY": 0,
         "AUTOTHROTTLE_ENABLED": False,
         "SCHEDULER_DEBUG": False,
+        "DOWNLOADER_MIDDLEWARES": {
+            "spider.spiders.douban.middlewares.DoubanIdentityMiddleware": 640,
+            "spider.spiders.douban.middlewares.AdaptiveRateLimitMiddleware": 650,
+            # 未开启 ARCHIVE_ENABLED 时不生效
+            "spider.middlewares.ResponseArchiveMiddleware": 100,
+            # 只处理 meta 中 conditional_fetch 为 True 的请求 (电影详情页)
+            "spider.middlewares.ConditionalFetchMiddleware": 110,
+        },
+        "CONDITIONAL_FETCH_STORAGE": "spider.cache.http.RedisHttpValidatorStorage",
+        "CONDITIONAL_FETCH_REDIS_MANAGER": "spider.spiders.douban.cache.RedisManager",
+        # 只对解析用到的区域取哈希
+        "CONDITIONAL_FETCH_HASH_CSS": 'h1 span[property="v:itemreviewed"], div#info, strong.rating_num, span[property="v:summary"], div#mainpic img::attr(src)',
+        "DOUBAN_IDENTITY_DIR": "config/cookies",
+        "DOUBAN_RATE_LIMIT_INITIAL_RATE": 1 / 30,
+        "DOUBAN_RATE_LIMIT_MIN_RATE": 1 / 120,
+        "DOUBAN_RATE_LIMIT_MAX_RATE": 2.0,
+        # 失败任务重试: 第 n 次重试间隔 BASE_DELAY * 2^(n-1), 不超过 MAX_DELAY, 超过 MovieTask.max_retries 后进入死信集合
+        "DOUBAN_RETRY_BASE_DELAY": 300,
+        "DOUBAN_RETRY_MAX_DELAY": 6 * 3600,
+        # 运行中每隔 POLL_INTERVAL 秒拉取一批到期的重试任务
+        "DOUBAN_RETRY_POLL_INTERVAL": 30,
+        "DOUBAN_RETRY_BATCH_SIZE": 20,
+        # 空闲时若下一个重试任务在 IDLE_WAIT 秒内到期, 则保持爬虫运行
+        "DOUBAN_RETRY_IDLE_WAIT": 600,
+        # 进程内缓存: 分页偏移、已完成排序等热点键, 其他进程写入时通过 Redis 发布/订阅失效
+        "DOUBAN_LOCAL_CACHE_ENABLED": True,
+        "DOUBAN_LOCAL_CACHE_SIZE": 1024,
+        "DOUBAN_LOCAL_CACHE_TTL": 60,
+        # 短评缓冲写入: 每 BATCH_SIZE 条或最长 FLUSH_INTERVAL 秒以 COPY 写入一批
+        "DOUBAN_COMMENT_BATCH_SIZE": 500,
+        "DOUBAN_COMMENT_FLUSH_INTERVAL": 5,
+        # 数据库写入线程数 (不超过数据库连接池大小) 以及最多同时执行的写入数量, 超出时排队并暂停下载
+        "DOUBAN_DB_WRITER_THREADS": 4,
+        "DOUBAN_DB_WRITER_MAX_PENDING": 64,
     }
+
+    retry_loop: t.Optional["LoopingCall"] = None
+
+    @classmethod
+    def from_crawler(cls, crawler: "Crawler", *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.start_retry_loop, signal=signals.spider_opened)
+        crawler.signals.connect(spider.stop_retry_loop, signal=signals.spider_closed)
+        crawler.signals.connect(spider.retry_on_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider.open_local_cache, signal=signals.spider_opened)
+        crawler.signals.connect(spider.close_local_cache, signal=signals.spider_closed)
+        return spider
+
+    def open_local_cache(self, spider: scrapy.Spider) -> None:
+        if self.settings.getbool("DOUBAN_LOCAL_CACHE_ENABLED", False):
+            self.cache.enable_local_cache(
+                max_size=self.settings.getint("DOUBAN_LOCAL_CACHE_SIZE", 1024),
+                ttl=self.settings.getfloat("DOUBAN_LOCAL_CACHE_TTL", 60),
+            )
+
+    def close_local_cache(self, spider: scrapy.Spider) -> None:
+        if self.cache.local is not None:
+            self.Log.info(f"进程内缓存统计: {self.cache.local.stats()}")
+            self.cache.disable_local_cache()
+
+    def retry_requests(self, limit: int) -> t.Iterable[scrapy.Request]:
+        """
+        弹出到期的重试任务并生成请求, 由子类实现
+
+        :param limit: 最多弹出的任务数量
+        :type limit: int
+        :return: 请求生成器
+        :rtype: Iterable[scrapy.Request]
+        """
+        return ()
+
+    def next_retry_time(self) -> t.Optional[float]:
+        """下一个重试任务的到期时间戳, 由子类实现"""
+        return None
+
+    def start_retry_loop(self, spider: scrapy.Spider) -> None:
+        self.cache.configure_retry(
+            base_delay=self.settings.getfloat("DOUBAN_RETRY_BASE_DELAY", 300),
+            max_delay=self.settings.getfloat("DOUBAN_RETRY_MAX_DELAY", 6 * 3600),
+        )
+        self.retry_loop = LoopingCall(self.schedule_due_retries)
+        self.retry_loop.start(self.settings.getfloat("DOUBAN_RETRY_POLL_INTERVAL", 30), now=False)
+
+    def stop_retry_loop(self, spider: scrapy.Spider) -> None:
+        if self.retry_loop and self.retry_loop.running:
+            self.retry_loop.stop()
+
+    def schedule_due_retries(self) -> int:
+        """将到期的重试任务交给引擎调度"""
+        scheduled = 0
+        try:
+            for request in self.retry_requests(self.settings.getint("DOUBAN_RETRY_BATCH_SIZE", 20)):
+                self.crawler.engine.crawl(request)
+                scheduled += 1
+        except Exception as error:
+            self.Log.error(f"调度重试任务失败: {error}")
+        if scheduled:
+            self.Log.info(f"调度到期的重试请求 {scheduled} 个")
+        return scheduled
+
+    def retry_on_idle(self, spider: scrapy.Spider) -> None:
+        """空闲时先调度到期的重试任务; 下一个重试任务即将到期时保持爬虫运行"""
+        if self.schedule_due_retries():
+            raise DontCloseSpider
+
+        next_retry = self.next_retry_time()
+        if next_retry is not None and next_retry - time.time() <= self.settings.getfloat("DOUBAN_RETRY_IDLE_WAIT", 600):
+            self.Log.info(f"等待 {max(0.0, next_retry - time.time()):.0f} 秒后到期的重试任务")
+            raise DontCloseSpider
+
+    @classmethod
+    def load_cookies(cls, file_path: str = "config/douban.cookies") -> dict:
+        """
+        加载默认 Cookie
+
+        配置了多身份 Cookie 目录时, 请求的 Cookie 由 DoubanIdentityMiddleware 按身份分配, 默认 Cookie 可以不存在.
+
+        :param file_path: Cookie 文件路径
+        :type file_path: str
+        :return: Cookie 字典
+        :rtype: dict
+        """
+        if not os.path.isfile(file_path) and DoubanUtils.load_cookies_from_dir(cls.custom_settings.get("DOUBAN_IDENTITY_DIR")):
+            cls.Log.info(f"未找到 {file_path}, 使用多身份 Cookie 目录")
+            return {}
+        return DoubanUtils.load_cookies_from_file(file_path)
@@ -7,14 +7,14 @@
 @datetime: 2025-12-24 20:15:10 UTC+08:00
 """
 
-from typing import Any, Iterable
+import re
+from typing import Any, Iterable, Optional
 
 import fake_useragent
 import scrapy
 
-from fairylandfuture.database.postgresql import PostgreSQLOperator
 from spider.spiders.douban.dao import MovieDAO
-from spider.spiders.douban.items import MovieCommentItem
+from spider.spiders.douban.items import MovieCommentCompletedItem, MovieCommentItem
 from spider.spiders.douban.src import DoubanMovieSpiderBase
 from spider.spiders.douban.structures import MovieTask
 from spider.spiders.douban.utils import DoubanUtils
@@ -35,35 +35,74 @@ class DoubanMovieShortCommentSpider(DoubanMovieSpiderBase):
         self.size = 20
 
         self.start_index = 0
+        # 并行分页模式下最多展开的评论条数 (豆瓣只开放前若干页短评)
+        self.max_comments = 600
 
         self.headers = {
             "User-Agent": fake_useragent.FakeUserAgent(os="Windows").random,
             "Referer": "https://movie.douban.com/explore",
         }
-        self.cookies = DoubanUtils.load_cookies_from_file("config/douban.cookies")
+        self.cookies = self.load_cookies()
 
-        self.movie_dao = MovieDAO(PostgreSQLOperator(self.database.connector))
+        self.movie_dao = MovieDAO(self.database.operator)
 
     def start_requests(self) -> Iterable[Any]:
         self.Log.info("开始获取电影短评")
 
-        # 从缓存中获取电影 ID 列表
-        movie_ids = self.cache.get_db_movie_ids()
-        # 获取已完成的电影 ID 列表
-        completed_movie_ids = self.cache.get_druable_comment_completed()
-
-        for movie_id in movie_ids:
-            self.Log.info(f"开始获取电影 {movie_id} 的短评")
-            if movie_id in completed_movie_ids:
-                self.Log.info(f"电影 {movie_id} 的短评已完成，跳过")
+        self.cache.migrate_legacy_tasks()
+        # 失败任务交给重试队列按退避时间调度
+        self.cache.schedule_failed_comment_tasks()
+
+        # 逐批遍历缓存中的电影ID, 每批一次往返过滤掉已完成和等待重试的电影
+        for batch in DoubanUtils.batched(self.cache.iter_db_movie_ids(), self.cache.SCAN_BATCH_SIZE):
+            pending = self.cache.filter_pending_comment_movie_ids(batch)
+            self.Log.info(f"本批电影 {len(batch)} 个, 跳过已完成或等待重试的 {len(batch) - len(pending)} 个")
+            for movie_id in pending:
+                self.Log.info(f"开始获取电影 {movie_id} 的短评")
+                self.cache.save_comment_task(MovieTask(movie_id=movie_id))
+                yield from self.__request_movie(movie_id)
+
+    def retry_requests(self, limit: int) -> Iterable[Any]:
+        for movie_id in self.cache.pop_due_comment_retries(limit):
+            self.Log.info(f"重试电影 {movie_id} 的短评任务")
+            # 重试的页面本次运行中已请求过, 不经过去重过滤, 否则会被静默丢弃
+            yield from self.__request_movie(movie_id, dont_filter=True)
+
+    def next_retry_time(self) -> Optional[float]:
+        return self.cache.next_comment_retry_time()
+
+    def __request_movie(self, movie_id: str, dont_filter: bool = False) -> Iterable[Any]:
+        """请求电影的两种排序短评, 从断点继续, 已完成的排序不再重复获取"""
+        completed_sorts = self.cache.get_comment_completed_sorts(movie_id)
+        checkpoints = self.cache.get_comment_checkpoints(movie_id)
+        for sort in ["new_score", "time"]:
+            if sort in completed_sorts:
+                self.Log.info(f"电影 {movie_id} 分类 {sort} 的短评已完成，跳过")
                 continue
 
-            self.Log.info(f"保存电影 {movie_id} 的短评任务到缓存")
-            self.cache.save_comment_task(MovieTask(movie_id=movie_id))
-            for sort in ["new_score", "time"]:
-                yield from self.__request_movie_comment(movie_id=movie_id, start=self.start_index, limit=self.size, sort=sort)
-
-    def __request_movie_comment(self, movie_id: str, start: int, limit: int, sort: str) -> Iterable[Any]:
+            start = checkpoints.get(sort, self.start_index)
+            if start != self.start_index:
+                self.Log.info(f"电影 {movie_id} 分类 {sort} 从断点 {start} 继续获取")
+                # 断点之后按逐页模式继续, 丢弃上次并行分页的进度
+                self.cache.clean_comment_pages(movie_id, sort)
+                self.cache.mark_comment_processing(movie_id)
+            yield from self.__request_movie_comment(movie_id=movie_id, start=start, limit=self.size, sort=sort, dont_filter=dont_filter)
+
+    @property
+    def fanout(self) -> bool:
+        """是否启用并行分页: 由第一页的评论总数直接展开所有页, 而不是逐页跟随下一页链接"""
+        return self.settings.getbool("DOUBAN_COMMENT_FANOUT_ENABLED", False)
+
+    def __request_movie_comment(
+        self,
+        movie_id: str,
+        start: int,
+        limit: int,
+        sort: str,
+        fanout: bool = False,
+        priority: int = 0,
+        dont_filter: bool = False,
+    ) -> Iterable[Any]:
         url = f"https://movie.douban.com/subject/{movie_id}/comments?start={start}&limit={limit}&status=P&sort={sort}"
 
         if start == 0:
@@ -73,8 +112,11 @@ class DoubanMovieShortCommentSpider(DoubanMovieSpiderBase):
             method="GET",
             headers=self.headers,
             cookies=self.cookies,
-            cb_kwargs={"movie_id": movie_id, "start": start, "limit": limit, "sort": sort},
+            cb_kwargs={"movie_id": movie_id, "start": start, "limit": limit, "sort": sort, "fanout": fanout},
             callback=self.parse,
+            errback=self.__on_request_error,
+            priority=priority,
+            dont_filter=dont_filter,
         )
 
     def parse(self, response: scrapy.http.Response, **kwargs):
@@ -82,16 +124,10 @@ class DoubanMovieShortCommentSpider(DoubanMovieSpiderBase):
         start = kwargs.get("start")
         limit = kwargs.get("limit")
         sort = kwargs.get("sort")
+        fanout = kwargs.get("fanout", False)
 
         # 解析评论
         comment_items = response.css(".comment-item")
-        if not comment_items:
-            self.Log.info(f"电影 {movie_id} 分类 {sort} 已无更多评论")
-            self.Log.info(f"电影 {movie_id} 分类 {sort} 全部评论获取完成")
-            # 仅在最后一个 sort 完成时才标记电影完成
-            self.__mark_sort_completed(movie_id, sort)
-            return
-
         for item in comment_items:
             # 提取数据
             comment_id = item.attrib.get("data-cid")
@@ -101,30 +137,89 @@ class DoubanMovieShortCommentSpider(DoubanMovieSpiderBase):
                 movie_id=movie_id,
                 comment_id=comment_id,
                 content=content,
+                sort=sort,
+                start=start,
+                limit=limit,
+                page_count=len(comment_items),
             )
 
+        if fanout:
+            # 并行分页展开的页, 所有页完成后标记该排序完成
+            yield from self.__mark_page_completed(movie_id, sort, start)
+            return
+
+        if not comment_items:
+            self.Log.info(f"电影 {movie_id} 分类 {sort} 已无更多评论")
+            self.Log.info(f"电影 {movie_id} 分类 {sort} 全部评论获取完成")
+            # 仅在最后一个 sort 完成时才标记电影完成
+            yield from self.__mark_sort_completed(movie_id, sort)
+            return
+
         # 检查是否有下一页
         next_page = response.css("a.next::attr(href)").get()
-        if next_page:
+        if not next_page:
+            self.Log.info(f"电影 {movie_id} 分类 {sort} 全部评论获取完成")
+            yield from self.__mark_sort_completed(movie_id, sort)
+            return
+
+        total = self.__extract_total(response) if self.fanout and start == self.start_index else None
+        if total is None:
             new_start = start + limit
             yield from self.__request_movie_comment(movie_id, new_start, limit, sort)
-        else:
+            return
+
+        # 由评论总数展开剩余所有页, 作为独立请求交给调度器与其他电影交错执行
+        last_start = min(total, self.max_comments)
+        starts = list(range(start + limit, last_start, limit))
+        self.Log.info(f"电影 {movie_id} 分类 {sort} 共 {total} 条评论, 并行展开 {len(starts)} 页")
+        if not starts:
+            yield from self.__mark_sort_completed(movie_id, sort)
+            return
+
+        self.cache.save_comment_expected_pages(movie_id, sort, len(starts))
+        for index, page_start in enumerate(starts, 1):
+            # 越靠前的页优先级越高
+            yield from self.__request_movie_comment(movie_id, page_start, limit, sort, fanout=True, priority=-index)
+
+    def __on_request_error(self, failure):
+        """
+        页面请求最终失败 (重试耗尽、DNS 错误等) 时标记短评任务失败, 交给重试队列按退避时间重新获取;
+        否则并行分页的已完成页数永远达不到总页数, 逐页模式的分页链也会中断, 任务一直停留在处理中
+
+        :param failure: 失败原因
+        :type failure: twisted.python.failure.Failure
+        """
+        kwargs = failure.request.cb_kwargs
+        movie_id, sort, start = kwargs.get("movie_id"), kwargs.get("sort"), kwargs.get("start")
+        self.Log.error(f"电影 {movie_id} 分类 {sort} 第 {start} 条起的短评请求失败: {failure.getErrorMessage()}")
+        self.cache.mark_comment_failed(movie_id, f"短评页面 {sort}:{start} 请求失败: {failure.getErrorMessage()}")
+
+    @staticmethod
+    def __extract_total(response: scrapy.http.Response) -> Optional[int]:
+        """
+        从第一页的标签栏中提取评论总数, 例如 "看过(412345)"
+
+        :param response: 页面响应
+        :type response: scrapy.http.Response
+        :return: 评论总数, 未找到时为 None
+        :rtype: int
+        """
+        text = "".join(response.css(".CommentTabs .is-active ::text").getall())
+        matched = re.search(r"\((\d+)\)", text)
+        return int(matched.group(1)) if matched else None
+
+    def __mark_page_completed(self, movie_id: str, sort: str, start: int) -> Iterable[Any]:
+        """并行分页模式下标记某页完成, 所有展开的页完成后标记该 sort 完成"""
+        done, expected = self.cache.mark_comment_page_done(movie_id, sort, start)
+        self.Log.info(f"电影 {movie_id} 分类 {sort} 已完成 {done}/{expected} 页")
+        if expected is not None and done >= expected:
             self.Log.info(f"电影 {movie_id} 分类 {sort} 全部评论获取完成")
-            self.__mark_sort_completed(movie_id, sort)
-
-    def __mark_sort_completed(self, movie_id: str, sort: str):
-        """标记某个 sort 类型完成，当两个 sort 都完成时标记电影任务完成"""
-        # 获取已完成的 sort 类型集合
-        completed_sorts = self.cache.get(f"douban:movie:comment:completed_sorts:{movie_id}") or ""
-        completed_sorts_set = set(completed_sorts.split(",")) if completed_sorts else set()
-        completed_sorts_set.add(sort)
-
-        # 保存已完成的 sort 类型
-        self.cache.set(f"douban:movie:comment:completed_sorts:{movie_id}", ",".join(completed_sorts_set))
-
-        # 当两个 sort 都完成时，标记电影任务为已完成
-        if len(completed_sorts_set) >= 2:  # 已完成 new_score 和 time 两种排序
-            self.Log.info(f"电影 {movie_id} 所有短评分类已完成")
-            self.cache.save_druable_comment_completed(movie_id)
-            self.cache.mark_comment_completed(movie_id, None)
-            self.cache.delete(f"douban:movie:comment:completed_sorts:{movie_id}")
+            self.cache.clean_comment_pages(movie_id, sort)
+            yield from self.__mark_sort_completed(movie_id, sort)
+
+    def __mark_sort_completed(self, movie_id: str, sort: str) -> Iterable[Any]:
+        """
+        某个 sort 类型的短评已全部获取: 交给 Pipeline, 该排序的短评全部写入数据库后才标记完成;
+        短评仍在缓冲中时标记完成, 写入失败或进程崩溃会丢失这些短评, 电影却不会再被获取
+        """
+        yield MovieCommentCompletedItem(movie_id=movie_id, sort=sort)
@@ -17,13 +17,14 @@ import fake_useragent
 import scrapy
 import unicodedata
 
-from fairylandfuture.database.postgresql import PostgreSQLOperator
 from fairylandfuture.helpers.json.serializer import JsonSerializerHelper
 from spider.enums import SpiderStatus
 from spider.spiders.douban.dao import MovieDAO, MovieTypeDAO
+from spider.spiders.douban.extractor import MovieInfoExtractor
+from spider.spiders.douban.identity import API_HEADER_PROFILE
 from spider.spiders.douban.items import MovieInfoTiem
 from spider.spiders.douban.src import DoubanMovieSpiderBase
-from spider.spiders.douban.structures import MovieTask
+from spider.spiders.douban.structures import MovieTask, MovieInfoSectionStructure
 from spider.spiders.douban.utils import DoubanUtils
 
 
@@ -45,27 +46,38 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
             "User-Agent": fake_useragent.FakeUserAgent(os="Windows").random,
             "Referer": "https://movie.douban.com/explore",
         }
-        self.cookies = DoubanUtils.load_cookies_from_file("config/douban.cookies")
+        self.cookies = self.load_cookies()
 
-        self.movie_dao = MovieDAO(PostgreSQLOperator(self.database.connector))
-        self.movie_type_dao = MovieTypeDAO(PostgreSQLOperator(self.database.connector))
+        self.movie_dao = MovieDAO(self.database.operator)
+        self.movie_type_dao = MovieTypeDAO(self.database.operator)
 
     def start_requests(self):
         # self.cache.clean_completed_tasks()
-        # 先同步数据库已有ID到缓存
-        db_movie_ids = self.movie_dao.get_movie_id_all()
-        self.Log.info(f"数据库中已存在的电影ID数量: {len(db_movie_ids)}")
-        if db_movie_ids:
-            self.cache.save_db_movie_ids(db_movie_ids)
-
-        # 先处理缓存中的任务
-        tasks: t.List["MovieTask"] = self.cache.get_tasks()
-        tasks = [task for task in tasks if task.status != SpiderStatus.COMPLETED]
-        if tasks:
-            self.Log.info(f"缓存中待处理任务数量: {len(tasks)}")
-            for task in tasks:
-                self.Log.info(f"处理缓存任务: ID={task.movie_id}, Status={task.status}")
-                yield from self.__request_movie_info(task.movie_id)
+        # 先处理缓存中的任务, 逐批遍历, 第一个请求不必等待全部任务加载
+        self.cache.migrate_legacy_tasks()
+        # 失败任务交给重试队列按退避时间调度, 启动时只恢复中断的任务
+        self.cache.schedule_failed_tasks()
+        # 请求时任务转为处理中, 先遍历处理中的任务, 避免边遍历边转换的任务被重复请求
+        in_flight = [SpiderStatus.PROCESSING, SpiderStatus.PARSED, SpiderStatus.PENDING]
+        for task in self.cache.iter_tasks(statuses=in_flight):
+            self.Log.info(f"处理缓存任务: ID={task.movie_id}, Status={task.status}")
+            yield from self.__request_movie_info(task.movie_id)
+
+        # 同步数据库已有ID到缓存, 以服务端游标逐批读取
+        self.__sync_db_movie_ids()
+        if self.settings.getbool("DOUBAN_SEEN_BLOOM_ENABLED", False):
+            self.cache.enable_seen_filter()
+
+        # 增量刷新已入库的电影, 依赖条件请求跳过未变化的页面
+        if self.settings.getbool("DOUBAN_REFRESH_ENABLED", False):
+            refreshed = 0
+            for batch in DoubanUtils.batched(self.cache.iter_db_movie_ids(), self.cache.SCAN_BATCH_SIZE):
+                # 失败的任务 (含死信) 由重试队列按退避时间调度, 重新保存会清除其重试计划
+                for movie_id in self.cache.filter_movie_ids_without_task(batch, [*in_flight, SpiderStatus.FAILED]):
+                    self.cache.save_task(MovieTask(movie_id=movie_id))
+                    refreshed += 1
+                    yield from self.__request_movie_info(movie_id)
+            self.Log.info(f"刷新已入库电影数量: {refreshed}")
 
         types = self.movie_type_dao.get_all_types()
         self.Log.info(f"电影类型列表: {types}")
@@ -86,6 +98,28 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
 
             yield from self.__request_movie_id(start, count, page, type_id, type_name)
 
+    def __sync_db_movie_ids(self, batch_size: int = 2000) -> int:
+        """
+        逐批将数据库中的电影ID写入缓存
+
+        :return: 电影ID数量
+        :rtype: int
+        """
+        synced = 0
+        for batch in DoubanUtils.batched(self.movie_dao.iter_movie_ids(batch_size), batch_size):
+            self.cache.save_db_movie_ids(batch)
+            synced += len(batch)
+        self.Log.info(f"数据库中已存在的电影ID数量: {synced}")
+        return synced
+
+    def retry_requests(self, limit: int) -> t.Iterable[scrapy.Request]:
+        for movie_id in self.cache.pop_due_retries(limit):
+            self.Log.info(f"重试电影信息任务: ID={movie_id}")
+            yield from self.__request_movie_info(movie_id)
+
+    def next_retry_time(self) -> t.Optional[float]:
+        return self.cache.next_retry_time()
+
     def __request_movie_id(self, start: int, count: int, page: int, type_id: int, type_name: str):
         """
         请求电影推荐列表
@@ -124,7 +158,7 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
             cookies=self.cookies,
             callback=self.__parse_movie_id,
             dont_filter=True,
-            meta={"start": effective_start, "count": count, "page": page, "type_id": type_id, "type_name": type_name},
+            meta={"start": effective_start, "count": count, "page": page, "type_id": type_id, "type_name": type_name, "douban_header_profile": "api"},
         )
 
     def __parse_movie_id(self, response: scrapy.http.Response):
@@ -146,16 +180,24 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
                 self.cache.set(f"douban:movie:recommend:start:{type_id}", str(start))
                 return
 
+            movie_ids: t.List[str] = []
             for item in items:
                 if item.get("type") != "movie":
                     self.Log.warning(f"跳过非电影类型: {item.get('type')}")
                     continue
-
-                movie_id: str = item.get("id")
-                movie_name: str = item.get("title")
-                if DoubanUtils.check_id_in_cache(movie_id, self.cache.get_db_movie_ids()):
+                movie_ids.append(item.get("id"))
+
+            # 整页电影ID一次性判断是否已入库, 以及是否已有任务
+            unseen_movie_ids = set(self.cache.filter_unseen_movie_ids(movie_ids))
+            # 已有任务的电影由启动时的任务遍历或重试队列处理; 重新保存会把失败 (含死信) 的任务重置为待处理并清除重试计划
+            untracked_movie_ids = set(self.cache.filter_movie_ids_without_task(list(unseen_movie_ids), list(SpiderStatus)))
+            for movie_id in movie_ids:
+                if movie_id not in unseen_movie_ids:
                     self.Log.info(f"电影ID已存在于数据库，跳过: {movie_id}")
                     continue
+                if movie_id not in untracked_movie_ids:
+                    self.Log.info(f"电影ID已有任务，跳过: {movie_id}")
+                    continue
 
                 task = MovieTask(movie_id=movie_id, status=SpiderStatus.PENDING)
                 self.cache.save_task(task)
@@ -192,12 +234,14 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
         except Exception as e:
             self.Log.error(f"处理电影ID列表时出错: {e}")
 
-    def __request_movie_info(self, movie_id: str) -> t.Generator[scrapy.Request, t.Any, None]:
+    def __request_movie_info(self, movie_id: str, conditional: bool = True) -> t.Generator[scrapy.Request, t.Any, None]:
         """
         请求电影信息页面
 
         :param movie_id: 电影ID
         :type movie_id: str
+        :param conditional: 是否发送条件请求
+        :type conditional: bool
         :return: Scrapy 请求生成器
         :rtype: scrapy.Request
         """
@@ -214,7 +258,7 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
             cb_kwargs={"movie_id": movie_id},
             dont_filter=True,
             # errback=self._handle_error,
-            meta={"movie_id": movie_id},
+            meta={"movie_id": movie_id, "conditional_fetch": conditional},
         )
 
     def __parse_movie_info(self, response: scrapy.http.Response, movie_id: str):
@@ -230,16 +274,24 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
         """
         self.Log.info(f"解析电影信息: ID={movie_id}, Status={response.status}")
 
+        if response.meta.get("conditional_unchanged"):
+            if not self.cache.filter_unseen_movie_ids([movie_id]):
+                # 页面未变化且已入库, 跳过解析和入库
+                self.Log.info(f"电影信息未变化, 跳过解析: ID={movie_id}")
+                self.cache.mark_completed(movie_id)
+                return
+            if response.status == 304:
+                # 未入库却命中 304 (上次入库失败), 不带条件重新请求完整页面
+                self.Log.info(f"电影信息未入库, 重新请求完整页面: ID={movie_id}")
+                yield from self.__request_movie_info(movie_id, conditional=False)
+                return
+
         try:
             full_name = self.__extract_full_name(response)
             chinese_name, original_name = self.separate_movie_name(full_name)
-            release_date = self.__extract_release_date(response)
+            section = MovieInfoExtractor.extract(response)
+            release_date = self.__extract_release_date(section)
             score = self.__extract_score(response)
-            directors = self.__extract_directors(response)
-            writers = self.__extract_writers(response)
-            actors = self.__extract_actors(response)
-            types = self.__extract_types(response)
-            countries = self.__extract_countries(response)
             summary = self.__extract_summary(response)
             icon = self.__extract_icon(response)
 
@@ -251,11 +303,11 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
                 original_name=original_name,
                 release_date=release_date,
                 score=score,
-                directors=directors,
-                writers=writers,
-                actors=actors,
-                types=types,
-                countries=countries,
+                directors=section.directors,
+                writers=section.writers,
+                actors=section.actors,
+                types=section.types,
+                countries=section.countries,
                 summary=summary,
                 icon=icon,
             )
@@ -278,25 +330,7 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
         :rtype: dict
         """
         headers = self.headers.copy()
-        headers.update(
-            {
-                "authority": "m.douban.com",
-                "accept": "application/json, text/plain, */*",
-                "accept-encoding": "gzip, deflate, br, zstd",
-                "accept-language": "zh-CN,zh;q=0.9,en;q=0.8",
-                "cache-control": "no-cache",
-                "origin": "https://movie.douban.com",
-                "pragma": "no-cache",
-                "priority": "u=1, i",
-                "referer": "https://movie.douban.com/explore",
-                "sec-ch-ua": '"Google Chrome";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
-                "sec-ch-ua-mobile": "?0",
-                "sec-ch-ua-platform": '"Windows"',
-                "sec-fetch-dest": "empty",
-                "sec-fetch-mode": "cors",
-                "sec-fetch-site": "same-site",
-            }
-        )
+        headers.update(API_HEADER_PROFILE)
 
         return headers
 
@@ -347,19 +381,19 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
         except Exception as error:
             raise error
 
-    def __extract_release_date(self, response: scrapy.http.Response) -> t.Optional[datetime.date]:
+    def __extract_release_date(self, section: "MovieInfoSectionStructure") -> t.Optional[datetime.date]:
         """
         提取电影上映日期 (依次尝试多个日期，直到解析成功)
 
-        :param response: 页面响应
-        :type response: scrapy.http.Response
+        :param section: div#info 区块数据
+        :type section: MovieInfoSectionStructure
         :return: 上映日期
         :rtype: datetime.date
         """
         self.Log.info("提取电影上映日期")
 
         # 获取所有上映日期文本
-        date_texts = response.css("""span[property="v:initialReleaseDate"]::text""").getall()
+        date_texts = section.release_dates
         self.Log.info(f"提取到所有上映日期: {date_texts}")
 
         if not date_texts:
@@ -427,124 +461,6 @@ class DoubanMovieSpider(DoubanMovieSpiderBase):
             self.Log.error(f"解析电影评��失败: {err}")
             raise err
 
-    def __extract_directors(self, response: scrapy.http.Response) -> t.List[t.Dict[str, str]]:
-        """
-        获取导演列表 (返回包含artist_id和name的字典列表)
-
-        :param response: 页面响应
-        :type response: scrapy.http.Response
-        :return: 导演列表
-        :rtype: list
-        """
-        self.Log.info("提取导演列表")
-        writers = []
-
-        directors = response.css("""#info a[rel="v:directedBy"]::text""").getall()
-        urls = response.css("""#info a[rel="v:directedBy"]::attr(href)""").getall()
-        for director, url in zip(directors, urls):
-            artist_id = url.strip("/").split("/")[-1] if url else None
-            writers.append(
-                {
-                    "artist_id": artist_id,
-                    "name": director.strip(),
-                }
-            )
-
-        self.Log.info(f"提取导演: {len(writers)} 人")
-        return writers
-
-    def __extract_writers(self, response: scrapy.http.Response) -> t.List[t.Dict[str, str]]:
-        """
-        提取编剧列表
-
-        :param response:  页面响应
-        : type response: scrapy.http.Response
-        :return: 编剧列表
-        :rtype: list
-        """
-        self.Log.info("提取编剧列表")
-        writers = []
-
-        writer_section = response.xpath('//div[@id="info"]//span[@class="pl" and contains(text(), "编剧")]/following-sibling::span[@class="attrs"][1]')
-
-        if writer_section:
-            writer_elements = writer_section.css("a")
-
-            for elem in writer_elements:
-                name = elem.css("::text").get()
-                url = elem.css("::attr(href)").get()
-
-                artist_id = url.strip("/").split("/")[-1] if url else None
-                writers.append(
-                    {
-                        "artist_id": artist_id,
-                        "name": name.strip() if name else name,
-                    }
-                )
-
-        self.Log.info(f"提取编剧: {len(writers)} 人")
-        return writers
-
-    def __extract_actors(self, response: scrapy.http.Response) -> t.List[t.Dict[str, str]]:
-        """
-        提取演员列表
-
-        :param response: 页面响应
-        :type response: scrapy.http.Response
-        :return: 演员列表
-        :rtype: list
-        """
-        self.Log.info("提取演员列表")
-        actors = []
-
-        actor_names = response.css("""#info a[rel="v:starring"]::text""").getall()
-        actor_urls = response.css("""#info a[rel="v:starring"]::attr(href)""").getall()
-
-        for name, url in zip(actor_names, actor_urls):
-            artist_id = url.strip("/").split("/")[-1] if url else None
-            actors.append(
-                {
-                    "artist_id": artist_id,
-                    "name": name.strip(),
-                }
-            )
-
-        self.Log.info(f"提取演员: {len(actors)} 人")
-        return actors
-
-    def __extract_types(self, response: scrapy.http.Response) -> t.List[str]:
-        """
-        提取电影类型
-
-        :param response: 页面响应
-        :type response: scrapy.http.Response
-        :return: 电影类型列表
-        :rtype: list
-        """
-        self.Log.info("提取电影类型")
-        return response.css('span[property="v:genre"]::text').getall()
-
-    def __extract_countries(self, response: scrapy.http.Response) -> t.List[str]:
-        """
-        提取电影国家/地区
-
-        :param response: 页面响应
-        :type response: scrapy.http.Response
-        :return: 国家/地区列表
-        :rtype: list
-        """
-        self.Log.info("提取电影国家/地区")
-        countries = []
-        info_section = response.css("div#info")
-        info_text = info_section.css("::text").getall()
-        for i, text in enumerate(info_text):
-            if "制片国家" in text or "地区" in text:
-                if i + 1 < len(info_text):
-                    country_text = info_text[i + 1].strip()
-                    countries = [c.strip() for c in country_text.split("/") if c.strip()]
-                break
-        return countries
-
     def __extract_summary(self, response: scrapy.http.Response) -> str:
         """
         提取电影简介
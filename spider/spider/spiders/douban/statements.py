@@ -0,0 +1,188 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-17 02:21:37 UTC+08:00
+"""
+
+import re
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+import psycopg2
+import psycopg2.errors
+from fairylandlogger import LogManager, Logger
+
+from spider.spiders.douban.utils import DoubanUtils
+
+if t.TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection, cursor as Cursor
+
+
+@dataclass(frozen=False)
+class PreparedStatement:
+    """服务端预备语句"""
+
+    name: str
+    # 清理空白后的原始语句, 以 %(name)s 表示参数
+    query: str
+    # 参数名, 按 $1, $2 ... 的顺序
+    params: t.Tuple[str, ...] = ()
+    prepare_query: str = ""
+    execute_query: str = ""
+
+    # 复用已准备语句的次数、在连接上准备的次数、执行失败次数以及累计执行耗时 (秒)
+    hits: int = 0
+    prepares: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def calls(self) -> int:
+        return self.hits + self.prepares
+
+    def stats(self) -> t.Dict[str, t.Union[int, float]]:
+        with self.lock:
+            calls = self.hits + self.prepares
+            return {
+                "calls": calls,
+                "hits": self.hits,
+                "prepares": self.prepares,
+                "errors": self.errors,
+                "elapsed": self.elapsed,
+                "average": self.elapsed / calls if calls else 0.0,
+            }
+
+
+class StatementRegistry:
+    """
+    预备语句注册表
+
+    DAO 的语句在导入时注册一次: 清理空白, 将 %(name)s 参数改写为 $n, 生成 PREPARE / EXECUTE 语句. 每个连接首次执行某条
+    语句时先 PREPARE, 之后只发送 EXECUTE 和参数, 服务端不再重复解析和生成执行计划. 连接被丢弃后, 新连接会重新 PREPARE.
+    预备语句属于会话, 不能经过事务级连接池 (如 PgBouncer transaction 模式).
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-statements", "douban")
+
+    PARAM_PATTERN: t.ClassVar["re.Pattern"] = re.compile(r"%\((\w+)\)s")
+
+    def __init__(self):
+        self.statements: t.Dict[str, "PreparedStatement"] = {}
+        # 连接 id -> 已在该连接上准备的语句名, 连接被丢弃时由 forget 移除
+        self.prepared: t.Dict[int, t.Set[str]] = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, query: str) -> "PreparedStatement":
+        """
+        注册语句
+
+        :param name: 语句名, 在会话中唯一
+        :type name: str
+        :param query: 语句, 以 %(name)s 表示参数; 出现在查询列表等无法推断类型的位置的参数需要显式转换类型
+        :type query: str
+        :return: 预备语句
+        :rtype: PreparedStatement
+        """
+        query = DoubanUtils.query_sql_clean(query).rstrip(";")
+        params: t.List[str] = []
+
+        def placeholder(match: "re.Match") -> str:
+            if match.group(1) not in params:
+                params.append(match.group(1))
+            return f"${params.index(match.group(1)) + 1}"
+
+        body = self.PARAM_PATTERN.sub(placeholder, query)
+        arguments = f" ({', '.join(f'%({param})s' for param in params)})" if params else ""
+        statement = PreparedStatement(
+            name=name,
+            query=query,
+            params=tuple(params),
+            prepare_query=f"prepare {name} as {body}",
+            execute_query=f"execute {name}{arguments}",
+        )
+
+        with self.lock:
+            registered = self.statements.get(name)
+            if registered is not None and registered.query != query:
+                raise ValueError(f"语句名 {name} 已注册为其他语句")
+            self.statements[name] = registered or statement
+            return self.statements[name]
+
+    def __prepared_on(self, connection: "Connection") -> t.Set[str]:
+        with self.lock:
+            return self.prepared.setdefault(id(connection), set())
+
+    def forget(self, connection_id: int) -> None:
+        """
+        移除已丢弃连接上准备的语句记录, 同一 id 的新连接会重新 PREPARE
+
+        :param connection_id: 连接的 id
+        :type connection_id: int
+        """
+        with self.lock:
+            self.prepared.pop(connection_id, None)
+
+    def execute(self, cursor: "Cursor", statement: "PreparedStatement", params: t.Optional[t.Mapping[str, t.Any]] = None) -> None:
+        """
+        在游标上执行预备语句, 连接上尚未准备时先 PREPARE
+
+        :param cursor: 游标
+        :type cursor: cursor
+        :param statement: 预备语句
+        :type statement: PreparedStatement
+        :param params: 参数
+        :type params: dict
+        """
+        prepared = self.__prepared_on(cursor.connection)
+        begin = time.perf_counter()
+        hit = statement.name in prepared
+        try:
+            if not hit:
+                cursor.execute(statement.prepare_query)
+                prepared.add(statement.name)
+            cursor.execute(statement.execute_query, {param: (params or {}).get(param) for param in statement.params} or None)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # 服务端已没有该语句 (如会话被重置), 下次重新准备
+            prepared.discard(statement.name)
+            self.__record(statement, hit, begin, error=True)
+            raise
+        except Exception:
+            self.__record(statement, hit, begin, error=True)
+            raise
+        self.__record(statement, hit, begin)
+
+    @staticmethod
+    def __record(statement: "PreparedStatement", hit: bool, begin: float, error: bool = False) -> None:
+        with statement.lock:
+            if hit:
+                statement.hits += 1
+            else:
+                statement.prepares += 1
+            statement.errors += int(error)
+            statement.elapsed += time.perf_counter() - begin
+
+    def stats(self) -> t.Dict[str, t.Dict[str, t.Union[int, float]]]:
+        """
+        每条语句的执行统计
+
+        :return: 语句名 -> 调用次数、复用次数、准备次数、失败次数、累计耗时、平均耗时
+        :rtype: dict
+        """
+        return {name: statement.stats() for name, statement in self.statements.items() if statement.calls}
+
+    def log_stats(self) -> None:
+        for name, stats in sorted(self.stats().items(), key=lambda pair: -pair[1].get("elapsed")):
+            self.Log.info(
+                f"预备语句 {name}: 调用 {stats.get('calls')} 次, 复用 {stats.get('hits')} 次, 准备 {stats.get('prepares')} 次, "
+                f"失败 {stats.get('errors')} 次, 平均 {stats.get('average') * 1000:.2f} 毫秒"
+            )
+
+
+# DAO 层共用的语句注册表
+DoubanStatements: "StatementRegistry" = StatementRegistry()
@@ -48,3 +48,21 @@ class MovieArtistStructure(BaseFrozenStructure):
 
     artist_id: str
     name: str
+
+
+@dataclass(frozen=False)
+class MovieInfoSectionStructure(BaseStructure):
+    """豆瓣电影详情页 div#info 区块数据结构"""
+
+    directors: t.List[t.Dict[str, str]] = field(default_factory=list)
+    writers: t.List[t.Dict[str, str]] = field(default_factory=list)
+    actors: t.List[t.Dict[str, str]] = field(default_factory=list)
+    types: t.List[str] = field(default_factory=list)
+    countries: t.List[str] = field(default_factory=list)
+    languages: t.List[str] = field(default_factory=list)
+    release_dates: t.List[str] = field(default_factory=list)
+    runtime: str = ""
+    aliases: t.List[str] = field(default_factory=list)
+    imdb: str = ""
+    # 未识别的标签: 标签名 -> 文本值列表
+    extras: t.Dict[str, t.List[str]] = field(default_factory=dict)
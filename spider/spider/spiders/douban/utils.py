@@ -7,8 +7,10 @@
 @datetime: 2025-12-24 20:15:47 UTC+08:00
 """
 
+import itertools
 import typing as t
 from http.cookies import SimpleCookie
+from pathlib import Path
 
 import requests
 from fairylandlogger import Logger, LogManager
@@ -39,6 +41,30 @@ class DoubanUtils:
             cls.logger.error(f"加载 Cookie 失败: {error}")
             raise error
 
+    @classmethod
+    def load_cookies_from_dir(cls, dir_path: t.Union[str, Path]) -> t.Dict[str, dict]:
+        """
+        从目录加载多份 Cookie, 每个 *.cookies 文件对应一个身份
+
+        :param dir_path: Cookie 目录
+        :type dir_path: str | Path
+        :return: 身份名(文件名) -> Cookie 字典
+        :rtype: dict
+        """
+        directory = Path(dir_path)
+        if not directory.is_dir():
+            return {}
+
+        jars: t.Dict[str, dict] = {}
+        for file_path in sorted(directory.glob("*.cookies")):
+            cookies = cls.load_cookies_from_file(str(file_path))
+            if not cookies:
+                cls.logger.warning(f"Cookie 文件为空, 跳过: {file_path}")
+                continue
+            jars[file_path.stem] = cookies
+
+        return jars
+
     @classmethod
     def query_sql_clean(cls, query: str) -> str:
         """
@@ -51,6 +77,22 @@ class DoubanUtils:
         """
         return " ".join(query.split())
 
+    @classmethod
+    def batched(cls, iterable: t.Iterable[t.Any], size: int) -> t.Iterator[t.List[t.Any]]:
+        """
+        按固定大小分批, 最后一批可能不足 size 个
+
+        :param iterable: 可迭代对象
+        :type iterable: Iterable
+        :param size: 每批数量
+        :type size: int
+        :return: 批次生成器
+        :rtype: Iterator[list]
+        """
+        iterator = iter(iterable)
+        while batch := list(itertools.islice(iterator, size)):
+            yield batch
+
     @classmethod
     def check_id_in_cache(cls, movie_id: str, cache_data: t.Set[str]):
         return movie_id in cache_data
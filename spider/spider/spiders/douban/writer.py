@@ -0,0 +1,115 @@
+# coding: UTF-8
+"""
+@software: PyCharm
+@author: Lionel Johnson
+@contact: https://fairy.host
+@organization: https://github.com/FairylandFuture
+@datetime: 2026-10-17 01:38:25 UTC+08:00
+"""
+
+import typing as t
+
+from fairylandlogger import LogManager, Logger
+from twisted.internet import defer, threads
+from twisted.internet.defer import Deferred, DeferredList, DeferredSemaphore
+from twisted.python.threadpool import ThreadPool
+
+
+class DatabaseWriter:
+    """
+    在独立线程池中执行阻塞的数据库写入, 返回 Deferred, 不占用 Twisted reactor 线程
+
+    同时执行的写入不超过 max_pending 个, 超出的写入排队等待; Pipeline 返回的 Deferred 未完成时 Scrapy 不会释放对应的响应,
+    爬虫处理中的响应达到 SCRAPER_SLOT_MAX_ACTIVE_SIZE 后引擎暂停下载, 数据库变慢时由此向引擎施加背压.
+    reactor 未运行 (离线脚本) 或 threads 为 0 时在调用线程中同步执行, 返回已完成的 Deferred.
+
+    :param threads: 写入线程数, 不应超过数据库连接池保留的空闲连接数 (pool_min)
+    :type threads: int
+    :param max_pending: 最多同时执行的写入数量
+    :type max_pending: int
+    """
+
+    Log: t.ClassVar["Logger"] = LogManager.get_logger("douban-db-writer", "douban")
+
+    def __init__(self, threads: int = 4, max_pending: int = 64):
+        self.threads = threads
+        self.max_pending = max_pending
+
+        self.pool: t.Optional["ThreadPool"] = None
+        self.semaphore = DeferredSemaphore(max(max_pending, 1))
+        # 未完成的写入, 关闭时等待全部完成
+        self.pending: t.Set["Deferred"] = set()
+
+        self.submitted = 0
+        self.failed = 0
+
+    @property
+    def inline(self) -> bool:
+        return self.pool is None
+
+    @property
+    def waiting(self) -> int:
+        """等待执行的写入数量"""
+        return len(self.semaphore.waiting)
+
+    def start(self) -> None:
+        from twisted.internet import reactor
+
+        if self.pool is not None or self.threads <= 0 or not reactor.running:
+            return
+        self.pool = ThreadPool(minthreads=1, maxthreads=self.threads, name="douban-db-writer")
+        self.pool.start()
+        self.Log.info(f"启动数据库写入线程池: {self.threads} 个线程, 最多同时执行 {self.max_pending} 个写入")
+
+    def submit(self, function: t.Callable[..., t.Any], *args, **kwargs) -> "Deferred":
+        """
+        提交一个写入
+
+        :param function: 写入函数, 在写入线程中执行
+        :type function: callable
+        :return: 写入函数的返回值
+        :rtype: Deferred
+        """
+        self.submitted += 1
+        if self.pool is None:
+            return defer.maybeDeferred(function, *args, **kwargs).addErrback(self.__on_failure)
+
+        from twisted.internet import reactor
+
+        if self.semaphore.tokens == 0:
+            self.Log.debug(f"数据库写入已满 {self.max_pending} 个, 排队等待: {self.waiting + 1}")
+
+        deferred = self.semaphore.run(threads.deferToThreadPool, reactor, self.pool, function, *args, **kwargs)
+        deferred.addErrback(self.__on_failure)
+
+        # 单独的 Deferred 记录完成, 不影响调用方的回调链
+        done = Deferred()
+        self.pending.add(done)
+
+        def finish(result: t.Any) -> t.Any:
+            self.pending.discard(done)
+            done.callback(None)
+            return result
+
+        return deferred.addBoth(finish)
+
+    def __on_failure(self, failure):
+        self.failed += 1
+        return failure
+
+    def drain(self) -> "Deferred":
+        """
+        等待所有已提交的写入完成
+
+        :return: 全部完成时触发
+        :rtype: Deferred
+        """
+        if self.pending:
+            self.Log.info(f"等待 {len(self.pending)} 个数据库写入完成")
+        return DeferredList(list(self.pending))
+
+    def stop(self) -> None:
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+        self.Log.info(f"数据库写入: 共 {self.submitted} 个, 失败 {self.failed} 个")